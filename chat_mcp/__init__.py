@@ -1,10 +1,13 @@
 from .utils.get_logger import get_logger
 from .utils.get_project_root import get_project_root
 from .utils.create_completion import create_completion,create_stream_completion
+from .utils.llm_client_pool import get_llm_client, get_llm_client_metrics
 
 __all__ = [
     'get_logger',
     'get_project_root',
     'create_completion',
-    'create_stream_completion'
+    'create_stream_completion',
+    'get_llm_client',
+    'get_llm_client_metrics'
 ]
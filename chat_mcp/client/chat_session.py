@@ -0,0 +1,50 @@
+import time
+from typing import Dict, Any, List, Optional
+
+from chat_mcp.client.result_assessor import ResultAssessor
+from chat_mcp.utils.deadline import Deadline
+from chat_mcp.utils.llm_client_pool import get_llm_client
+
+
+class ChatSession:
+    """
+    单次聊天请求的执行上下文
+    保存服务商凭据、LLM客户端、执行计划、执行结果和评估器，避免并发请求之间互相覆盖
+    deadline: 请求的截止时间，各阶段从中取得时间预算
+    """
+    def __init__(self,
+                 api_key: str,
+                 base_url: str,
+                 model: str,
+                 user_query: str = "",
+                 temperature: float = 0.7,
+                 history_message: List[Dict[str, Any]] = None,
+                 assessment_policy: str = None,
+                 pipeline_mode: str = "staged",
+                 use_cache: bool = True,
+                 final_check_mode: str = "llm",
+                 deadline: Deadline = None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.user_query = user_query
+        self.temperature = temperature
+        self.history_message = history_message
+        self.pipeline_mode = pipeline_mode
+        self.use_cache = use_cache
+        self.final_check_mode = final_check_mode
+        self.deadline = deadline or Deadline()
+
+        self.llm_client = get_llm_client(api_key=api_key, base_url=base_url)
+        self.result_assessor = ResultAssessor(self.llm_client, model, policy=assessment_policy)
+
+        self.execution_plan = None
+        self.execution_results: Dict[str, Any] = {}
+
+        self.started_at = time.monotonic()
+        self.first_step_planned_at: Optional[float] = None
+        self.first_tool_at: Optional[float] = None
+
+    def record_result(self, step_id: str, success: bool, result: Any = None, error: str = None) -> None:
+        """记录步骤执行结果"""
+        self.execution_results[step_id] = {"success": success, "result": result, "error": error}
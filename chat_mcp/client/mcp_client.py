@@ -1,112 +1,65 @@
 import json
 import asyncio
 import os
-import re
+import time
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Dict, Any, List, Optional, Tuple
-
-from openai import OpenAI
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Set
 
 from chat_mcp.client.tool_execution import ToolExecutor
 from chat_mcp.client.tool_manager import ToolManager
-from chat_mcp.client.result_assessor import ResultAssessor
+from chat_mcp.client.tool_result import ToolResult
+from chat_mcp.client.chat_session import ChatSession
+from chat_mcp.client.step_scheduler import StepScheduler
+from chat_mcp.client.polling import PollBackoff, PollTimer, ProgressTracker
 from chat_mcp.error.tool_error import ToolExecutionError
 from chat_mcp.utils.create_completion import create_completion,create_stream_completion
 from chat_mcp.utils.get_logger import get_logger
-from config.config import MAX_ITERATIONS
+from chat_mcp.utils.metrics import record_latency
+from chat_mcp.utils.json_stream import IncrementalArrayParser, JsonValueScanner, extract_json
+from chat_mcp.utils.poll_condition import evaluate_completion, Verdict, FAILED as POLL_FAILED
+from chat_mcp.utils.placeholder import resolve_references, has_semantic_placeholders, referenced_step_ids, result_to_text
+from chat_mcp.utils.prompt_builder import PromptBuilder
+from chat_mcp.utils.content_screen import screen_text, incomplete_reason
+from chat_mcp.utils.deadline import Deadline
+from chat_mcp.utils.journal import JournalWriter, ExecutionJournal, JOURNAL_SUFFIX, journal_file_name, read_journal, cleanup_journals
+from chat_mcp.utils.stream_window import SlidingWindowBuffer
+from chat_mcp.utils.stream_event import StreamEvent
+from chat_mcp.utils.think_filter import ThinkTagFilter, strip_think, filter_stream
+from chat_mcp.utils.llm_client_pool import get_llm_client
+from config.config import (
+    MAX_ITERATIONS,
+    PIPELINE_MODE,
+    EXECUTION_ENGINE,
+    PLAN_STREAMING,
+    SIDE_EFFECT_TOOLS,
+    FINAL_CHECK_MODE,
+    FINAL_CHECK_STREAM_WINDOW,
+    FINAL_CHECK_STREAM_CHUNK,
+    FINAL_CHECK_STREAM_RATE,
+    FINAL_CHECK_STREAM_MAX_UNMODERATED,
+    FINAL_CHECK_MODERATION_TIMEOUT,
+    PROMPT_RESULTS_TOKENS,
+    HIDE_REASONING,
+    DEADLINE_MIN_FINAL_CHECK,
+    JOURNAL_CLEANUP_INTERVAL
+)
 
 logger = get_logger("MCPClient")
 
-def extract_json_from_llm_response(content: str) -> Dict[str, Any]:
+# 工具返回 isError 结果时错误信息的前缀，前端据此区分工具错误和执行异常
+TOOL_ERROR_PREFIX = "工具返回错误"
+
+def extract_json_from_llm_response(content: str) -> Any:
     """
-    从LLM响应中提取JSON内容
+    从LLM响应中提取JSON内容，找不到时返回空字典
     """
-    if not content:
+    value = extract_json(content)
+    if value is None:
+        if content:
+            logger.warning(f"无法从响应中提取JSON: {content}")
         return {}
-    
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        pass
-
-    code_block_pattern = r'```(?:json)?\s*([\s\S]*?)```'
-    code_match = re.search(code_block_pattern, content)
-    if code_match:
-        try:
-            json_str = code_match.group(1).strip()
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
-    
-    json_object_pattern = r'({[\s\S]*})'
-    match = re.search(json_object_pattern, content)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except json.JSONDecodeError:
-            pass
-    
-    try:
-        json_pattern = r'{\s*"([^"]+)"\s*:\s*"([^"]+)"\s*,\s*"([^"]+)"\s*:\s*"([\s\S]*?)"\s*}'
-        full_match = re.search(json_pattern, content)
-        
-        if full_match:
-            key1, value1, key2, value2 = full_match.groups()
-            result = {}
-            result[key1] = value1
-            result[key2] = value2
-            return result
-    except Exception as e:
-        logger.warning(f"特殊处理JSON也失败: {str(e)}")
-    
-    logger.warning(f"无法从响应中提取JSON: {content}")
-    return {}
-
-async def filter_stream(stream_generator):
-    in_think_block = False
-    buffer = ""
-    think_detected = False
-    
-    async for chunk in stream_generator:
-        if hasattr(chunk, 'choices') and chunk.choices:
-            if hasattr(chunk.choices[0], 'delta') and hasattr(chunk.choices[0].delta, 'content'):
-                chunk_text = chunk.choices[0].delta.content or ""
-            else:
-                chunk_text = ""
-        else:
-            try:
-                chunk_text = str(chunk)
-            except:
-                chunk_text = ""
-        
-        buffer += chunk_text
-        
-        if "<think>" in buffer and not in_think_block:
-            think_detected = True
-            in_think_block = True
-            buffer = ""
-            continue
-        
-        if "</think>" in buffer and in_think_block:
-            post_think_content = buffer.split("</think>", 1)[1]
-            buffer = post_think_content
-            in_think_block = False
-            
-            if buffer:
-                yield buffer
-                buffer = ""
-            continue
-            
-        if not in_think_block and not think_detected:
-            yield chunk_text
-            buffer = ""
-        
-        if in_think_block:
-            continue
-            
-        if not in_think_block and think_detected and buffer:
-            yield buffer
-            buffer = ""
+    return value
 
 class ExecutionStep:
     def __init__(self, 
@@ -118,7 +71,8 @@ class ExecutionStep:
                  parallel_group: str = None,
                  polling_required: bool = False,
                  polling_interval: int = 5,
-                 polling_condition: str = ""):
+                 polling_condition: str = "",
+                 side_effect_only: bool = False):
         self.step_id = step_id
         self.tool_name = tool_name
         self.tool_args = tool_args
@@ -136,6 +90,8 @@ class ExecutionStep:
         self.polling_interval = polling_interval
         self.polling_condition = polling_condition
         self.polling_iteration = 0
+        self.polling_incomplete = False
+        self.side_effect_only = side_effect_only
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -147,14 +103,16 @@ class ExecutionStep:
             "parallel_group": self.parallel_group,
             "executed": self.executed,
             "success": self.success,
-            "result": self.result,
+            "result": self.result.to_dict() if isinstance(self.result, ToolResult) else self.result,
             "error": self.error,
             "start_time": self.start_time,
             "end_time": self.end_time,
             "polling_required": self.polling_required,
             "polling_interval": self.polling_interval,
             "polling_condition": self.polling_condition,
-            "polling_iteration": self.polling_iteration
+            "polling_iteration": self.polling_iteration,
+            "polling_incomplete": self.polling_incomplete,
+            "side_effect_only": self.side_effect_only
         }
     
     @classmethod
@@ -169,15 +127,17 @@ class ExecutionStep:
             parallel_group=data.get("parallel_group"),
             polling_required=data.get("polling_required", False),
             polling_interval=data.get("polling_interval", 5),
-            polling_condition=data.get("polling_condition", "")
+            polling_condition=data.get("polling_condition", ""),
+            side_effect_only=data.get("side_effect_only", False)
         )
         step.executed = data.get("executed", False)
         step.success = data.get("success")
-        step.result = data.get("result")
+        step.result = ToolResult.from_dict(data["result"]) if ToolResult.is_serialized(data.get("result")) else data.get("result")
         step.error = data.get("error")
         step.start_time = data.get("start_time")
         step.end_time = data.get("end_time")
         step.polling_iteration = data.get("polling_iteration", 0)
+        step.polling_incomplete = data.get("polling_incomplete", False)
         return step
 
 class ExecutionPlan:
@@ -188,6 +148,9 @@ class ExecutionPlan:
         self.parallel_groups: Dict[str, List[str]] = {}
         self.creation_time = datetime.now().isoformat()
         self.completed = False
+        # 计划是否已完整生成，流式规划结束前为False
+        self.planned = True
+        self.journal: Optional[ExecutionJournal] = None
     
     def add_step(self, step: ExecutionStep) -> None:
         self.steps[step.step_id] = step
@@ -196,6 +159,9 @@ class ExecutionPlan:
             if step.parallel_group not in self.parallel_groups:
                 self.parallel_groups[step.parallel_group] = []
             self.parallel_groups[step.parallel_group].append(step.step_id)
+
+        if self.journal:
+            self.journal.append("step", step=step.to_dict())
     
     def get_ready_steps(self) -> List[ExecutionStep]:
         """获取执行的步骤"""
@@ -239,9 +205,116 @@ class ExecutionPlan:
             step.result = result
             step.error = error
             step.end_time = datetime.now().isoformat()
+            if self.journal:
+                self._journal_result(step)
+
+    def mark_planned(self) -> None:
+        """计划生成结束，写入 plan_complete 记录，恢复时据此判断计划是否完整"""
+        self.planned = True
+        if self.journal:
+            self.journal.append("plan_complete")
+
+    def _journal_result(self, step: ExecutionStep) -> None:
+        self.journal.append(
+            "result",
+            step_id=step.step_id,
+            success=step.success,
+            result=step.result.to_dict() if isinstance(step.result, ToolResult) else step.result,
+            error=step.error,
+            tool_args=step.tool_args,
+            start_time=step.start_time,
+            end_time=step.end_time,
+            polling_iteration=step.polling_iteration,
+            polling_incomplete=step.polling_incomplete
+        )
+
+    def attach_journal(self, journal: ExecutionJournal, resumed: bool = False) -> None:
+        """
+        之后的步骤追加和执行结果写入执行日志
+        resumed 表示计划就是从这个日志恢复的，只追加一条恢复记录，否则先写入计划和已有的步骤、结果
+        """
+        self.journal = journal
+        if resumed:
+            journal.append("resume")
+            return
+        journal.append("plan", user_query=self.user_query, creation_time=self.creation_time)
+        for step in self.steps.values():
+            journal.append("step", step=step.to_dict())
+        if self.planned:
+            journal.append("plan_complete")
+        for step in self.steps.values():
+            if step.executed:
+                self._journal_result(step)
+
+    @classmethod
+    def from_journal(cls, records: List[Dict[str, Any]]) -> 'ExecutionPlan':
+        """
+        按执行日志重放执行计划
+        只恢复成功步骤的结果，失败和中断时未完成的步骤保持未执行，恢复后重新执行
+        没有 plan_complete 记录时计划不完整(规划过程中断)，planned 为False
+        """
+        plan = None
+        for record in records:
+            event = record.get("event")
+            if event == "plan":
+                plan = cls(record.get("user_query", ""))
+                plan.creation_time = record.get("creation_time", plan.creation_time)
+                plan.planned = False
+            elif plan is None:
+                continue
+            elif event == "step":
+                step = ExecutionStep.from_dict(record["step"])
+                if step.step_id not in plan.steps:
+                    plan.add_step(step)
+            elif event == "result":
+                step = plan.steps.get(record.get("step_id"))
+                if step is None:
+                    continue
+                if record.get("success"):
+                    result = record.get("result")
+                    step.executed = True
+                    step.success = True
+                    step.result = ToolResult.from_dict(result) if ToolResult.is_serialized(result) else result
+                    step.error = None
+                    step.tool_args = record.get("tool_args", step.tool_args)
+                    step.start_time = record.get("start_time")
+                    step.end_time = record.get("end_time")
+                    step.polling_iteration = record.get("polling_iteration", 0)
+                    step.polling_incomplete = record.get("polling_incomplete", False)
+                elif not step.success:
+                    step.executed = False
+                    step.success = None
+                    step.error = record.get("error")
+            elif event == "plan_complete":
+                plan.planned = True
+            elif event == "completed":
+                plan.completed = record.get("completed", False)
+
+        if plan is None:
+            raise ValueError("执行日志中没有执行计划记录")
+        return plan
     
     def is_completed(self) -> bool:
         return all(step.executed for step in self.steps.values())
+
+    def get_dependency_closure(self, step_ids: Iterable[str]) -> Set[str]:
+        """获取步骤直接和间接依赖的所有步骤ID(不含步骤自身，除非存在循环)"""
+        closure = set()
+        stack = list(step_ids)
+        while stack:
+            step = self.steps.get(stack.pop())
+            if not step:
+                continue
+            for dep in step.depends_on:
+                if dep not in closure:
+                    closure.add(dep)
+                    stack.append(dep)
+        return closure
+
+    def get_sink_steps(self) -> List[str]:
+        """获取没有被其他步骤依赖的步骤ID，即执行链的最后一步"""
+        depended = {dep for step in self.steps.values() for dep in step.depends_on}
+        return [step_id for step_id in self.steps if step_id not in depended]
     
     def get_execution_results(self) -> Dict[str, Any]:
         """获取所有执行结果"""
@@ -376,7 +449,6 @@ class MCPClient:
         self.api_key = api_key
         self.base_url = base_url
         self.server_config_path = server_config_path
-        self.llm_client = None
         self.max_tool_calls = max_tool_calls
         self.tool_execution_timeout = tool_execution_timeout
         self.similarity_threshold = similarity_threshold
@@ -386,7 +458,10 @@ class MCPClient:
 
         self.tool_manager = None
         self.tool_executor = None
-        self.result_assessor = None
+        self.poll_timer = PollTimer()
+        self.journal_writer = JournalWriter()
+        self._last_journal_cleanup = None
+        self._journal_cleanup_task: Optional[asyncio.Task] = None
         
         os.makedirs(self.log_dir, exist_ok=True)
 
@@ -436,27 +511,45 @@ class MCPClient:
                             api_key=None,
                             base_url=None,
                             model=None,
-                            plan_file=None):
+                            plan_file=None,
+                            assessment_policy=None,
+                            pipeline_mode=None,
+                            engine=None,
+                            use_cache=True,
+                            final_check_mode=None,
+                            request_timeout=None):
         """
-        处理用户查询
+        处理用户查询，每次调用使用独立的 ChatSession，可安全并发
+        request_timeout: 请求的总时间预算(秒)，未指定时工具路由、规划和执行使用 REQUEST_TIMEOUT，直接回答不限制，不超过 REQUEST_TIMEOUT_MAX
+        plan_file: 执行日志(.jsonl)或旧格式的计划文件(.json)，文件存在时从中恢复工作流，已成功的步骤不会重新执行
         """
         if not self.tool_manager or not self.tool_manager.all_tools:
             raise RuntimeError("客户端未初始化，请先调用 initialize()")
         
-        self.api_key = api_key if api_key is not None else self.api_key
-        self.base_url = base_url if base_url is not None else self.base_url
-        self.model = model if model is not None else self.model
+        api_key = api_key if api_key is not None else self.api_key
+        base_url = base_url if base_url is not None else self.base_url
+        model = model if model is not None else self.model
 
-        if not self.api_key or not self.base_url or not self.model:
+        if not api_key or not base_url or not model:
             error_msg = "错误: API密钥、基础URL或模型名称未设置"
             logger.error(error_msg)
-            yield error_msg
+            yield StreamEvent(StreamEvent.ERROR, error_msg)
             return
 
         try:
-            self.llm_client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-            
-            self.result_assessor = ResultAssessor(self.llm_client, self.model)
+            session = ChatSession(
+                api_key=api_key,
+                base_url=base_url,
+                model=model,
+                user_query=user_query,
+                temperature=temperature,
+                history_message=history_message,
+                assessment_policy=assessment_policy,
+                pipeline_mode=pipeline_mode or PIPELINE_MODE,
+                use_cache=use_cache,
+                final_check_mode=final_check_mode or FINAL_CHECK_MODE,
+                deadline=Deadline.from_request(request_timeout)
+            )
             
             tool_list = []
             for tool in self.tool_manager.all_tools:
@@ -466,16 +559,33 @@ class MCPClient:
             
             tools_json = json.dumps(tool_list, ensure_ascii=False)
 
-            if str(system_prompt.startswith("# 工具调用助手")) == "True":
-                needs_tools = await self._check_if_needs_tools(user_query)
+            if str(system_prompt.startswith("# 工具调用助手")) == "True" and (engine or EXECUTION_ENGINE) == "function_calling":
+                async for chunk in self._execute_function_calling(
+                    session=session,
+                    user_query=user_query,
+                    temperature=temperature,
+                    history_message=history_message
+                ):
+                    yield chunk
+            elif str(system_prompt.startswith("# 工具调用助手")) == "True":
+                needs_tools, execution_plan = None, None
+                if session.pipeline_mode == "fused" and not plan_file:
+                    needs_tools, execution_plan = await self._within_budget(
+                        session, self._create_fused_plan(session, user_query, history_message), (None, None), "工具调度")
+
+                if needs_tools is None:
+                    needs_tools = await self._within_budget(
+                        session, self._check_if_needs_tools(session, user_query), False, "工具需求判断")
                 
                 if needs_tools:
                     async for chunk in self._execute_workflow(
+                        session=session,
                         user_query=user_query,
                         temperature=temperature,
                         history_message=history_message,
                         plan_file=plan_file,
-                        tools_json=tools_json
+                        tools_json=tools_json,
+                        execution_plan=execution_plan
                     ):
                         yield chunk
                 else:
@@ -485,37 +595,57 @@ class MCPClient:
                         messages.extend(history_message)
                     messages.append({"role": "user", "content": user_query})
                     
-                    stream_generator = await create_stream_completion(
-                        llm_client=self.llm_client,
+                    # 默认时间预算只用于工具路由，直接回答只受客户端指定的时间预算限制
+                    answer_deadline = session.deadline.for_answer()
+                    stream_generator = await answer_deadline.within(create_stream_completion(
+                        llm_client=session.llm_client,
                         logger=logger,
-                        model=self.model,
+                        model=session.model,
                         messages=messages,
                         temperature=temperature
-                    )
-                    async for chunk in stream_generator:
-                        yield chunk
+                    ))
+                    try:
+                        async for chunk in answer_deadline.iterate(filter_stream(stream_generator) if HIDE_REASONING else stream_generator):
+                            yield chunk
+                    finally:
+                        await stream_generator.aclose()
             else:
                 messages = [{"role": "system", "content": system_prompt}]
                 if history_message:
                     messages.extend(history_message)
                 messages.append({"role": "user", "content": user_query})
                 
-                stream_generator = await create_stream_completion(
-                    llm_client=self.llm_client,
+                answer_deadline = session.deadline.for_answer()
+                stream_generator = await answer_deadline.within(create_stream_completion(
+                    llm_client=session.llm_client,
                     logger=logger,
-                    model=self.model,
+                    model=session.model,
                     messages=messages,
                     temperature=temperature
-                )
-                async for chunk in stream_generator:
+                ))
+                try:
+                    async for chunk in answer_deadline.iterate(filter_stream(stream_generator) if HIDE_REASONING else stream_generator):
                         yield chunk
+                finally:
+                    await stream_generator.aclose()
 
+        except TimeoutError:
+            logger.warning(f"请求超出时间预算({session.deadline.timeout}秒)，已停止输出")
+            yield StreamEvent(StreamEvent.ERROR, "\n\n请求超出时间预算，回答已截断")
         except Exception as e:
             error_msg = f"处理查询出错: {str(e)}"
             logger.error(error_msg, exc_info=True)
-            yield error_msg
+            yield StreamEvent(StreamEvent.ERROR, error_msg)
 
-    async def _check_if_needs_tools(self, user_query: str) -> bool:
+    async def _within_budget(self, session: ChatSession, awaitable, fallback, stage: str):
+        """在请求剩余时间内执行一个阶段(为最终回答保留时间)，超出预算时取消该阶段并返回 fallback"""
+        try:
+            return await session.deadline.within(awaitable, reserve=session.deadline.answer_reserve)
+        except TimeoutError:
+            logger.warning(f"{stage}超出请求时间预算，剩余 {session.deadline.remaining():.1f} 秒，按降级结果继续")
+            return fallback
+
+    async def _check_if_needs_tools(self, session: ChatSession, user_query: str) -> bool:
         """使用LLM判断是否需要工具调用"""
         prompt = f"""分析以下用户问题，判断是否需要使用外部工具或API来回答。
 
@@ -539,12 +669,9 @@ class MCPClient:
     """
         
         try:
-            if not self.llm_client:
-                self.llm_client = OpenAI(api_key=self.api_key, base_url=self.base_url)
-            
             response = await create_completion(
-                llm_client=self.llm_client,
-                model=self.model,
+                llm_client=session.llm_client,
+                model=session.model,
                 logger=logger,
                 messages=[
                     {"role": "system", "content": "你是工具需求分析专家，能够准确判断问题是否需要外部工具"},
@@ -555,10 +682,7 @@ class MCPClient:
             
             content = response.choices[0].message.content.strip().lower()
 
-            think_pattern = re.compile(r'</think>(.*)', re.DOTALL)
-            match = think_pattern.search(content)
-            if match:
-                content = match.group(1).strip()
+            content = strip_think(content)
 
             if "需要" in content:
                 logger.info(f"LLM判断问题'{user_query}'需要工具调用")
@@ -570,7 +694,7 @@ class MCPClient:
             logger.error(f"LLM判断是否需要工具调用出错: {str(e)}")
             return False            
 
-    async def _filter_relevant_tools(self, user_query: str,tools_json) -> List[Dict[str, Any]]:
+    async def _filter_relevant_tools(self, session: ChatSession, user_query: str, tools_json) -> List[Dict[str, Any]]:
         """预筛选工具"""
 
         prompt = f"""分析用户查询，从提供的工具列表中选择最适合完成任务的工具。
@@ -601,8 +725,8 @@ class MCPClient:
         try:
 
             response = await create_completion(
-                llm_client=self.llm_client,
-                model=self.model,
+                llm_client=session.llm_client,
+                model=session.model,
                 logger=logger,
                 messages=[
                     {"role": "system", "content": "你是工具选择专家，能够根据用户需求筛选最合适的工具"},
@@ -612,10 +736,7 @@ class MCPClient:
             )
             
             content = response.choices[0].message.content
-            think_pattern = re.compile(r'</think>(.*)', re.DOTALL)
-            match = think_pattern.search(content)
-            if match:
-                content = match.group(1).strip()
+            content = strip_think(content)
 
             selected_tools = extract_json_from_llm_response(content)
             if not selected_tools or not isinstance(selected_tools, list):
@@ -639,47 +760,50 @@ class MCPClient:
             logger.error(f"筛选工具出错: {str(e)}", exc_info=True)
             return self.tool_manager.all_tools
 
-    async def _create_execution_plan(self, user_query: str,history_message: str,tools_json) -> ExecutionPlan:
+    async def _create_execution_plan(self, session: ChatSession, user_query: str, history_message: str, tools_json) -> ExecutionPlan:
         """
         使用LLM创建执行计划
         """
-        filtered_tools = await self._filter_relevant_tools(user_query,tools_json)
-        
-        tool_descriptions = []
-        for tool in filtered_tools:
-            tool_name = tool.get("name", "")
-            description = tool.get("description", "")
-            
-            parameters = {}
-            required = []
+        filtered_tools = await self._filter_relevant_tools(session, user_query, tools_json)
+        prompt = self._build_plan_prompt(user_query, history_message, self._build_tools_text(filtered_tools))
+
+        try:
+            response = await create_completion(
+                llm_client=session.llm_client,
+                model=session.model,
+                logger=logger,
+                messages=[
+                    {"role": "system", "content": "你是执行计划专家，擅长分析复杂任务并设计最优执行流程"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1
+            )
             
-            if "inputSchema" in tool:
-                parameters = tool["inputSchema"].get("properties", {})
-                required = tool["inputSchema"].get("required", [])
-            elif "function" in tool and "parameters" in tool["function"]:
-                parameters = tool["function"]["parameters"].get("properties", {})
-                required = tool["function"]["parameters"].get("required", [])
+            content = response.choices[0].message.content
+            content = strip_think(content)
+
+            logger.info(f"执行计划LLM响应: {content}")
             
-            param_descriptions = []
-            for param_name, param_info in parameters.items():
-                is_required = param_name in required
-                param_desc = param_info.get("description", "")
-                param_type = param_info.get("type", "")
-                param_descriptions.append(f"- {param_name} ({'必填' if is_required else '选填'}): {param_desc} (类型: {param_type})")
+            plan_data = extract_json_from_llm_response(content)
+            if not plan_data or "steps" not in plan_data:
+                logger.error(f"无法解析执行计划: {content}")
+                return ExecutionPlan(user_query)
             
-            tool_descriptions.append(
-                f"工具名称: {tool_name}\n"
-                f"描述: {description}\n"
-                f"参数:\n" + "\n".join(param_descriptions)
-            )
-        
-        tools_text = "\n\n".join(tool_descriptions)
-        
+            return self._build_plan_from_data(user_query, plan_data)
+        except Exception as e:
+            logger.error(f"创建执行计划出错: {str(e)}", exc_info=True)
+            return ExecutionPlan(user_query)
+
+    def _build_plan_prompt(self, user_query: str, history_message: str, tools_text: str) -> str:
+        """生成执行计划提示词"""
+        builder = PromptBuilder("plan")
+        history_text = builder.history(history_message)
+
         prompt = f"""分析用户查询，创建一个详细的执行计划，包括工具选择、参数设置和执行顺序。
 
     用户查询: {user_query}
 
-    用户的历史记录: {history_message}
+    用户的历史记录: {history_text}
 
     可用工具:
     {tools_text}
@@ -691,11 +815,15 @@ class MCPClient:
     4. 标记可以并行执行的操作
     5. 标记需要轮询的操作（对于那些可能需要多次查询才能获得最终结果的任务）
 
-    重要说明: 当一个步骤需要使用前一个步骤的结果时，请使用方括号占位符格式，例如 [占位符名称]。
-    例如: step_1查询了武汉天气，step_3需要发送这个信息，应设置 "message": "武汉的天气是: [武汉天气]"
+    重要说明: 当一个步骤需要使用前一个步骤的结果时，优先使用结构化引用，它会在本地直接替换:
+    - ${{step_1.result}}: step_1的完整结果文本，例如 "message": "武汉的天气是: ${{step_1.result}}"
+    - ${{step_1.result.data.items[0].name}}: 结果为JSON时按路径取值
+    - ${{step_1.result|regex:温度(\\d+)}}: 用正则从结果中提取，有捕获组时取第一个捕获组
+    只有需要理解、总结或改写前面步骤结果时，才使用方括号占位符，例如 "text": "[武汉天气的简要总结]"
 
     关于轮询操作:
     某些工具操作（如检查异步任务进度、查询长时间运行的任务状态等）可能需要多次执行直到获得最终结果。对于这类步骤，请设置 polling_required 为 true。
+    polling_condition 为结束条件，支持字段比较(如 status == completed、progress >= 100、data.state != running)、regex:正则、contains:文本，可用 && 和 || 组合；结果带有 status/state/progress 字段时可以留空。
 
     返回JSON格式:
     {{
@@ -711,7 +839,8 @@ class MCPClient:
         "parallel_group": "并行组标识符(可选)",
         "polling_required": false,
         "polling_interval": 5,
-        "polling_condition": ""
+        "polling_condition": "",
+        "side_effect_only": false
         }}
     ]
     }}
@@ -724,72 +853,271 @@ class MCPClient:
     5. 没有依赖关系的步骤可以有空的depends_on数组
     6. 确保没有循环依赖
     7. 只使用必要的工具来完成任务
-    8. 对于依赖前面步骤结果的参数，使用清晰的占位符如 [武汉天气]、[股票信息] 等
-    9. 依赖关系和占位符必须一致，如果step_3依赖step_1的结果，step_3中的参数应该使用与step_1相关的占位符
+    8. 对于依赖前面步骤结果的参数，优先使用 ${{step_id.result}} 形式的结构化引用，需要总结改写时才使用 [武汉天气总结] 这类方括号占位符
+    9. 依赖关系和引用必须一致，如果step_3引用了step_1的结果，step_3的depends_on必须包含step_1
     10. 除非用户明确需要，否则不要使用与音频、语音相关的工具
     11. 对于检查任务状态、查询进度等操作，考虑将其标记为需要轮询的步骤
     12. 除非用户明确要求，否则不要使用网络搜索相关的工具
+    13. 只执行操作、结果内容对回答用户没有帮助的步骤(如发送消息)，设置 side_effect_only 为 true
     """
-
+        return builder.finish(prompt)
+
+    async def _stream_execution_plan(self,
+                                     session: ChatSession,
+                                     user_query: str,
+                                     history_message: str,
+                                     tools_json,
+                                     scheduler: StepScheduler) -> None:
+        """
+        流式生成执行计划，每个步骤对象一闭合就交给调度器，依赖已满足的步骤立即开始执行
+        规划LLM的生成时间与工具执行时间重叠，结束时关闭调度器
+        """
+        content = ""
+        planned_before = len(session.execution_plan.steps)
         try:
-            response = await create_completion(
-                llm_client=self.llm_client,
-                model=self.model,
+            filtered_tools = await self._within_budget(
+                session, self._filter_relevant_tools(session, user_query, tools_json), self.tool_manager.all_tools, "筛选工具")
+            prompt = self._build_plan_prompt(user_query, history_message, self._build_tools_text(filtered_tools))
+
+            stream_generator = await session.deadline.within(create_stream_completion(
+                llm_client=session.llm_client,
                 logger=logger,
+                model=session.model,
                 messages=[
                     {"role": "system", "content": "你是执行计划专家，擅长分析复杂任务并设计最优执行流程"},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.1
-            )
-            
-            content = response.choices[0].message.content
-            think_pattern = re.compile(r'</think>(.*)', re.DOTALL)
-            match = think_pattern.search(content)
-            if match:
-                content = match.group(1).strip()
+            ), reserve=session.deadline.answer_reserve)
+
+            parser = IncrementalArrayParser("steps")
+            scanner = JsonValueScanner("{")
+            think_filter = ThinkTagFilter()
+            try:
+                async for chunk in session.deadline.iterate(stream_generator, reserve=session.deadline.answer_reserve):
+                    if not chunk.choices:
+                        continue
+                    chunk_text = chunk.choices[0].delta.content or ""
+                    content += chunk_text
+
+                    # 跳过思考内容，只解析 <think>...</think> 之外的文本
+                    visible, _ = think_filter.feed(chunk_text)
+                    scanner.feed(visible)
+                    for step_data in parser.feed(visible):
+                        self._add_planned_step(session, scheduler, step_data)
+                visible, _ = think_filter.flush()
+                scanner.feed(visible)
+                for step_data in parser.feed(visible):
+                    self._add_planned_step(session, scheduler, step_data)
+            finally:
+                await stream_generator.aclose()
 
             logger.info(f"执行计划LLM响应: {content}")
+
+            if len(session.execution_plan.steps) == planned_before:
+                # 流式解析没有得到步骤时，使用同时扫描得到的完整JSON对象
+                plan_data = scanner.value if scanner.found else {}
+                if "steps" not in plan_data:
+                    logger.error(f"无法解析执行计划: {content}")
+                for step_data in plan_data.get("steps", []):
+                    self._add_planned_step(session, scheduler, step_data)
+            session.execution_plan.mark_planned()
+        except TimeoutError:
+            logger.warning(f"执行计划生成超出请求时间预算，只执行已规划的 {len(session.execution_plan.steps)} 个步骤")
+        except Exception as e:
+            logger.error(f"创建执行计划出错: {str(e)}", exc_info=True)
+        finally:
+            scheduler.close()
+
+    def _add_planned_step(self, session: ChatSession, scheduler: StepScheduler, step_data: Dict[str, Any]) -> None:
+        """校验流式解析出的步骤并交给调度器"""
+        try:
+            step = self._build_step_from_data(step_data)
+        except (KeyError, TypeError) as e:
+            logger.warning(f"忽略无效的计划步骤 {step_data}: {str(e)}")
+            return
+
+        if step.step_id in session.execution_plan.steps:
+            logger.warning(f"忽略重复的计划步骤: {step.step_id}")
+            return
+
+        if session.first_step_planned_at is None:
+            session.first_step_planned_at = time.monotonic()
+            record_latency("time_to_first_planned_step", session.first_step_planned_at - session.started_at)
+        logger.info(f"已规划步骤 {step.step_id}: {step.tool_name}")
+        scheduler.add_step(step)
+
+    def _build_tools_text(self, tools: List[Dict[str, Any]]) -> str:
+        """生成包含参数说明的工具描述文本"""
+        tool_descriptions = []
+        for tool in tools:
+            tool_name = tool.get("name", "")
+            description = tool.get("description", "")
             
-            plan_data = extract_json_from_llm_response(content)
-            if not plan_data or "steps" not in plan_data:
-                logger.error(f"无法解析执行计划: {content}")
-                return ExecutionPlan(user_query)
-            
-            execution_plan = ExecutionPlan(user_query)
-            
-            for step_data in plan_data["steps"]:
-                tool_name = step_data["tool_name"]
-                
-                step = ExecutionStep(
-                    step_id=step_data["step_id"],
-                    tool_name=tool_name,
-                    tool_args=step_data["tool_args"],
-                    description=step_data.get("description", ""),
-                    depends_on=step_data.get("depends_on", []),
-                    parallel_group=step_data.get("parallel_group"),
-                    polling_required=step_data.get("polling_required", False),
-                    polling_interval=step_data.get("polling_interval", 5),
-                    polling_condition=step_data.get("polling_condition", "")
-                )
-                execution_plan.add_step(step)
+            parameters = {}
+            required = []
             
-            valid_step_ids = set(execution_plan.steps.keys())
+            if "inputSchema" in tool:
+                parameters = tool["inputSchema"].get("properties", {})
+                required = tool["inputSchema"].get("required", [])
+            elif "function" in tool and "parameters" in tool["function"]:
+                parameters = tool["function"]["parameters"].get("properties", {})
+                required = tool["function"]["parameters"].get("required", [])
             
-            for step_id, step in execution_plan.steps.items():
-                step.depends_on = [dep for dep in step.depends_on if dep in valid_step_ids]
+            param_descriptions = []
+            for param_name, param_info in parameters.items():
+                is_required = param_name in required
+                param_desc = param_info.get("description", "")
+                param_type = param_info.get("type", "")
+                param_descriptions.append(f"- {param_name} ({'必填' if is_required else '选填'}): {param_desc} (类型: {param_type})")
             
-            return execution_plan
+            tool_descriptions.append(
+                f"工具名称: {tool_name}\n"
+                f"描述: {description}\n"
+                f"参数:\n" + "\n".join(param_descriptions)
+            )
+        
+        return "\n\n".join(tool_descriptions)
+
+    def _build_plan_from_data(self, user_query: str, plan_data: Dict[str, Any]) -> ExecutionPlan:
+        """根据LLM返回的计划数据构建执行计划"""
+        execution_plan = ExecutionPlan(user_query)
+        
+        for step_data in plan_data["steps"]:
+            execution_plan.add_step(self._build_step_from_data(step_data))
+        
+        valid_step_ids = set(execution_plan.steps.keys())
+        
+        for step_id, step in execution_plan.steps.items():
+            step.depends_on = [dep for dep in step.depends_on if dep in valid_step_ids]
+        
+        return execution_plan
+
+    @staticmethod
+    def _build_step_from_data(step_data: Dict[str, Any]) -> ExecutionStep:
+        """根据LLM返回的单个步骤数据构建执行步骤"""
+        return ExecutionStep(
+            step_id=step_data["step_id"],
+            tool_name=step_data["tool_name"],
+            tool_args=step_data["tool_args"],
+            description=step_data.get("description", ""),
+            depends_on=step_data.get("depends_on", []),
+            parallel_group=step_data.get("parallel_group"),
+            polling_required=step_data.get("polling_required", False),
+            polling_interval=step_data.get("polling_interval", 5),
+            polling_condition=step_data.get("polling_condition", ""),
+            side_effect_only=bool(step_data.get("side_effect_only", False))
+        )
+
+    async def _create_fused_plan(self, session: ChatSession, user_query: str, history_message: str) -> Tuple[Optional[bool], Optional[ExecutionPlan]]:
+        """
+        单次LLM调用同时完成工具需求判断、工具筛选和执行计划生成
+        返回 (needs_tools, execution_plan)，解析失败时返回 (None, None)，由调用方回退到分阶段流程
+        """
+        tools_text = self._build_tools_text(self.tool_manager.all_tools)
+        builder = PromptBuilder("fused_plan")
+        history_text = builder.history(history_message)
+
+        prompt = f"""分析用户查询，一次性完成以下三项工作: 判断是否需要工具、选择工具、制定执行计划。
+
+    用户查询: {user_query}
+
+    用户的历史记录: {history_text}
+
+    可用工具:
+    {tools_text}
+
+    一、判断是否需要工具(needs_tools)
+    需要工具: 需要实时信息、计算或数据处理、网络搜索、生成或处理媒体内容、与外部系统交互
+    不需要工具: 常识问答、问候闲聊、解释概念、总结已知信息、不需要实时数据的简单问答
+
+    二、选择工具(selected_tools)
+    1. 只选择与任务直接相关的工具，避免功能重复
+    2. 网络搜索、音频、语音工具只有在用户明确需要时才选择
+    3. 图像生成任务必须同时包含提交任务和检查进度的工具
+
+    三、制定执行计划(steps)，只使用 selected_tools 中的工具
+    1. 每个步骤必须有唯一的step_id，所有必需参数都必须提供
+    2. depends_on指定依赖的步骤ID，没有依赖时为空数组，不能出现循环依赖
+    3. 可以并行执行的步骤使用相同的parallel_group值(例如"parallel_1")
+    4. 需要前面步骤结果的参数优先使用结构化引用，例如 "message": "武汉的天气是: ${{step_1.result}}"，JSON结果可用 ${{step_1.result.data.temp}} 取值，
+       正则提取使用 ${{step_1.result|regex:温度(\\d+)}}；只有需要总结改写时才使用方括号占位符，例如 "[武汉天气的简要总结]"；引用必须与depends_on一致
+    5. 检查任务状态、查询进度等需要多次执行的步骤设置 polling_required 为 true，polling_condition 为结束条件(如 status == completed、progress >= 100、regex:已完成)，结果带有状态字段时可以留空
+    6. 只执行操作、结果内容对回答用户没有帮助的步骤(如发送消息)设置 side_effect_only 为 true
+
+    只返回JSON，不要有其他内容:
+    {{
+    "needs_tools": true,
+    "selected_tools": ["工具名称"],
+    "steps": [
+        {{
+        "step_id": "唯一标识符",
+        "tool_name": "工具名称",
+        "tool_args": {{"参数名": "参数值或带占位符的字符串"}},
+        "description": "步骤描述",
+        "depends_on": [],
+        "parallel_group": "并行组标识符(可选)",
+        "polling_required": false,
+        "polling_interval": 5,
+        "polling_condition": "",
+        "side_effect_only": false
+        }}
+    ]
+    }}
+    如果不需要工具，needs_tools 为 false，selected_tools 和 steps 为空数组。
+    """
+        prompt = builder.finish(prompt)
+
+        try:
+            response = await create_completion(
+                llm_client=session.llm_client,
+                model=session.model,
+                logger=logger,
+                messages=[
+                    {"role": "system", "content": "你是工具调度专家，能够判断问题是否需要外部工具，并设计最优执行流程"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1
+            )
+
+            content = response.choices[0].message.content
+            content = strip_think(content)
+
+            logger.info(f"合并规划LLM响应: {content}")
+
+            plan_data = extract_json_from_llm_response(content)
+            if not isinstance(plan_data, dict) or not isinstance(plan_data.get("needs_tools"), bool):
+                logger.warning("无法解析合并规划结果，回退到分阶段流程")
+                return None, None
+
+            if not plan_data["needs_tools"]:
+                return False, None
+
+            selected_tools = plan_data.get("selected_tools") or []
+            steps = plan_data.get("steps")
+            if not isinstance(steps, list) or not steps:
+                logger.warning("合并规划结果缺少执行步骤，回退到分阶段流程")
+                return None, None
+
+            for step_data in steps:
+                if not self._find_tool(step_data.get("tool_name", "")):
+                    logger.warning(f"合并规划使用了未知工具 {step_data.get('tool_name')}，回退到分阶段流程")
+                    return None, None
+
+            logger.info(f"合并规划已选择工具: {selected_tools}")
+            return True, self._build_plan_from_data(user_query, plan_data)
         except Exception as e:
-            logger.error(f"创建执行计划出错: {str(e)}", exc_info=True)
-            return ExecutionPlan(user_query)
+            logger.error(f"合并规划出错: {str(e)}", exc_info=True)
+            return None, None
 
     async def _execute_workflow(self, 
+                            session: ChatSession,
                             user_query: str, 
                             temperature: float, 
                             tools_json,
                             history_message: List[Dict[str, Any]] = None,
-                            plan_file: str = None):
+                            plan_file: str = None,
+                            execution_plan: ExecutionPlan = None):
         """
         执行工具调用工作流
         1. 分析用户问题
@@ -797,178 +1125,349 @@ class MCPClient:
         3. 按计划执行工具
         4. 输出最终总结
         """
-        self.execution_plan = None
-        plan_created = False
+        session.execution_plan = execution_plan
+        plan_created = execution_plan is not None
+        resumed = False
         
-        if plan_file and os.path.exists(plan_file):
+        if not session.execution_plan and plan_file and os.path.exists(plan_file):
             try:
-                self.execution_plan = ExecutionPlan.load_from_file(plan_file)
-                yield f"从文件加载执行计划: {plan_file}\n"
+                session.execution_plan = await self._load_plan(plan_file)
+                resumed = True
+                # 已完成步骤的结果供后续步骤的参数引用
+                restored = [step for step in session.execution_plan.steps.values() if step.executed]
+                for step in restored:
+                    session.record_result(step.step_id, step.success, step.result, step.error)
+                yield StreamEvent(
+                    StreamEvent.PLAN,
+                    f"从文件加载执行计划: {plan_file}，已完成 {len(restored)}/{len(session.execution_plan.steps)} 个步骤\n"
+                )
                 
-                todo_list = self.execution_plan.get_todo_list()
-                yield f"执行计划详情:\n{todo_list}\n"
+                todo_list = session.execution_plan.get_todo_list()
+                yield StreamEvent(StreamEvent.PLAN, f"执行计划详情:\n{todo_list}\n")
             except Exception as e:
                 logger.error(f"加载执行计划失败: {str(e)}")
-                yield f"加载执行计划失败: {str(e)}\n"
-                self.execution_plan = None
+                yield StreamEvent(StreamEvent.ERROR, f"加载执行计划失败: {str(e)}\n")
+                session.execution_plan = None
         
-        if not self.execution_plan:
-            self.execution_plan = await self._create_execution_plan(user_query,history_message,tools_json)
+        pipelined = False
+        if not session.execution_plan:
+            if PLAN_STREAMING:
+                session.execution_plan = ExecutionPlan(user_query)
+                session.execution_plan.planned = False
+                pipelined = True
+            else:
+                session.execution_plan = await self._within_budget(
+                    session, self._create_execution_plan(session, user_query, history_message, tools_json),
+                    ExecutionPlan(user_query), "生成执行计划")
             plan_created = True
-            
-            plan_file = os.path.join(self.log_dir, f"plan_{user_query}.json")
-            self.execution_plan.save_to_file(plan_file)
-            
-            todo_list = self.execution_plan.get_todo_list()
-            yield f"执行计划详情:\n{todo_list}\n"
-        
-        execution_results = {}
+        elif not session.execution_plan.planned:
+            # 规划过程中断: 保留已恢复的步骤和结果，重新规划补全其余步骤，重复的步骤会被忽略
+            logger.warning(f"执行日志中的计划不完整，重新生成执行计划: {plan_file}")
+            yield StreamEvent(StreamEvent.PLAN, "执行日志中的计划在规划过程中中断，重新生成执行计划，已完成的步骤不会重新执行\n")
+            pipelined = True
+
+        # 计划只写入一次，之后每个步骤只追加一条结果记录，不再重写整个计划文件
+        journal = self._open_journal(user_query, plan_file)
+        session.execution_plan.attach_journal(journal, resumed=resumed and journal.path == plan_file)
+        logger.info(f"执行日志: {journal.path}")
+
+        if plan_created and not pipelined:
+            todo_list = session.execution_plan.get_todo_list()
+            yield StreamEvent(StreamEvent.PLAN, f"执行计划详情:\n{todo_list}\n")
         
-        iteration = 0
-        while not self.execution_plan.is_completed() and iteration < MAX_ITERATIONS:
-            iteration += 1
-            logger.info(f"当前工具执行次数 {iteration}/{MAX_ITERATIONS}")
-            
-            ready_groups = self.execution_plan.get_parallel_ready_groups()
-            if not ready_groups:
-                logger.info("没有可执行的步骤，终止执行")
-                break
-            
-            for group in ready_groups:
-                for step in group:
-                    step.start_time = datetime.now().isoformat()
-                    logger.info(f"开始执行步骤 {step.step_id}: {step.tool_name}")
-                
-                if len(group) == 1:
-                    step = group[0]
-                    success, result, error = await self._execute_step(step, execution_results,history_message)
-                    
-                    self.execution_plan.update_step_result(step.step_id, success, result if success else None, None if success else error)
-                    execution_results[step.step_id] = {"success": success, "result": result if success else None, "error": None if success else error}
-                    
-                    assessment = await self._evaluate_step_result(step, result if success else error, success)
-                    
-                    polling_info = f"(轮询 {step.polling_iteration} 次)" if step.polling_required else ""
-                    yield f"执行步骤 {step.step_id} ({step.tool_name}) {polling_info}: {'成功' if success else '失败'}\n"
-                    yield f"结果: {result if success else error}\n"
-                    yield f"评估: {assessment}\n\n"
-                else:
-                    tasks = []
-                    steps_with_processed_args = {}
-                    
-                    for step in group:
-                        tool = self._find_tool(step.tool_name)
-                        if not tool:
-                            async def error_task(step_id, tool_name):
-                                return (step_id, False, None, f"找不到工具: {tool_name}")
-                            tasks.append(asyncio.create_task(error_task(step.step_id, step.tool_name)))
-                            steps_with_processed_args[step.step_id] = step.tool_args
-                        else:
-                            processed_args = await self._process_args_with_llm(step, execution_results,history_message)
-                            steps_with_processed_args[step.step_id] = processed_args
-                            step.tool_args = processed_args
-                            
-                            if step.polling_required:
-                                async def execute_polling_task(step_id, step, tool, execution_results):
-                                    try:
-                                        success, result, error = await self._execute_polling_step(step, tool, execution_results)
-                                        return (step_id, success, result, error)
-                                    except Exception as e:
-                                        return (step_id, False, None, f"执行出错: {str(e)}")
-                                
-                                tasks.append(asyncio.create_task(execute_polling_task(step.step_id, step, tool, execution_results)))
-                            else:
-                                async def execute_task(step_id, tool, tool_name, args):
-                                    try:
-                                        result = await self.tool_executor.execute_tool(tool, tool_name, args)
-                                        return (step_id, True, result, None)
-                                    except Exception as e:
-                                        return (step_id, False, None, f"执行出错: {str(e)}")
-                                
-                                tasks.append(asyncio.create_task(execute_task(step.step_id, tool, step.tool_name, processed_args)))
-                    
-                    results = await asyncio.gather(*tasks)
-                    
-                    for step_id, success, result, error in results:
-                        step = self.execution_plan.steps[step_id]
-                        
-                        self.execution_plan.update_step_result(step_id, success, result, error)
-                        execution_results[step_id] = {"success": success, "result": result, "error": error}
-                        
-                        assessment = await self._evaluate_step_result(step, result if success else error, success)
-                        
-                        polling_info = f"(轮询 {step.polling_iteration} 次)" if step.polling_required else ""
-                        yield f"执行步骤 {step_id} ({step.tool_name}) {polling_info}: {'成功' if success else '失败'}\n"
-                        yield f"结果: {result if success else error}\n"
-                        yield f"评估: {assessment}\n\n"
-            
-            if plan_file:
-                self.execution_plan.save_to_file(plan_file)
-        
-        self.execution_plan.completed = self.execution_plan.is_completed()
-        if plan_file:
-            self.execution_plan.save_to_file(plan_file)
-            
-            if plan_created:
-                result_file = os.path.join(self.log_dir, f"results_{user_query}.txt")
-                with open(result_file, 'w', encoding='utf-8') as f:
-                    f.write(self.execution_plan.get_todo_list())
+        async def run_step(step: ExecutionStep) -> Tuple[bool, Any, str]:
+            step.start_time = datetime.now().isoformat()
+            logger.info(f"开始执行步骤 {step.step_id}: {step.tool_name}")
+            if session.first_tool_at is None:
+                session.first_tool_at = time.monotonic()
+                record_latency(f"time_to_first_tool.{session.pipeline_mode}", session.first_tool_at - session.started_at)
+
+            success, result, error = await self._run_within_deadline(
+                session, step, lambda: self._execute_step(session, step, session.execution_results, history_message))
+
+            session.execution_plan.update_step_result(step.step_id, success, result if success else None, None if success else error)
+            session.record_result(step.step_id, success, result if success else None, None if success else error)
+            return success, result, error
+
+        scheduler = StepScheduler(session.execution_plan, run_step, streaming=pipelined)
+        planner_task = None
+        if pipelined:
+            yield StreamEvent(StreamEvent.PLAN, "正在生成执行计划，已规划的步骤将立即开始执行\n")
+            planner_task = asyncio.create_task(
+                self._stream_execution_plan(session, user_query, history_message, tools_json, scheduler)
+            )
+
+        try:
+            async for chunk in self._stream_step_events(session, scheduler):
+                yield chunk
+            session.execution_plan.completed = session.execution_plan.is_completed()
+            journal.append("completed", completed=session.execution_plan.completed)
+        finally:
+            if planner_task and not planner_task.done():
+                planner_task.cancel()
+                await asyncio.gather(planner_task, return_exceptions=True)
+            session.execution_plan.journal = None
+            # 中断时也写入已缓冲的记录，保证可以从日志恢复
+            await asyncio.shield(journal.close())
+
+        if pipelined:
+            todo_list = session.execution_plan.get_todo_list()
+            yield StreamEvent(StreamEvent.PLAN, f"执行计划详情:\n{todo_list}\n")
         
-        execution_results = self.execution_plan.get_execution_results()
+        execution_results = session.execution_plan.get_execution_results()
         
-        async for chunk in self._generate_check(user_query, execution_results, temperature,history_message):
+        async for chunk in self._generate_check(session, user_query, execution_results, temperature, history_message):
             yield chunk
 
-    async def _process_args_with_llm(self, step: ExecutionStep, execution_results: Dict[str, Any], history_message: str) -> Dict[str, Any]:
+    def _open_journal(self, user_query: str, plan_file: str = None) -> ExecutionJournal:
+        """
+        打开工作流的执行日志: plan_file 是 .jsonl 文件时写入该文件(从它恢复时继续追加)，否则在日志目录下新建
+        每隔 JOURNAL_CLEANUP_INTERVAL 秒在后台清理一次过期的日志
+        """
+        if plan_file and plan_file.endswith(JOURNAL_SUFFIX):
+            path = plan_file
+        else:
+            path = os.path.join(self.log_dir, journal_file_name(user_query))
+        journal = self.journal_writer.open(path)
+
+        now = time.monotonic()
+        cleanup_running = self._journal_cleanup_task and not self._journal_cleanup_task.done()
+        if not cleanup_running and (self._last_journal_cleanup is None or now - self._last_journal_cleanup >= JOURNAL_CLEANUP_INTERVAL):
+            self._last_journal_cleanup = now
+            self._journal_cleanup_task = asyncio.create_task(
+                asyncio.to_thread(cleanup_journals, self.log_dir, keep=self.journal_writer.active_paths)
+            )
+        return journal
+
+    @staticmethod
+    async def _load_plan(plan_file: str) -> ExecutionPlan:
+        """从执行日志(.jsonl)或旧格式的计划文件(.json)恢复执行计划"""
+        if plan_file.endswith(JOURNAL_SUFFIX):
+            records = await asyncio.to_thread(read_journal, plan_file)
+            return ExecutionPlan.from_journal(records)
+        return await asyncio.to_thread(ExecutionPlan.load_from_file, plan_file)
+
+    async def _execute_function_calling(self,
+                                        session: ChatSession,
+                                        user_query: str,
+                                        temperature: float,
+                                        history_message: List[Dict[str, Any]] = None):
+        """
+        原生工具调用执行引擎
+        使用 tools/tool_choice 让模型直接发起(并行)工具调用，流式接收工具调用参数，
+        某个调用的参数一旦完整即通过 ToolExecutor 开始执行，执行结果回传给模型，直到模型不再调用工具
+        """
+        tools = [self.tool_manager.convert_tool(tool) for tool in self.tool_manager.all_tools]
+        session.execution_plan = ExecutionPlan(user_query)
+
+        messages = [{"role": "system", "content": "你是一个助人为乐的助手，可以调用提供的工具获取实时信息或执行操作，工具之间没有依赖时请并行调用"}]
+        if history_message:
+            messages.extend(history_message)
+        messages.append({"role": "user", "content": user_query})
+
+        for round_index in range(1, self.max_tool_calls + 1):
+            stream_generator = await session.deadline.within(create_stream_completion(
+                llm_client=session.llm_client,
+                logger=logger,
+                model=session.model,
+                messages=messages,
+                tools=tools,
+                tool_choice="auto",
+                temperature=temperature
+            ))
+
+            pending_calls: Dict[int, Dict[str, Any]] = {}
+            dispatched: Dict[int, asyncio.Task] = {}
+            content_parts = []
+            think_filter = ThinkTagFilter()
+            started_steps: List[ExecutionStep] = []
+
+            def dispatch(index: int) -> None:
+                call = pending_calls[index]
+                try:
+                    call["args"] = json.loads(call["arguments"] or "{}")
+                except json.JSONDecodeError:
+                    return
+                if not call["name"] or index in dispatched:
+                    return
+
+                step = ExecutionStep(
+                    step_id=f"call_{round_index}_{index + 1}",
+                    tool_name=call["name"],
+                    tool_args=call["args"],
+                    description="模型工具调用"
+                )
+                step.start_time = datetime.now().isoformat()
+                session.execution_plan.add_step(step)
+                if session.first_tool_at is None:
+                    session.first_tool_at = time.monotonic()
+                    record_latency("time_to_first_tool.function_calling", session.first_tool_at - session.started_at)
+                dispatched[index] = asyncio.create_task(self._run_tool_call(session, step))
+                started_steps.append(step)
+
+            try:
+                async for chunk in session.deadline.iterate(stream_generator):
+                    if not getattr(chunk, "choices", None):
+                        continue
+                    delta = chunk.choices[0].delta
+
+                    if getattr(delta, "content", None):
+                        content_parts.append(delta.content)
+                        visible = think_filter.feed(delta.content)[0] if HIDE_REASONING else delta.content
+                        if visible:
+                            yield visible
+
+                    for tool_call in getattr(delta, "tool_calls", None) or []:
+                        index = tool_call.index or 0
+                        for earlier in [i for i in pending_calls if i < index and i not in dispatched]:
+                            dispatch(earlier)
+
+                        call = pending_calls.setdefault(index, {"id": None, "name": "", "arguments": ""})
+                        if tool_call.id:
+                            call["id"] = tool_call.id
+                        if tool_call.function:
+                            if tool_call.function.name:
+                                call["name"] += tool_call.function.name
+                            if tool_call.function.arguments:
+                                call["arguments"] += tool_call.function.arguments
+                                dispatch(index)
+
+                    for step in started_steps:
+                        yield self._step_started_event(step)
+                    started_steps.clear()
+            except BaseException:
+                for task in dispatched.values():
+                    task.cancel()
+                raise
+            finally:
+                await stream_generator.aclose()
+
+            if HIDE_REASONING:
+                visible, _ = think_filter.flush()
+                if visible:
+                    yield visible
+
+            for index in pending_calls:
+                if index not in dispatched:
+                    dispatch(index)
+            for step in started_steps:
+                yield self._step_started_event(step)
+            started_steps.clear()
+
+            if not pending_calls:
+                return
+
+            assistant_tool_calls = []
+            for index, call in sorted(pending_calls.items()):
+                call["id"] = call["id"] or f"call_{round_index}_{index + 1}"
+                assistant_tool_calls.append({
+                    "id": call["id"],
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": call["arguments"] or "{}"}
+                })
+            messages.append({"role": "assistant", "content": "".join(content_parts) or None, "tool_calls": assistant_tool_calls})
+
+            step_indexes = {f"call_{round_index}_{index + 1}": index for index in dispatched}
+            tool_outputs: Dict[int, str] = {}
+            for index, call in pending_calls.items():
+                if index not in dispatched:
+                    tool_outputs[index] = f"参数解析失败: {call['arguments']}"
+                    yield StreamEvent(
+                        StreamEvent.STEP_RESULT,
+                        f"工具调用 {call['name']} 参数解析失败: {call['arguments']}\n",
+                        {"tool_name": call["name"], "success": False}
+                    )
+
+            try:
+                for next_done in asyncio.as_completed(list(dispatched.values())):
+                    step, success, result, error = await next_done
+                    index = step_indexes[step.step_id]
+                    tool_outputs[index] = str(result) if success else error
+                    yield self._step_result_event(step, success, result, error)
+            except BaseException:
+                for task in dispatched.values():
+                    task.cancel()
+                raise
+
+            for index, call in sorted(pending_calls.items()):
+                messages.append({"role": "tool", "tool_call_id": call["id"], "content": tool_outputs.get(index, "")})
+
+        logger.warning(f"工具调用轮数达到上限 {self.max_tool_calls}")
+        yield StreamEvent(StreamEvent.ERROR, f"工具调用轮数达到上限 {self.max_tool_calls}，已停止执行\n")
+
+    async def _run_tool_call(self, session: ChatSession, step: ExecutionStep) -> Tuple[ExecutionStep, bool, Any, str]:
+        """执行模型发起的单个工具调用并记录结果"""
+        async def execute() -> Tuple[bool, Any, str]:
+            tool = self._find_tool(step.tool_name)
+            if not tool:
+                return False, None, f"找不到工具: {step.tool_name}"
+            try:
+                result = await self.tool_executor.execute_tool(tool, step.tool_name, step.tool_args, use_cache=session.use_cache)
+                return self._tool_outcome(result)
+            except Exception as e:
+                return False, None, f"执行出错: {str(e)}"
+
+        success, result, error = await self._run_within_deadline(session, step, execute)
+        session.execution_plan.update_step_result(step.step_id, success, result, error)
+        session.record_result(step.step_id, success, result, error)
+        return step, success, result, error
+
+    async def _run_within_deadline(self, session: ChatSession, step: ExecutionStep, execute) -> Tuple[bool, Any, str]:
+        """
+        在请求剩余时间内执行步骤，始终为最终回答保留 session.deadline.answer_reserve 秒
+        剩余时间不足时不再启动新步骤，执行中的步骤超出预算时被取消(工具调用会通知服务器取消)
+        """
+        if not session.deadline.allows(session.deadline.answer_reserve):
+            logger.warning(f"请求剩余时间不足，跳过步骤 {step.step_id}")
+            return False, None, "请求剩余时间不足，未执行"
+        try:
+            return await session.deadline.within(execute(), reserve=session.deadline.answer_reserve)
+        except TimeoutError:
+            logger.warning(f"步骤 {step.step_id} 执行超出请求时间预算，已取消")
+            return False, None, "执行超出请求时间预算，已取消"
+
+    async def _process_args_with_llm(self, session: ChatSession, step: ExecutionStep, execution_results: Dict[str, Any], history_message: str) -> Dict[str, Any]:
         """
         处理工具参数
+        ${step_id.result...} 结构化引用在本地直接替换，只有包含 [描述] 语义占位符或引用无法解析时才调用LLM
         """
         args = step.tool_args
-        processed_args = args.copy()
-        
-        placeholder_pattern = r'\[(.*?)\]'
-        import re
-        
-        has_placeholders = False
-        for key, value in args.items():
-            if isinstance(value, str) and re.search(placeholder_pattern, value):
-                has_placeholders = True
-                break
-        
-        if not has_placeholders:
+        started = time.perf_counter()
+        unresolved: List[str] = []
+        processed_args = resolve_references(args, execution_results, unresolved)
+
+        if unresolved:
+            logger.warning(f"步骤 {step.step_id} 的引用无法在本地解析: {unresolved}")
+        elif not has_semantic_placeholders(args):
+            if processed_args != args:
+                record_latency("arg_resolution.local", time.perf_counter() - started)
+                logger.info(f"步骤 {step.step_id} 的结构化引用已在本地解析")
             return processed_args
         
         logger.info(f"步骤 {step.step_id} 的参数中检测到占位符，使用LLM生成新参数")
         
-        previous_results_text = ""
-        for prev_step_id, result_data in execution_results.items():
-            success = result_data.get("success", False)
-            if not success:
-                continue
-            
-            result = result_data.get("result", "")
-            try:
-                result_text = ""
-                if hasattr(result, "content") and isinstance(result.content, list):
-                    for item in result.content:
-                        if hasattr(item, "text"):
-                            result_text += item.text + "\n"
-                else:
-                    result_text = str(result)
-                
-                previous_results_text += f"步骤 {prev_step_id} 结果:\n{result_text}\n\n"
-            except:
-                previous_results_text += f"步骤 {prev_step_id} 结果: {str(result)}\n\n"
+        # 只提供当前步骤依赖链上和参数中引用到的步骤结果
+        plan = session.execution_plan
+        referenced = referenced_step_ids(step.tool_args)
+        scope = plan.get_dependency_closure([step.step_id, *referenced]) | referenced
+        full_items, brief_lines = self._scope_step_results(session, execution_results, scope)
+
+        builder = PromptBuilder("args")
+        fitted_results = builder.results(full_items)
+        previous_results_text = "".join(
+            f"步骤 {prev_step_id} 结果:\n{result_text}\n\n"
+            for prev_step_id, result_text in fitted_results.items()
+        ) + "".join(f"{line}\n" for line in brief_lines)
         
         prompt = f"""请根据之前步骤的执行结果，为当前工具调用生成准确的参数值。
 
-用户原始问题: {self.execution_plan.user_query}
+用户原始问题: {session.execution_plan.user_query}
 
 当前步骤信息
 - 步骤ID: {step.step_id}
 - 工具名称: {step.tool_name}
 - 参数(含占位符): 
-{json.dumps(step.tool_args, ensure_ascii=False, indent=2)}
+{json.dumps(processed_args, ensure_ascii=False, indent=2)}
 
 之前步骤的执行结果:
 {previous_results_text}
@@ -981,6 +1480,7 @@ class MCPClient:
 2. 从之前步骤的执行结果中提取相关信息
 3. 基于提取的信息生成合适的内容替换占位符
 4. 保持原始JSON结构，只替换占位符部分
+5. 参数中未能解析的 ${{步骤ID.result}} 引用同样需要替换为对应步骤结果中的实际内容
 
 输出要求:
 - 仅返回完整的JSON格式参数，不要包含其他说明
@@ -990,14 +1490,15 @@ class MCPClient:
 
 例如，如果参数中有 "message": "搜索结果：[搜索结果摘要]"，你应该将[搜索结果摘要]替换为从之前步骤中提取的实际摘要内容。
 """
+        prompt = builder.finish(prompt)
         try:
-            if not self.llm_client:
+            if not session.llm_client:
                 logger.error("LLM客户端未初始化，无法生成新参数")
                 return processed_args
             
             response = await create_completion(
-                llm_client=self.llm_client,
-                model=self.model,
+                llm_client=session.llm_client,
+                model=session.model,
                 logger=logger,
                 messages=[
                     {"role": "system", "content": "你是参数优化专家，擅长根据上下文生成准确的参数值，确保生成的参数是有效的JSON格式"},
@@ -1006,7 +1507,7 @@ class MCPClient:
                 temperature=0.1
             )
             
-            content = response.choices[0].message.content
+            content = strip_think(response.choices[0].message.content)
             logger.info(f"LLM生成的参数内容: {content}")
             
             new_params = extract_json_from_llm_response(content)
@@ -1018,98 +1519,185 @@ class MCPClient:
             if "message" in new_params and isinstance(new_params["message"], str):
                 logger.info("已处理包含message字段的参数")
             
+            record_latency("arg_resolution.llm", time.perf_counter() - started)
             return new_params
         except Exception as e:
             logger.error(f"使用LLM处理参数时出错: {str(e)}")
             return processed_args
     
-    async def _execute_plan(self, plan: ExecutionPlan) -> Dict[str, Any]:
+    async def _execute_plan(self, session: ChatSession, plan: ExecutionPlan) -> Dict[str, Any]:
         """
         执行计划
         """
         execution_results = {}
-        
-        iteration = 0
-        while not plan.is_completed() and iteration < MAX_ITERATIONS:
-            iteration += 1
-            logger.info(f"执行迭代 {iteration}/{MAX_ITERATIONS}")
-            
-            ready_groups = plan.get_parallel_ready_groups()
-            if not ready_groups:
-                logger.info("没有可执行的步骤，终止执行")
-                break
-            
-            for group in ready_groups:
-                for step in group:
-                    step.start_time = datetime.now().isoformat()
-                    logger.info(f"开始执行步骤 {step.step_id}: {step.tool_name}")
-                
-                if len(group) == 1:
-                    step = group[0]
+
+        async def run_step(step: ExecutionStep) -> Tuple[bool, Any, str]:
+            step.start_time = datetime.now().isoformat()
+            logger.info(f"开始执行步骤 {step.step_id}: {step.tool_name}")
+
+            tool = self._find_tool(step.tool_name)
+            if not tool:
+                success, result, error = False, None, f"找不到工具: {step.tool_name}"
+            else:
+                try:
+                    processed_args = resolve_references(step.tool_args, execution_results)
+                    result = await self.tool_executor.execute_tool(tool, step.tool_name, processed_args, use_cache=session.use_cache)
+                    success, error = True, None
+                except Exception as e:
+                    success, result, error = False, None, f"执行出错: {str(e)}"
+
+            plan.update_step_result(step.step_id, success, result, error)
+            execution_results[step.step_id] = {"success": success, "result": result, "error": error}
+            return success, result, error
+
+        scheduler = StepScheduler(plan, run_step)
+        async for chunk in self._stream_step_events(session, scheduler):
+            yield chunk
+
+    async def _stream_step_events(self, session: ChatSession, scheduler: StepScheduler):
+        """
+        步骤完成后立即输出执行结果，结果评估在后台并发进行，评估完成后再追加输出
+        同一并行组的步骤在全部完成后合并为一次评估调用
+        """
+        plan = scheduler.plan
+        started: asyncio.Queue = asyncio.Queue()
+        scheduler.on_step_started = started.put_nowait
+        step_events = scheduler.run()
+        next_event = asyncio.ensure_future(anext(step_events))
+        next_started = asyncio.ensure_future(started.get())
+        assessments: Dict[asyncio.Task, List[ExecutionStep]] = {}
+        group_buffers: Dict[str, List[Tuple[ExecutionStep, Any, bool]]] = {}
+
+        try:
+            while next_event or assessments:
+                waiting = set(assessments)
+                if next_event:
+                    waiting.update((next_event, next_started))
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                if next_started.done():
+                    yield self._step_started_event(next_started.result())
+                    next_started = asyncio.ensure_future(started.get())
+                while not started.empty():
+                    yield self._step_started_event(started.get_nowait())
+
+                if next_event in done:
                     try:
-                        tool = self._find_tool(step.tool_name)
-                        if not tool:
-                            result = f"找不到工具: {step.tool_name}"
-                            success = False
-                        else:
-                            processed_args = self._process_args_with_context(step.tool_args, execution_results)
-                            result = await self.tool_executor.execute_tool(tool, step.tool_name, processed_args)
-                            success = True
-                    except Exception as e:
-                        result = f"执行出错: {str(e)}"
-                        success = False
-                    
-                    plan.update_step_result(step.step_id, success, result if success else None, None if success else result)
-                    execution_results[step.step_id] = {"success": success, "result": result if success else None, "error": None if success else result}
-                    
-                    assessment = await self._evaluate_step_result(step, result, success)
-                    
-                    yield f"执行步骤 {step.step_id} ({step.tool_name}): {'成功' if success else '失败'}\n"
-                    yield f"结果: {result}\n"
-                    yield f"评估: {assessment}\n\n"
-                else:
-                    tasks = []
-                    
-                    for step in group:
-                        tool = self._find_tool(step.tool_name)
-                        if not tool:
-                            async def error_task(step_id, tool_name):
-                                return (step_id, False, None, f"找不到工具: {tool_name}")
-                            tasks.append(asyncio.create_task(error_task(step.step_id, step.tool_name)))
-                        else:
-                            processed_args = self._process_args_with_context(step.tool_args, execution_results)
-                            
-                            async def execute_task(step_id, tool, tool_name, args):
-                                try:
-                                    result = await self.tool_executor.execute_tool(tool, tool_name, args)
-                                    return (step_id, True, result, None)
-                                except Exception as e:
-                                    return (step_id, False, None, f"执行出错: {str(e)}")
-                            
-                            tasks.append(asyncio.create_task(execute_task(step.step_id, tool, step.tool_name, processed_args)))
-                    
-                    results = await asyncio.gather(*tasks)
-                    
-                    for step_id, success, result, error in results:
-                        plan.update_step_result(step_id, success, result, error)
-                        execution_results[step_id] = {"success": success, "result": result, "error": error}
-                        
-                        step = plan.steps[step_id]
-                        
-                        assessment = await self._evaluate_step_result(step, result if success else error, success)
-                        
-                        yield f"执行步骤 {step_id} ({step.tool_name}): {'成功' if success else '失败'}\n"
-                        yield f"结果: {result if success else error}\n"
-                        yield f"评估: {assessment}\n\n"
+                        step, success, result, error = next_event.result()
+                    except StopAsyncIteration:
+                        next_event = None
+                        for group, items in group_buffers.items():
+                            if items and self._can_assess(session):
+                                assessment_task = asyncio.create_task(self._evaluate_step_results(session, items))
+                                assessments[assessment_task] = [item[0] for item in items]
+                        group_buffers = {}
+                    else:
+                        next_event = asyncio.ensure_future(anext(step_events))
 
-    
-    async def _evaluate_step_result(self, step: ExecutionStep, result: Any, success: bool) -> str:
+                        yield self._step_result_event(step, success, result, error)
+
+                        to_assess = []
+                        if session.result_assessor.should_assess(success) and self._can_assess(session):
+                            to_assess.append((step, result if success else error, success))
+
+                        group = step.parallel_group
+                        if group and len(plan.parallel_groups.get(group, [])) > 1:
+                            group_buffers.setdefault(group, []).extend(to_assess)
+                            members = plan.parallel_groups[group]
+                            if all(plan.steps[step_id].executed for step_id in members if step_id in plan.steps):
+                                to_assess = group_buffers.pop(group)
+                            else:
+                                to_assess = []
+
+                        if to_assess:
+                            assessment_task = asyncio.create_task(self._evaluate_step_results(session, to_assess))
+                            assessments[assessment_task] = [item[0] for item in to_assess]
+
+                for task in [task for task in done if task in assessments]:
+                    steps = assessments.pop(task)
+                    formatted = task.result()
+                    for step in steps:
+                        yield StreamEvent(
+                            StreamEvent.ASSESSMENT,
+                            f"步骤 {step.step_id} 评估: {formatted.get(step.step_id, '')}\n\n",
+                            {"step_id": step.step_id}
+                        )
+        finally:
+            pending = list(assessments) + [next_started]
+            if next_event:
+                pending.append(next_event)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            await step_events.aclose()
+
+    @staticmethod
+    def _can_assess(session: ChatSession) -> bool:
+        """剩余时间不够一次评估加最终回答时跳过评估"""
+        return session.deadline.allows(session.result_assessor.assessment_timeout + session.deadline.answer_reserve)
+
+    @staticmethod
+    def _step_started_event(step: ExecutionStep) -> StreamEvent:
+        return StreamEvent(StreamEvent.STEP_STARTED, "", {"step_id": step.step_id, "tool_name": step.tool_name})
+
+    @staticmethod
+    def _step_result_event(step: ExecutionStep, success: bool, result: Any, error: str) -> StreamEvent:
+        polling_info = f" (轮询 {step.polling_iteration} 次)" if step.polling_required else ""
+        content = (f"执行步骤 {step.step_id} ({step.tool_name}){polling_info}: {'成功' if success else '失败'}\n"
+                   f"结果: {result if success else error}\n\n")
+        return StreamEvent(
+            StreamEvent.STEP_RESULT,
+            content,
+            {
+                "step_id": step.step_id,
+                "tool_name": step.tool_name,
+                "success": success,
+                "is_error": not success and (error or "").startswith(TOOL_ERROR_PREFIX)
+            }
+        )
+
+    async def _evaluate_step_results(self, session: ChatSession, items: List[Tuple[ExecutionStep, Any, bool]]) -> Dict[str, str]:
+        """评估一组步骤的执行结果，多个步骤合并为一次LLM调用"""
+        if len(items) == 1:
+            step, result, success = items[0]
+            return {step.step_id: await self._evaluate_step_result(session, step, result, success)}
+
+        try:
+            assessments = await session.result_assessor.assess_group_results(
+                user_query=session.user_query,
+                step_results=[
+                    {
+                        "step_id": step.step_id,
+                        "tool_name": step.tool_name,
+                        "tool_args": step.tool_args,
+                        "result": result,
+                        "success": success
+                    }
+                    for step, result, success in items
+                ]
+            )
+            return {
+                step_id: self._format_assessment(assessment)
+                for step_id, assessment in assessments.items()
+            }
+        except Exception as e:
+            logger.error(f"评估结果出错: {str(e)}")
+            return {step.step_id: f"评估失败: {str(e)}" for step, _, _ in items}
+
+    @staticmethod
+    def _format_assessment(assessment: Dict[str, Any]) -> str:
+        return f"满足度: {assessment.get('satisfaction_level', '不满足需求')} " + \
+               f"(置信度: {assessment.get('confidence', 0.0)})\n" + \
+               f"原因: {assessment.get('reason', '')}"
+
+    async def _evaluate_step_result(self, session: ChatSession, step: ExecutionStep, result: Any, success: bool) -> str:
         """评估步骤执行结果"""
-        if not self.result_assessor:
+        if not session.result_assessor:
             return "无法评估结果(评估器未初始化)"
         
         try:
-            assessment = await self.result_assessor.assess_tool_result(
+            assessment = await session.result_assessor.assess_tool_result(
                 user_query="",
                 tool_name=step.tool_name,
                 tool_args=step.tool_args,
@@ -1117,11 +1705,7 @@ class MCPClient:
                 all_previous_results=[]
             )
             
-            formatted = f"满足度: {assessment.get('satisfaction_level', '不满足需求')} " + \
-                        f"(置信度: {assessment.get('confidence', 0.0)})\n" + \
-                        f"原因: {assessment.get('reason', '')}"
-            
-            return formatted
+            return self._format_assessment(assessment)
         except Exception as e:
             logger.error(f"评估结果出错: {str(e)}")
             return f"评估失败: {str(e)}"
@@ -1134,41 +1718,60 @@ class MCPClient:
                 return tool
         return None
     
-    def _process_args_with_context(self, args: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """处理工具参数，替换结果引用"""
-        processed_args = {}
-        
-        for key, value in args.items():
-            if isinstance(value, str) and value.startswith("${") and value.endswith("}"):
-                ref_key = value[2:-1]
-                if ref_key in context:
-                    result_data = context[ref_key]
-                    if isinstance(result_data, dict) and "result" in result_data:
-                        processed_args[key] = result_data["result"]
-                    else:
-                        processed_args[key] = result_data
-                else:
-                    processed_args[key] = f"引用错误: {ref_key}不存在"
-            else:
-                processed_args[key] = value
-        
-        return processed_args
-    
-    async def _generate_check(self, user_query: str, execution_results: Dict[str, Any], temperature: float, history_message: str):
-        """生成检查总结"""
+    async def _generate_check(self, session: ChatSession, user_query: str, execution_results: Dict[str, Any], temperature: float, history_message: str):
+        """
+        生成检查总结
+        剩余时间少于 DEADLINE_MIN_FINAL_CHECK 秒时跳过LLM检查，直接输出经过本地筛查的已获得结果
+        stream 模式只对通过本地检查的结果边输出边审核；需要LLM检查时回答由检查模型生成，
+        仍要等检查模型开始输出(首个字符的延迟不变)，之后逐块输出，不经过滑动窗口
+        """
+        short_of_time = not session.deadline.allows(DEADLINE_MIN_FINAL_CHECK)
+        if session.final_check_mode in ("rule", "stream"):
+            answer = self._rule_final_answer(session, execution_results)
+            if answer is not None and session.final_check_mode == "stream" and not short_of_time:
+                logger.info("最后一步结果通过本地检查，边输出边审核")
+                async for chunk in self._stream_moderated_answer(session, user_query, answer):
+                    yield chunk
+                return
+            if answer is not None:
+                logger.info("最后一步结果通过本地检查，直接输出")
+                record_latency("time_to_answer.rule", time.monotonic() - session.started_at)
+                yield "最终结果:"
+                yield answer
+                return
+
+        if short_of_time:
+            logger.warning(f"请求剩余时间不足({session.deadline.remaining():.1f}秒)，跳过最终检查，直接输出已获得的结果")
+            record_latency("time_to_answer.partial", time.monotonic() - session.started_at)
+            yield "最终结果:"
+            yield self._partial_answer(session, execution_results)
+            return
+
+        # 完整提供执行链最后一步的结果；最后一步失败或只执行操作时，再提供它的依赖链
+        plan = session.execution_plan
+        scope = set(plan.get_sink_steps())
+        for step_id in list(scope):
+            sink = plan.steps[step_id]
+            if not sink.success or self._is_side_effect_only(sink):
+                scope |= plan.get_dependency_closure([step_id])
+        full_items, brief_lines = self._scope_step_results(session, execution_results, scope, summarize_others=True)
+
+        builder = PromptBuilder("final_check")
+        fitted_results = builder.results(full_items)
+        history_text = builder.history(history_message)
+
         results_text = ""
-        for step_id, result in execution_results.items():
-            success = result.get("success", False)
-            result_content = result.get("result") if success else result.get("error")
-            results_text += f"步骤 {step_id}: {'成功' if success else '失败'}\n"
-            results_text += f"结果: {result_content}\n\n"
+        for step_id, result_text in fitted_results.items():
+            results_text += f"步骤 {step_id}: 成功\n"
+            results_text += f"结果: {result_text}\n\n"
+        results_text += "".join(f"{line}\n" for line in brief_lines)
         
         prompt = f"""根据以下执行结果，检查最后输出的内容是否符合安全标准并生成适当回答。
 
 用户原始问题:
 {user_query}
 
-用户的历史记录: {history_message}
+用户的历史记录: {history_text}
 
 执行结果:
 {results_text}
@@ -1201,107 +1804,354 @@ class MCPClient:
    - 保持简洁性和可读性
    - 不要在输出中解释或提及执行过程
 """
+        prompt = builder.finish(prompt)
         yield "最终结果:"
-        stream_generator = await create_stream_completion(
-            llm_client=self.llm_client,
-            logger=logger,
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "你是一个专业的内容检查助手"},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=temperature
-        )
+        stream_generator = None
+        first_chunk = True
+        try:
+            stream_generator = await session.deadline.within(create_stream_completion(
+                llm_client=session.llm_client,
+                logger=logger,
+                model=session.model,
+                messages=[
+                    {"role": "system", "content": "你是一个专业的内容检查助手"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=temperature
+            ))
+            async for chunk in session.deadline.iterate(filter_stream(stream_generator)):
+                if first_chunk:
+                    first_chunk = False
+                    record_latency("time_to_answer.llm", time.monotonic() - session.started_at)
+                yield chunk
+        except TimeoutError:
+            if first_chunk:
+                logger.warning("最终检查超出请求时间预算，直接输出已获得的结果")
+                record_latency("time_to_answer.partial", time.monotonic() - session.started_at)
+                yield self._partial_answer(session, execution_results)
+            else:
+                logger.warning("最终回答超出请求时间预算，已截断")
+                yield "\n\n(回答超出请求时间预算，已截断)"
+        finally:
+            if stream_generator:
+                await stream_generator.aclose()
 
-        async for chunk in filter_stream(stream_generator):
-            yield chunk
+    def _partial_answer(self, session: ChatSession, execution_results: Dict[str, Any]) -> str:
+        """
+        不经过LLM检查，直接由已成功的最后步骤结果组成回答
+        最后步骤都没有成功时使用其他成功步骤的结果，输出前仍进行本地内容筛查
+        """
+        plan = session.execution_plan
+        scope = set(plan.get_sink_steps())
+        if not any(plan.steps[step_id].success for step_id in scope):
+            scope = {step_id for step_id, step in plan.steps.items() if step.success}
+        full_items, _ = self._scope_step_results(session, execution_results, scope, summarize_others=False)
+        texts = [text for _, text in full_items if text]
+        if not texts:
+            return "请求超出时间预算，未能获得可用的执行结果。"
+
+        answer = "\n\n".join(texts)
+        blocked = screen_text(answer)
+        if blocked is not None:
+            logger.warning(f"已获得的结果命中屏蔽规则: {blocked}")
+            return "不好意思。根据规则，当前的执行结果不允许输出。"
+        return answer
     
-    async def _execute_step(self, step: ExecutionStep, execution_results: Dict[str, Any],history_message: str) -> Tuple[bool, Any, str]:
+    async def _stream_moderated_answer(self, session: ChatSession, user_query: str, answer: str):
+        """
+        边输出边审核: 立即开始输出最终结果，同时并行运行LLM安全审核
+        审核结束前按 FINAL_CHECK_STREAM_RATE 的速度输出，最多输出 FINAL_CHECK_STREAM_MAX_UNMODERATED 个字符，
+        并始终保留滑动窗口内的内容不输出；审核通过后立即输出其余内容，未通过时撤回窗口内的内容并给出提示
+        """
+        moderation = asyncio.create_task(self._moderate_answer(session, user_query, answer))
+        window = SlidingWindowBuffer(FINAL_CHECK_STREAM_WINDOW)
+        chunk_size = max(FINAL_CHECK_STREAM_CHUNK, 1)
+        interval = chunk_size / FINAL_CHECK_STREAM_RATE if FINAL_CHECK_STREAM_RATE > 0 else 0
+        offset = 0
+        first_chunk = True
+
+        yield "最终结果:"
+        try:
+            while (offset < len(answer) and not moderation.done()
+                   and window.flushed_chars < FINAL_CHECK_STREAM_MAX_UNMODERATED):
+                ready = window.push(answer[offset:offset + chunk_size])
+                offset += chunk_size
+                if not ready:
+                    # 窗口未满时继续填充，不等待
+                    continue
+                if first_chunk:
+                    first_chunk = False
+                    record_latency("time_to_answer.stream", time.monotonic() - session.started_at)
+                yield ready
+                # 按固定速度输出，审核完成时立即结束等待
+                await asyncio.wait({moderation}, timeout=interval)
+            approved = await moderation
+        finally:
+            if not moderation.done():
+                moderation.cancel()
+
+        if approved:
+            yield window.flush() + answer[offset:]
+            return
+
+        dropped = window.discard()
+        logger.warning(f"最终结果未通过审核，已撤回未输出的{len(dropped) + max(len(answer) - offset, 0)}个字符，"
+                       f"已输出{window.flushed_chars}个字符")
+        yield "\n\n不好意思。根据规则，当前的执行结果不允许输出。"
+
+    async def _moderate_answer(self, session: ChatSession, user_query: str, answer: str) -> bool:
+        """LLM安全审核，返回是否通过；审核出错或超时按未通过处理"""
+        started = time.monotonic()
+        builder = PromptBuilder("moderation")
+        answer_text = builder.section("answer", answer, PROMPT_RESULTS_TOKENS)
+        prompt = f"""请检查以下回答内容是否符合法律和道德规范。
+
+用户原始问题:
+{user_query}
+
+回答内容:
+{answer_text}
+
+内容不应包含:
+1. 违法内容(如制作武器、毒品、黑客工具等指南)
+2. 侵犯隐私内容
+3. 仇恨言论或歧视内容
+4. 成人、淫秽或色情内容
+5. 暴力或恐怖内容
+6. 欺诈或误导性内容
+
+符合规范请只输出"通过"，否则请只输出"拒绝"。
+"""
+        prompt = builder.finish(prompt)
+        timeout = session.deadline.budget(FINAL_CHECK_MODERATION_TIMEOUT)
+        try:
+            response = await asyncio.wait_for(create_completion(
+                llm_client=session.llm_client,
+                logger=logger,
+                model=session.model,
+                messages=[
+                    {"role": "system", "content": "你是一个专业的内容检查助手"},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0
+            ), timeout=timeout)
+            content = response.choices[0].message.content or ""
+            content = strip_think(content).strip()
+            approved = "拒绝" not in content and "通过" in content
+            if not approved:
+                logger.warning(f"LLM审核未通过: {content[:100]}")
+            return approved
+        except asyncio.TimeoutError:
+            logger.error(f"LLM审核超时({timeout:.1f}秒)")
+            return False
+        except Exception as e:
+            logger.error(f"LLM审核出错: {str(e)}")
+            return False
+        finally:
+            record_latency("final_check.moderation", time.monotonic() - started)
+
+    def _rule_final_answer(self, session: ChatSession, execution_results: Dict[str, Any]) -> Optional[str]:
+        """
+        本地规则检查最终结果，可以直接输出时返回结果文本，否则返回None交给LLM检查
+        要求: 所有步骤成功，只有一个需要回答的最后步骤，其结果为完整的非空纯文本且未命中屏蔽规则
+        轮询未达到结束条件、结果状态表明任务未完成或命中不完整规则时视为不完整
+        """
+        plan = session.execution_plan
+        if not plan or not plan.steps or not plan.is_completed():
+            return None
+        if any(not result.get("success", False) for result in execution_results.values()):
+            return None
+
+        answer_steps = [step_id for step_id in plan.get_sink_steps() if not self._is_side_effect_only(plan.steps[step_id])]
+        if len(answer_steps) != 1:
+            return None
+
+        step = plan.steps[answer_steps[0]]
+        if step.polling_incomplete:
+            logger.info(f"最后步骤 {step.step_id} 的轮询未达到结束条件，交给LLM检查")
+            return None
+        result = step.result
+        if isinstance(result, ToolResult):
+            if result.is_error or result.is_empty or result.binary_parts:
+                return None
+            text = result.render()
+        elif isinstance(result, str):
+            text = result
+        else:
+            return None
+
+        text = text.strip()
+        if not text:
+            return None
+
+        flagged = screen_text(text)
+        if flagged:
+            logger.info(f"最终结果命中筛查规则({flagged})，交给LLM检查")
+            return None
+        reason = incomplete_reason(text)
+        if reason:
+            logger.info(f"最终结果不完整({reason})，交给LLM检查")
+            return None
+        return text
+
+    def _is_side_effect_only(self, step: ExecutionStep) -> bool:
+        """步骤是否只执行操作，结果内容无需写入后续提示词"""
+        if step.side_effect_only or step.tool_name in SIDE_EFFECT_TOOLS:
+            return True
+        tool = self._find_tool(step.tool_name)
+        server = tool.get("server") if tool else None
+        return isinstance(server, dict) and server.get("name") in SIDE_EFFECT_TOOLS
+
+    def _scope_step_results(self,
+                            session: ChatSession,
+                            execution_results: Dict[str, Any],
+                            scope: Set[str],
+                            summarize_others: bool = False) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """
+        按范围整理步骤结果，返回 (完整结果列表, 一行摘要列表)
+        范围内的普通步骤提供完整结果，失败和只执行操作的步骤只保留一行摘要
+        summarize_others 为True时范围外的步骤也保留一行摘要，否则省略
+        """
+        full_items = []
+        brief_lines = []
+        for step_id, result_data in execution_results.items():
+            step = session.execution_plan.steps.get(step_id)
+            tool_name = step.tool_name if step else ""
+            in_scope = step_id in scope
+
+            if not in_scope and not summarize_others:
+                continue
+            if not result_data.get("success", False):
+                brief_lines.append(f"步骤 {step_id} ({tool_name}): 失败 - {result_data.get('error')}")
+            elif step and self._is_side_effect_only(step):
+                brief_lines.append(f"步骤 {step_id} ({tool_name}): 成功(仅执行操作，结果已省略)")
+            elif in_scope:
+                full_items.append((step_id, result_to_text(result_data.get("result"))))
+            else:
+                brief_lines.append(f"步骤 {step_id} ({tool_name}): 成功(中间结果已被后续步骤使用)")
+        return full_items, brief_lines
+
+    async def _execute_step(self, session: ChatSession, step: ExecutionStep, execution_results: Dict[str, Any], history_message: str) -> Tuple[bool, Any, str]:
         """执行单个步骤，支持轮询模式"""
         try:
             tool = self._find_tool(step.tool_name)
             if not tool:
                 return False, None, f"找不到工具: {step.tool_name}"
             
-            processed_args = await self._process_args_with_llm(step, execution_results,history_message)
+            processed_args = await self._process_args_with_llm(session, step, execution_results, history_message)
             
             step.tool_args = processed_args
             
             if step.polling_required:
-                return await self._execute_polling_step(step, tool, execution_results)
+                return await self._execute_polling_step(session, step, tool, execution_results)
             else:
-                result = await self.tool_executor.execute_tool(tool, step.tool_name, processed_args)
-                return True, result, None
+                result = await self.tool_executor.execute_tool(tool, step.tool_name, processed_args, use_cache=session.use_cache)
+                return self._tool_outcome(result)
         except Exception as e:
             return False, None, f"执行出错: {str(e)}"
 
-    async def _execute_polling_step(self, step: ExecutionStep, tool: Dict[str, Any], execution_results: Dict[str, Any]) -> Tuple[bool, Any, str]:
-        """执行需要轮询的步骤，直到满足结束条件或达到最大迭代次数"""
+    @staticmethod
+    def _tool_outcome(result: Any) -> Tuple[bool, Any, str]:
+        """工具返回 isError 的结果视为步骤失败，错误内容作为错误信息，不作为结果供后续步骤引用"""
+        if isinstance(result, ToolResult) and result.is_error:
+            return False, None, f"{TOOL_ERROR_PREFIX}: {result.render()}"
+        return True, result, None
+
+    async def _execute_polling_step(self, session: ChatSession, step: ExecutionStep, tool: Dict[str, Any], execution_results: Dict[str, Any]) -> Tuple[bool, Any, str]:
+        """
+        执行需要轮询的步骤，直到满足结束条件或达到最大迭代次数
+        轮询间隔从 polling_interval 开始指数退避并加入随机抖动，所有步骤的等待共用一个定时器
+        调用时附带进度标识，服务器推送的进度达到100%时立即结束等待，进度增长速度用于缩短等待时间
+        """
         MAX_POLLING_ITERATIONS = MAX_ITERATIONS
         poll_count = 0
         last_result = None
         last_error = None
-        
+        stopped_early = False
+        backoff = PollBackoff(step.polling_interval)
+        judged: Dict[str, bool] = {}
+        router = getattr(self.tool_manager, "progress_router", None)
+
         logger.info(f"开始轮询执行步骤 {step.step_id}: {step.tool_name}")
-        
-        while poll_count < MAX_POLLING_ITERATIONS:
-            poll_count += 1
-            step.polling_iteration = poll_count
-            
-            try:
-                result = await self.tool_executor.execute_tool(tool, step.tool_name, step.tool_args)
-                last_result = result
-                
-                is_completed = await self._check_polling_condition(step, result, execution_results)
-                
-                if is_completed:
-                    logger.info(f"轮询步骤 {step.step_id} 已完成，共执行 {poll_count} 次")
-                    return True, result, None
-                
-                await asyncio.sleep(step.polling_interval)
-                
-            except Exception as e:
-                last_error = f"轮询执行出错: {str(e)}"
-                logger.error(f"轮询步骤 {step.step_id} 执行失败: {last_error}")
-                return False, None, last_error
-        
+
+        with (router.track() if router else nullcontext()) as progress:
+            while poll_count < MAX_POLLING_ITERATIONS:
+                poll_count += 1
+                step.polling_iteration = poll_count
+
+                try:
+                    result = await self.tool_executor.execute_tool(
+                        tool, step.tool_name, step.tool_args, use_cache=False,
+                        progress_token=progress.token if progress else None
+                    )
+                    last_result = result
+
+                    is_completed = await self._check_polling_condition(session, step, result, execution_results, progress, judged)
+
+                    if is_completed == POLL_FAILED:
+                        logger.warning(f"轮询步骤 {step.step_id} 的任务状态为失败，共执行 {poll_count} 次")
+                        return False, None, f"轮询的任务执行失败: {result_to_text(result)}"
+                    if is_completed:
+                        logger.info(f"轮询步骤 {step.step_id} 已完成，共执行 {poll_count} 次")
+                        return self._tool_outcome(result)
+                except Exception as e:
+                    last_error = f"轮询执行出错: {str(e)}"
+                    logger.error(f"轮询步骤 {step.step_id} 执行失败: {last_error}")
+                    return False, None, last_error
+
+                if poll_count >= MAX_POLLING_ITERATIONS:
+                    break
+                delay = backoff.next_delay(progress.eta() if progress else None)
+                if not session.deadline.allows(delay + session.deadline.answer_reserve):
+                    logger.warning(f"请求剩余时间不足，轮询步骤 {step.step_id} 在第 {poll_count} 次后停止，返回最后结果")
+                    stopped_early = True
+                    break
+
+                if await self.poll_timer.sleep(delay, progress.completed if progress else None):
+                    logger.info(f"轮询步骤 {step.step_id} 收到进度完成通知，立即轮询")
+
+        # 没有达到结束条件就停止时，最后结果可能只是中间状态
+        step.polling_incomplete = last_result is not None
+        if last_result and stopped_early:
+            return self._tool_outcome(last_result)
         if last_result:
             logger.warning(f"轮询步骤 {step.step_id} 达到最大轮询次数 {MAX_POLLING_ITERATIONS}，返回最后结果")
-            return True, last_result, None
+            return self._tool_outcome(last_result)
         else:
             return False, None, last_error or f"轮询步骤 {step.step_id} 达到最大轮询次数 {MAX_POLLING_ITERATIONS} 但未获得有效结果"
 
-    async def _check_polling_condition(self, step: ExecutionStep, result: Any, execution_results: Dict[str, Any]) -> bool:
-        """检查轮询结果是否满足结束条件"""
-        if not step.polling_condition:
-            return await self._check_polling_condition_with_llm(step, result, execution_results)
-        
+    async def _check_polling_condition(self,
+                                       session: ChatSession,
+                                       step: ExecutionStep,
+                                       result: Any,
+                                       execution_results: Dict[str, Any],
+                                       progress: ProgressTracker = None,
+                                       judged: Dict[str, bool] = None) -> Verdict:
+        """
+        检查轮询结果是否满足结束条件，结果表明任务失败时返回 POLL_FAILED
+        依次使用服务器的进度通知、本地结束条件和状态字段，都无法判断时才调用LLM，相同的结果不重复调用
+        """
+        if progress is not None and progress.complete:
+            logger.info(f"轮询步骤 {step.step_id} 的进度通知显示已完成")
+            return True
+
         try:
-            result_str = str(result)
-            
-            completion_keywords = ["completed", "finished", "done", "success", "complete", 
-                                "完成", "成功", "结束", "就绪", "100%"]
-            
-            for keyword in completion_keywords:
-                if keyword.lower() in result_str.lower():
-                    return True
-            
-            if isinstance(result, dict):
-                status = result.get("status", "").lower()
-                state = result.get("state", "").lower()
-                progress = result.get("progress", 0)
-                
-                if status in ["completed", "success", "done", "完成", "成功"] or \
-                state in ["completed", "success", "done", "完成", "成功"] or \
-                progress == 100 or progress == "100%":
-                    return True
-            
-            return False
+            verdict = evaluate_completion(result, step.polling_condition)
         except Exception as e:
             logger.error(f"检查轮询条件出错: {str(e)}")
-            return False
-
-    async def _check_polling_condition_with_llm(self, step: ExecutionStep, result: Any, execution_results: Dict[str, Any]) -> bool:
+            verdict = None
+        if verdict is not None:
+            return verdict
+
+        result_text = result_to_text(result)
+        if judged is not None and result_text in judged:
+            return judged[result_text]
+        verdict = await self._check_polling_condition_with_llm(session, step, result, execution_results)
+        if judged is not None:
+            judged[result_text] = verdict
+        return verdict
+
+    async def _check_polling_condition_with_llm(self, session: ChatSession, step: ExecutionStep, result: Any, execution_results: Dict[str, Any]) -> bool:
         """使用LLM判断轮询是否完成"""
         prompt = f"""
         请判断以下任务结果是否表明任务已完成，无需继续轮询。
@@ -1319,8 +2169,8 @@ class MCPClient:
         
         try:
             response = await create_completion(
-                llm_client=self.llm_client,
-                model=self.model,
+                llm_client=session.llm_client,
+                model=session.model,
                 logger=logger,
                 messages=[
                     {"role": "system", "content": "你是轮询判断专家，能准确判断任务是否已完成"},
@@ -1329,8 +2179,11 @@ class MCPClient:
                 temperature=0.1
             )
             
-            content = response.choices[0].message.content.strip().lower()
-            return "已完成" in content or "完成" in content or "done" in content or "completed" in content
+            content = strip_think(response.choices[0].message.content).strip().lower()
+            # "未完成" 也包含 "完成"，需要先排除
+            if "未完成" in content or "not completed" in content or "incomplete" in content:
+                return False
+            return "完成" in content or "done" in content or "completed" in content
         except Exception as e:
             logger.error(f"使用LLM判断轮询条件出错: {str(e)}")
             return False
@@ -1364,7 +2217,7 @@ class MCPClient:
 
         try:
             prompt = MCP_TOOL_TEST_PROMPT.format(tool_name=tool_name, kwargs=kwargs)
-            llm_client=OpenAI(api_key=api_key,base_url=base_url)
+            llm_client = get_llm_client(api_key=api_key, base_url=base_url)
             tools = [self.tool_manager.convert_tool(tool)]
 
             messages = [
@@ -1398,8 +2251,10 @@ class MCPClient:
                 return f"参数解析失败: {tool_call.function.arguments}"
 
             try:
-                result = await self.tool_executor.execute_tool(tool, tool_name, tool_args)
-                return result
+                result = await self.tool_executor.execute_tool(tool, tool_name, tool_args, use_cache=False)
+                if result.is_error:
+                    return f"测试失败: {TOOL_ERROR_PREFIX}: {result.render()}"
+                return result.render()
             except ToolExecutionError as e:
                 return f"测试失败: {str(e)}"
 
@@ -1410,13 +2265,12 @@ class MCPClient:
     async def cleanup(self):
         """清理客户端资源"""
         try:
+            await self.journal_writer.close()
             if self.tool_manager:
                 await self.tool_manager.close_servers()
 
-            self.llm_client = None
             self.tool_manager = None
             self.tool_executor = None
-            self.result_assessor = None
 
             logger.info("MCPClient 资源清理完成")
         except Exception as e:
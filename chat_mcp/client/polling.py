@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import math
+import random
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from mcp import types
+
+from chat_mcp.utils.get_logger import get_logger
+from config.config import (
+    POLLING_BACKOFF_FACTOR,
+    POLLING_MAX_INTERVAL,
+    POLLING_JITTER,
+    POLLING_TIMER_RESOLUTION
+)
+
+logger = get_logger("Polling")
+
+
+class PollBackoff:
+    """
+    轮询间隔: 从 base 秒开始每次乘以 factor，不超过 max_interval，并加入 ±jitter 比例的随机抖动
+    已知预计完成时间时，不会等待超过预计完成时间
+    """
+    def __init__(self,
+                 base: float,
+                 factor: float = POLLING_BACKOFF_FACTOR,
+                 max_interval: float = POLLING_MAX_INTERVAL,
+                 jitter: float = POLLING_JITTER):
+        self.max_interval = max(max_interval, 0)
+        self.factor = max(factor, 1.0)
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self._current = min(max(base, 0), self.max_interval)
+
+    def next_delay(self, eta: Optional[float] = None) -> float:
+        delay = self._current
+        self._current = min(self._current * self.factor, self.max_interval)
+        if eta is not None:
+            delay = min(delay, eta)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(delay, 0.0)
+
+
+class ProgressTracker:
+    """单个轮询步骤的进度，由服务器推送的MCP进度通知更新"""
+    def __init__(self, token: str):
+        self.token = token
+        self.progress: Optional[float] = None
+        self.total: Optional[float] = None
+        self.updates = 0
+        self.completed = asyncio.Event()
+        self._first: Optional[tuple] = None
+        self._last: Optional[tuple] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.completed.is_set()
+
+    def update(self, progress: float, total: Optional[float] = None) -> None:
+        now = time.monotonic()
+        self.progress = progress
+        self.total = total if total is not None else self.total
+        self.updates += 1
+        if self._first is None:
+            self._first = (now, progress)
+        self._last = (now, progress)
+        if self.total and progress >= self.total:
+            self.completed.set()
+
+    def eta(self) -> Optional[float]:
+        """按进度增长速度估算剩余时间，数据不足时返回None"""
+        if not self.total or not self._first or self._last[0] <= self._first[0]:
+            return None
+        rate = (self._last[1] - self._first[1]) / (self._last[0] - self._first[0])
+        if rate <= 0:
+            return None
+        return max(self.total - self._last[1], 0) / rate - (time.monotonic() - self._last[0])
+
+
+class ProgressRouter:
+    """
+    按 progressToken 把MCP服务器的进度通知分发给对应的轮询步骤
+    handle_message 作为 ClientSession 的 message_handler 使用，所有服务器共用一个实例
+    """
+    def __init__(self):
+        self._trackers: Dict[str, ProgressTracker] = {}
+        self._counter = itertools.count(1)
+
+    @contextmanager
+    def track(self):
+        tracker = ProgressTracker(f"poll-{next(self._counter)}")
+        self._trackers[tracker.token] = tracker
+        try:
+            yield tracker
+        finally:
+            self._trackers.pop(tracker.token, None)
+
+    async def handle_message(self, message) -> None:
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ProgressNotification):
+            params = message.root.params
+            tracker = self._trackers.get(str(params.progressToken))
+            if tracker:
+                tracker.update(params.progress, params.total)
+                logger.debug(f"进度通知 {tracker.token}: {params.progress}/{params.total}")
+        elif isinstance(message, Exception):
+            logger.warning(f"MCP会话收到异常消息: {str(message)}")
+
+
+class PollTimer:
+    """
+    所有轮询步骤共享的定时器(时间轮)
+    到期时间按 resolution 向上对齐到时间槽，每个时间槽只注册一个事件循环定时器，
+    同一时间槽到期的轮询一起唤醒，大量并发轮询不会产生同样数量的定时器和唤醒
+    """
+    def __init__(self, resolution: float = POLLING_TIMER_RESOLUTION):
+        self.resolution = max(resolution, 0.001)
+        self._slots: Dict[int, List[asyncio.Future]] = {}
+        self._handles: Dict[int, asyncio.TimerHandle] = {}
+
+    async def sleep(self, delay: float, wake: Optional[asyncio.Event] = None) -> bool:
+        """等待 delay 秒，wake 被设置时提前结束，返回是否被提前唤醒"""
+        if wake is not None and wake.is_set():
+            return True
+        loop = asyncio.get_running_loop()
+        slot = math.ceil((loop.time() + max(delay, 0)) / self.resolution)
+        future = loop.create_future()
+        self._slots.setdefault(slot, []).append(future)
+        if slot not in self._handles:
+            self._handles[slot] = loop.call_at(slot * self.resolution, self._fire, slot)
+
+        waiter = asyncio.ensure_future(wake.wait()) if wake is not None else None
+        try:
+            if waiter is None:
+                await future
+                return False
+            await asyncio.wait({future, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            return waiter.done() and not future.done()
+        finally:
+            if waiter is not None:
+                waiter.cancel()
+            self._discard(slot, future)
+
+    def _fire(self, slot: int) -> None:
+        self._handles.pop(slot, None)
+        for future in self._slots.pop(slot, []):
+            if not future.done():
+                future.set_result(None)
+
+    def _discard(self, slot: int, future: asyncio.Future) -> None:
+        waiters = self._slots.get(slot)
+        if waiters is None:
+            return
+        if future in waiters:
+            waiters.remove(future)
+        if not waiters:
+            del self._slots[slot]
+            handle = self._handles.pop(slot, None)
+            if handle:
+                handle.cancel()
+
+    def get_metrics(self) -> Dict[str, int]:
+        return {"slots": len(self._slots), "waiters": sum(len(waiters) for waiters in self._slots.values())}
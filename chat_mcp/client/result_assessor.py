@@ -1,26 +1,55 @@
 import json
-import re
+import random
+import asyncio
 from typing import Dict, Any, List
 
 from openai import OpenAI
 
+from chat_mcp.utils.create_completion import create_completion
 from chat_mcp.utils.get_logger import get_logger
+from chat_mcp.utils.json_stream import extract_json
+from chat_mcp.utils.think_filter import strip_think
+from config.config import ASSESSMENT_POLICY, ASSESSMENT_SAMPLE_RATE, ASSESSMENT_TIMEOUT
 
 logger = get_logger("ResultAssessor")
 
+ASSESSMENT_POLICIES = ("always", "sampled", "failures", "off")
+
 class ResultAssessor:
     """工具结果评估器，使用LLM动态评估工具执行是否满足用户需求"""
-    def __init__(self, llm_client: OpenAI, model: str, assessment_timeout: int = 10):
+    def __init__(self,
+                 llm_client: OpenAI,
+                 model: str,
+                 assessment_timeout: int = ASSESSMENT_TIMEOUT,
+                 policy: str = None,
+                 sample_rate: float = ASSESSMENT_SAMPLE_RATE):
         self.llm_client = llm_client
         self.model = model
         self.assessment_timeout = assessment_timeout
+        self.sample_rate = sample_rate
+
+        policy = policy or ASSESSMENT_POLICY
+        if policy not in ASSESSMENT_POLICIES:
+            logger.warning(f"未知的评估策略: {policy}，使用默认策略 {ASSESSMENT_POLICY}")
+            policy = ASSESSMENT_POLICY
+        self.policy = policy
+
+    def should_assess(self, success: bool) -> bool:
+        """根据评估策略判断是否需要评估该步骤，sampled 策略下失败步骤始终评估"""
+        if self.policy == "off":
+            return False
+        if self.policy == "failures":
+            return not success
+        if self.policy == "sampled":
+            return not success or random.random() < self.sample_rate
+        return True
 
     async def assess_tool_result(
             self,
             user_query: str,
             tool_name: str,
             tool_args: Dict[str, Any],
-            result: str,
+            result: Any,
             all_previous_results: List[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """评估单个工具的执行结果"""
@@ -36,6 +65,75 @@ class ResultAssessor:
             
         logger.info(f"工具 {tool_name} 执行结果评估: {assessment}")
         return assessment
+
+    async def assess_group_results(
+            self,
+            user_query: str,
+            step_results: List[Dict[str, Any]]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        在一次LLM调用中评估一组并行步骤的执行结果
+        step_results: [{"step_id", "tool_name", "tool_args", "result", "success"}]
+        返回 {step_id: assessment}
+        """
+        if len(step_results) == 1:
+            item = step_results[0]
+            assessment = await self.assess_tool_result(
+                user_query, item["tool_name"], item["tool_args"], item["result"]
+            )
+            return {item["step_id"]: assessment}
+
+        steps_context = []
+        for item in step_results:
+            steps_context.append(f"步骤ID: {item['step_id']}")
+            steps_context.append(f"工具名称: {item['tool_name']}")
+            steps_context.append(f"输入参数: {json.dumps(item['tool_args'], ensure_ascii=False)}")
+            steps_context.append(f"执行结果: {item['result']}")
+            failed = not item['success'] or getattr(item['result'], "is_error", False)
+            steps_context.append(f"执行状态: {'失败' if failed else '成功'}\n")
+        steps_text = "\n".join(steps_context)
+
+        prompt = f"""
+请分别评估以下并行执行的工具步骤是否满足用户需求。
+
+## 用户问题
+{user_query}
+
+## 并行步骤执行详情
+{steps_text}
+
+## 评估标准
+1. 对比工具参数与用户需求，判断参数是否准确匹配需求
+2. 分析工具结果是否完整解决了对应子任务
+3. 置信度仅基于参数与结果的匹配程度（0.7-1.0）
+
+## 输出要求
+请返回JSON格式，每个步骤一项：
+{{
+    "assessments": [
+        {{
+            "step_id": "步骤ID",
+            "satisfaction_level": "满足全部需求/满足部分需求/不满足需求",
+            "confidence": 0.0-1.0,
+            "reason": "简明说明评估依据"
+        }}
+    ]
+}}
+"""
+        response = await self._get_llm_response(prompt, temperature=0.3)
+        parsed = self._extract_json_from_response(response)
+
+        assessments = {}
+        for item in parsed.get("assessments", []) if isinstance(parsed, dict) else []:
+            if isinstance(item, dict) and item.get("step_id"):
+                assessments[item["step_id"]] = item
+
+        for item in step_results:
+            if item["step_id"] not in assessments:
+                assessments[item["step_id"]] = self._get_default_assessment("解析评估结果失败")
+
+        logger.info(f"并行步骤评估: {assessments}")
+        return assessments
         
     async def assess_final_state(
         self,
@@ -104,7 +202,7 @@ class ResultAssessor:
                 if all_tool_results:
                     last_result = all_tool_results[-1].get("result", "")
                     async_keywords = ["任务ID", "进度", "生成中", "处理中", "等待", "排队中"]
-                    if any(keyword in last_result for keyword in async_keywords):
+                    if any(keyword in str(last_result) for keyword in async_keywords):
                         assessment["need_more_tools"] = True
                         assessment["reason"] = assessment.get("reason", "") + " (检测到异步任务仍在进行中)"
                         logger.info("检测到异步任务标志，设置need_more_tools=True")
@@ -130,19 +228,24 @@ class ResultAssessor:
         ]
 
         try:
-            response = self.llm_client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature
+            response = await asyncio.wait_for(
+                create_completion(
+                    llm_client=self.llm_client,
+                    logger=logger,
+                    model=self.model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=self.assessment_timeout
+                ),
+                timeout=self.assessment_timeout
             )
 
             content = response.choices[0].message.content
-            think_pattern = re.compile(r'</think>(.*)', re.DOTALL)
-            match = think_pattern.search(content)
-            if match:
-                content = match.group(1).strip()
-            return content
-        
+            return strip_think(content)
+
+        except asyncio.TimeoutError:
+            logger.warning(f"评估调用超时(>{self.assessment_timeout}秒)")
+            return ""
         except Exception as e:
             logger.error(f"LLM调用失败: {str(e)}")
             return ""
@@ -152,30 +255,22 @@ class ResultAssessor:
         if not response:
             return {}
             
-        try:
-            return json.loads(response)
-        except json.JSONDecodeError:
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                try:
-                    return json.loads(json_match.group())
-                except json.JSONDecodeError:
-                    logger.warning(f"无法从提取的文本解析JSON: {json_match.group()}")
-                    return {}
-            else:
-                logger.warning(f"无法从响应中提取JSON: {response}")
-                return {}
+        value = extract_json(response, openers="{")
+        if not isinstance(value, dict):
+            logger.warning(f"无法从响应中提取JSON: {response}")
+            return {}
+        return value
 
     def _build_assessment_prompt(
             self,
             user_query: str,
             tool_name: str,
             tool_args: Dict[str, Any],
-            result: str,
+            result: Any,
             all_previous_results: List[Dict[str, Any]] = None
     ) -> str:
         """构建评估提示词"""
-        has_error = "isError=True" in result or "执行出错" in result
+        has_error = getattr(result, "is_error", False) or "执行出错" in str(result)
         
         previous_context = "无"
         if all_previous_results:
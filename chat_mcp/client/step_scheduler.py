@@ -0,0 +1,198 @@
+import asyncio
+from collections import deque
+from typing import Dict, Any, List, Set, Callable, Awaitable, Tuple, AsyncIterator, Optional
+
+from chat_mcp.utils.get_logger import get_logger
+from config.config import MAX_CONCURRENT_STEPS
+
+logger = get_logger("StepScheduler")
+
+StepRunner = Callable[[Any], Awaitable[Tuple[bool, Any, str]]]
+StepListener = Callable[[Any], None]
+
+
+class StepScheduler:
+    """
+    执行计划的事件驱动调度器
+    维护每个步骤尚未完成的依赖，依赖全部完成的步骤立即启动，互不依赖的分支同时执行
+    streaming 模式下计划可以边生成边执行: 通过 add_step() 追加步骤，计划生成结束后调用 close()
+    on_step_started: 可选的回调，步骤实际开始执行(获得并发名额)时调用
+    """
+    def __init__(self, plan, run_step: StepRunner, max_concurrency: int = MAX_CONCURRENT_STEPS, streaming: bool = False):
+        """
+        plan: ExecutionPlan
+        run_step: 执行单个步骤的协程函数，返回 (success, result, error)，需自行记录执行结果
+        max_concurrency: 同时执行的最大步骤数
+        streaming: 为True时计划中的步骤由 add_step() 逐个追加，直到调用 close()
+        """
+        self.plan = plan
+        self.run_step = run_step
+        self.on_step_started: Optional[StepListener] = None
+        self.max_concurrency = max(1, max_concurrency)
+        self.streaming = streaming
+        self._incoming: asyncio.Queue = asyncio.Queue()
+
+    def add_step(self, step) -> None:
+        """向正在生成的计划追加步骤，依赖已满足的步骤会被立即调度"""
+        if not self.streaming:
+            raise RuntimeError("只有 streaming 模式的调度器可以追加步骤")
+        self.plan.add_step(step)
+        self._incoming.put_nowait(step)
+
+    def close(self) -> None:
+        """计划生成结束，不再追加步骤"""
+        if self.streaming:
+            self._incoming.put_nowait(None)
+
+    def find_cycle_steps(self) -> List[str]:
+        """拓扑排序检测循环依赖，返回无法被调度的步骤ID"""
+        pending = {step_id: step for step_id, step in self.plan.steps.items() if not step.executed}
+        in_degree = {
+            step_id: sum(1 for dep in step.depends_on if dep in pending)
+            for step_id, step in pending.items()
+        }
+        dependents = self._build_dependents(pending)
+
+        queue = deque(step_id for step_id, degree in in_degree.items() if degree == 0)
+        visited = set()
+        while queue:
+            step_id = queue.popleft()
+            visited.add(step_id)
+            for dependent in dependents.get(step_id, []):
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+
+        return [step_id for step_id in pending if step_id not in visited]
+
+    @staticmethod
+    def _build_dependents(steps: Dict[str, Any]) -> Dict[str, List[str]]:
+        dependents: Dict[str, List[str]] = {}
+        for step_id, step in steps.items():
+            for dep in step.depends_on:
+                if dep in steps:
+                    dependents.setdefault(dep, []).append(step_id)
+        return dependents
+
+    def _fail_cycle_steps(self, waiting: Dict[str, Set[str]]) -> List[Tuple[Any, bool, Any, str]]:
+        """将存在循环依赖的步骤标记为失败"""
+        failed = []
+        for step_id in self.find_cycle_steps():
+            error = f"步骤 {step_id} 存在循环依赖或依赖了循环中的步骤，无法执行"
+            logger.error(error)
+            waiting.pop(step_id, None)
+            self.plan.update_step_result(step_id, False, None, error)
+            failed.append((self.plan.steps[step_id], False, None, error))
+        return failed
+
+    async def run(self) -> AsyncIterator[Tuple[Any, bool, Any, str]]:
+        """按完成顺序产出 (step, success, result, error)"""
+        waiting: Dict[str, Set[str]] = {}
+        dependents: Dict[str, List[str]] = {}
+        ready = deque()
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        running: Dict[asyncio.Task, Any] = {}
+        incoming_task = None
+        closed = not self.streaming
+
+        def admit(step):
+            unmet = {
+                dep for dep in step.depends_on
+                if not (dep in self.plan.steps and self.plan.steps[dep].executed)
+            }
+            if unmet:
+                waiting[step.step_id] = unmet
+                for dep in unmet:
+                    dependents.setdefault(dep, []).append(step.step_id)
+            else:
+                ready.append(step.step_id)
+
+        def resolve(step_id):
+            for dependent in dependents.pop(step_id, []):
+                unmet = waiting.get(dependent)
+                if unmet is None:
+                    continue
+                unmet.discard(step_id)
+                if not unmet:
+                    del waiting[dependent]
+                    ready.append(dependent)
+
+        def finish_planning():
+            """计划生成结束: 去掉指向不存在步骤的依赖，剩余无法满足的依赖即为循环依赖"""
+            for step_id in list(waiting):
+                step = self.plan.steps[step_id]
+                step.depends_on = [dep for dep in step.depends_on if dep in self.plan.steps]
+                unknown = {dep for dep in waiting[step_id] if dep not in self.plan.steps}
+                for dep in unknown:
+                    resolve(dep)
+            return self._fail_cycle_steps(waiting)
+
+        async def guarded_run(step):
+            async with semaphore:
+                if self.on_step_started:
+                    self.on_step_started(step)
+                try:
+                    return await self.run_step(step)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"步骤 {step.step_id} 执行出错: {str(e)}", exc_info=True)
+                    return False, None, f"执行出错: {str(e)}"
+
+        def launch_ready():
+            while ready:
+                step = self.plan.steps[ready.popleft()]
+                running[asyncio.create_task(guarded_run(step))] = step
+
+        try:
+            # streaming 模式下计划中已有的步骤(如从执行日志恢复的未完成计划)同样参与调度
+            for step in list(self.plan.steps.values()):
+                if not step.executed:
+                    admit(step)
+            if not self.streaming:
+                for item in finish_planning():
+                    yield item
+
+            launch_ready()
+            while running or not closed:
+                waiting_tasks = set(running)
+                if not closed:
+                    if incoming_task is None:
+                        incoming_task = asyncio.ensure_future(self._incoming.get())
+                    waiting_tasks.add(incoming_task)
+                done, _ = await asyncio.wait(waiting_tasks, return_when=asyncio.FIRST_COMPLETED)
+
+                completed = []
+                if incoming_task in done:
+                    new_steps = [incoming_task.result()]
+                    incoming_task = None
+                    while not self._incoming.empty():
+                        new_steps.append(self._incoming.get_nowait())
+                    for step in new_steps:
+                        if step is None:
+                            closed = True
+                        elif not closed:
+                            admit(step)
+                    if closed:
+                        completed.extend(finish_planning())
+
+                for task in done:
+                    if task not in running:
+                        continue
+                    step = running.pop(task)
+                    success, result, error = task.result()
+                    completed.append((step, success, result, error))
+                    resolve(step.step_id)
+
+                launch_ready()
+                for item in completed:
+                    yield item
+        finally:
+            if incoming_task:
+                incoming_task.cancel()
+            for task in running:
+                task.cancel()
+            pending = list(running.keys()) + ([incoming_task] if incoming_task else [])
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,112 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from config.config import (
+    TOOL_CACHE_MAX_ENTRIES,
+    TOOL_CACHE_DEFAULT_TTL,
+    TOOL_CACHE_TTLS
+)
+
+CacheKey = Tuple[str, str, str]
+
+
+class ToolResultCache:
+    """
+    工具结果缓存，按(服务器, 工具, 规范化参数)缓存成功的执行结果
+    LRU淘汰，TTL优先取配置中按工具名/服务器名的设置，其次取工具声明的 cache_ttl，TTL为0表示不缓存
+    """
+    def __init__(self,
+                 max_entries: int = TOOL_CACHE_MAX_ENTRIES,
+                 default_ttl: float = TOOL_CACHE_DEFAULT_TTL,
+                 tool_ttls: Dict[str, float] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.tool_ttls = TOOL_CACHE_TTLS if tool_ttls is None else tool_ttls
+
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._metrics: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def server_name(tool: Dict[str, Any]) -> str:
+        server = tool.get("server")
+        return server.get("name", "") if isinstance(server, dict) else "local"
+
+    @staticmethod
+    def make_key(server_name: str, tool_name: str, tool_args: Dict[str, Any]) -> CacheKey:
+        """参数按键排序后序列化，保证相同参数得到相同的键"""
+        canonical_args = json.dumps(tool_args, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return server_name, tool_name, canonical_args
+
+    def ttl_for(self, tool: Dict[str, Any], tool_name: str) -> float:
+        """获取工具结果的缓存时间(秒)"""
+        if tool_name in self.tool_ttls:
+            return self.tool_ttls[tool_name]
+
+        server_name = self.server_name(tool)
+        if server_name in self.tool_ttls:
+            return self.tool_ttls[server_name]
+
+        declared_ttl = tool.get("cache_ttl")
+        if isinstance(declared_ttl, (int, float)):
+            return declared_ttl
+        return self.default_ttl
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """读取未过期的缓存结果，未命中返回None"""
+        metrics = self._tool_metrics(key[1])
+        entry = self._entries.get(key)
+        if entry is None:
+            metrics["misses"] += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            metrics["misses"] += 1
+            metrics["expired"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        metrics["hits"] += 1
+        return value
+
+    def set(self, key: CacheKey, value: Any, ttl: float) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的结果"""
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            self._tool_metrics(evicted_key[1])["evictions"] += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _tool_metrics(self, tool_name: str) -> Dict[str, int]:
+        if tool_name not in self._metrics:
+            self._metrics[tool_name] = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "bypassed": 0, "coalesced": 0}
+        return self._metrics[tool_name]
+
+    def record_bypass(self, tool_name: str) -> None:
+        self._tool_metrics(tool_name)["bypassed"] += 1
+
+    def record_coalesced(self, tool_name: str) -> None:
+        self._tool_metrics(tool_name)["coalesced"] += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取缓存命中指标"""
+        tools = {name: dict(values) for name, values in self._metrics.items()}
+        hits = sum(values["hits"] for values in tools.values())
+        misses = sum(values["misses"] for values in tools.values())
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "tools": tools
+        }
@@ -1,23 +1,158 @@
 import json
+import time
 import asyncio
 import logging
 from typing import Dict, Any
 
+from mcp.types import (
+    CallToolRequest,
+    CallToolRequestParams,
+    CallToolResult,
+    CancelledNotification,
+    CancelledNotificationParams,
+    ClientNotification,
+    ClientRequest,
+    RequestParams
+)
+
+from .tool_cache import ToolResultCache, CacheKey
+from .tool_result import ToolResult
 from ..error.tool_error import ToolExecutionError
 from ..utils.get_logger import get_logger
+from config.config import TOOL_CACHE_ENABLED, TOOL_CANCEL_NOTIFY_TIMEOUT
 
 logger = get_logger("ToolExecutor")
 
+class _InFlightCall:
+    """正在执行的工具调用，相同调用的后续请求共享同一个任务"""
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
 class ToolExecutor:
     """工具执行器，负责工具的执行和结果处理"""
-    def __init__(self, tool_execution_timeout: int = 30):
+    def __init__(self, tool_execution_timeout: int = 30, cache: ToolResultCache = None):
         """
         初始化工具执行器
         """
         self.tool_execution_timeout = tool_execution_timeout
+        self.cache = cache if cache is not None else (ToolResultCache() if TOOL_CACHE_ENABLED else None)
+        self._inflight: Dict[CacheKey, _InFlightCall] = {}
+
+    async def execute_tool(self,
+                           tool: Dict[str, Any],
+                           tool_name: str,
+                           tool_args: Dict[str, Any],
+                           use_cache: bool = True,
+                           progress_token: str = None) -> ToolResult:
+        """
+        执行工具并返回结果
+        use_cache: 为False时跳过缓存直接调用工具(结果仍会写入缓存)
+        progress_token: 请求服务器推送进度通知时使用的标识，带标识的调用不使用缓存也不与其他调用合并
+        可缓存的工具在执行期间收到相同调用时，共享正在进行的调用而不是重复请求服务器
+        """
+        if not tool or self.cache is None or progress_token is not None:
+            return await self._execute_tool(tool, tool_name, tool_args, progress_token)
+
+        ttl = self.cache.ttl_for(tool, tool_name)
+        if ttl <= 0:
+            return await self._execute_tool(tool, tool_name, tool_args)
+
+        key = self.cache.make_key(self.cache.server_name(tool), tool_name, tool_args)
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                logging.info(f"工具 {tool_name} 命中缓存")
+                return cached
+        else:
+            self.cache.record_bypass(tool_name)
+
+        return await self._execute_shared(key, ttl, tool, tool_name, tool_args)
+
+    async def _execute_shared(self, key: CacheKey, ttl: float, tool: Dict[str, Any], tool_name: str, tool_args: Dict[str, Any]) -> ToolResult:
+        """
+        合并相同的进行中调用: 结果或异常分发给所有等待者
+        单个等待者被取消不影响其他等待者，所有等待者都取消后才取消底层调用
+        """
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _InFlightCall(asyncio.create_task(self._execute_and_store(key, ttl, tool, tool_name, tool_args)))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda task: self._release_flight(key, flight))
+        else:
+            logging.info(f"工具 {tool_name} 合并到进行中的相同调用")
+            self.cache.record_coalesced(tool_name)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 先移除再取消，取消生效前到达的相同调用会重新发起，而不是加入即将取消的任务
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                flight.task.cancel()
+
+    async def _execute_and_store(self, key: CacheKey, ttl: float, tool: Dict[str, Any], tool_name: str, tool_args: Dict[str, Any]) -> ToolResult:
+        """执行合并后的调用，只缓存成功且非空的结果，临时错误不会在整个TTL内返回给所有请求"""
+        result = await self._execute_tool(tool, tool_name, tool_args)
+        if result.is_error or result.is_empty:
+            logging.info(f"工具 {tool_name} 返回错误或空结果，不写入缓存")
+        else:
+            self.cache.set(key, result, ttl)
+        return result
 
-    async def execute_tool(self, tool: Dict[str, Any], tool_name: str, tool_args: Dict[str, Any]) -> str:
-        """执行工具并返回结果"""
+    def _release_flight(self, key: CacheKey, flight: _InFlightCall) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if not flight.task.cancelled():
+            flight.task.exception()
+
+    def get_cache_metrics(self) -> Dict[str, Any]:
+        """获取工具结果缓存指标"""
+        return self.cache.get_metrics() if self.cache is not None else {}
+
+    async def _call_session_tool(self, session, tool_name: str, tool_args: Dict[str, Any], progress_token: str = None):
+        """
+        通过MCP会话调用工具
+        带 progress_token 时在请求的 _meta 中附带进度标识，服务器可以推送进度通知
+        调用被取消(超时或客户端断开)时向服务器发送取消通知，服务器可以停止仍在执行的工具
+        """
+        # 发送请求在第一次让出事件循环之前就会占用当前的请求ID
+        request_id = getattr(session, "_request_id", None)
+        try:
+            if progress_token is None:
+                return await session.call_tool(tool_name, tool_args)
+            request = CallToolRequest(
+                method="tools/call",
+                params=CallToolRequestParams(
+                    name=tool_name,
+                    arguments=tool_args,
+                    _meta=RequestParams.Meta(progressToken=progress_token)
+                )
+            )
+            return await session.send_request(ClientRequest(request), CallToolResult)
+        except asyncio.CancelledError:
+            if request_id is not None:
+                await self._notify_cancelled(session, request_id, tool_name)
+            raise
+
+    @staticmethod
+    async def _notify_cancelled(session, request_id: int, tool_name: str) -> None:
+        notification = ClientNotification(CancelledNotification(
+            method="notifications/cancelled",
+            params=CancelledNotificationParams(requestId=request_id, reason="工具调用已取消")
+        ))
+        try:
+            await asyncio.wait_for(session.send_notification(notification), TOOL_CANCEL_NOTIFY_TIMEOUT)
+            logging.info(f"已通知服务器取消工具调用 {tool_name} (请求ID: {request_id})")
+        except Exception as e:
+            logging.warning(f"发送工具 {tool_name} 的取消通知失败: {str(e)}")
+
+    async def _execute_tool(self, tool: Dict[str, Any], tool_name: str, tool_args: Dict[str, Any], progress_token: str = None) -> ToolResult:
+        """调用工具并返回结果"""
         try:
             logging.debug(f"开始执行工具 {tool_name}，参数: {json.dumps(tool_args, ensure_ascii=False)}")
 
@@ -38,15 +173,15 @@ class ToolExecutor:
                     try:
                         logging.debug(f"调用工具 {tool_name} 的会话对象: {tool['server']['session']}")
                         
-                        result = await tool["server"]["session"].call_tool(tool_name, tool_args)
-                        result_str = str(result)
+                        started = time.perf_counter()
+                        result = await self._call_session_tool(tool["server"]["session"], tool_name, tool_args, progress_token)
+                        tool_result = ToolResult.from_call_tool_result(result, tool_name, time.perf_counter() - started)
                         
-                        if not result_str or result_str.strip() == "" or result_str == "None":
+                        if tool_result.is_empty:
                             logging.warning(f"工具 {tool_name} 执行结果为空")
-                            return f"注意: 工具 {tool_name} 返回了空结果"
                         
-                        logging.info(f"工具 {tool_name} 执行成功")
-                        return result_str
+                        logging.info(f"工具 {tool_name} 执行{'返回错误' if tool_result.is_error else '成功'}, 结果大小: {tool_result.size}字节")
+                        return tool_result
                     except Exception as e:
                         logging.error(f"工具执行期间发生错误: {str(e)}", exc_info=True)
                         raise ToolExecutionError(
@@ -58,10 +193,11 @@ class ToolExecutor:
             elif "execute" in tool:
                 async with asyncio.timeout(self.tool_execution_timeout):
                     try:
+                        started = time.perf_counter()
                         result = await tool["execute"](tool_args)
-                        result_str = self._convert_result_to_string(result)
-                        logging.info(f"工具 {tool_name} 执行成功, 结果长度: {len(result_str)}")
-                        return result_str
+                        tool_result = ToolResult.from_value(result, tool_name, time.perf_counter() - started)
+                        logging.info(f"工具 {tool_name} 执行成功, 结果大小: {tool_result.size}字节")
+                        return tool_result
                     except Exception as e:
                         logging.error(f"工具执行期间发生错误: {str(e)}", exc_info=True)
                         raise ToolExecutionError(
@@ -76,15 +212,15 @@ class ToolExecutor:
                         try:
                             logging.debug(f"调用工具 {tool_name} 的会话对象: {tool['server']['session']}")
                             
-                            result = await tool["server"]["session"].call_tool(tool_name, tool_args)
-                            result_str = str(result)
+                            started = time.perf_counter()
+                            result = await self._call_session_tool(tool["server"]["session"], tool_name, tool_args, progress_token)
+                            tool_result = ToolResult.from_call_tool_result(result, tool_name, time.perf_counter() - started)
                             
-                            if not result_str or result_str.strip() == "" or result_str == "None":
+                            if tool_result.is_empty:
                                 logging.warning(f"工具 {tool_name} 执行结果为空")
-                                return f"注意: 工具 {tool_name} 返回了空结果"
                             
-                            logging.info(f"工具 {tool_name} 执行成功")
-                            return result_str
+                            logging.info(f"工具 {tool_name} 执行{'返回错误' if tool_result.is_error else '成功'}, 结果大小: {tool_result.size}字节")
+                            return tool_result
                         except Exception as e:
                             logging.error(f"工具执行期间发生错误: {str(e)}", exc_info=True)
                             raise ToolExecutionError(
@@ -122,28 +258,3 @@ class ToolExecutor:
                 is_timeout=False,
                 is_recoverable=False
             )
-            
-    def _convert_result_to_string(self, result: Any) -> str:
-        """
-        将结果转换为字符串
-        
-        参数:
-            result: 工具执行结果
-            
-        返回:
-            结果字符串
-        """
-        if result is None:
-            return "执行完成，但没有返回结果"
-            
-        if isinstance(result, str):
-            return result
-            
-        if isinstance(result, (dict, list)):
-            try:
-                return json.dumps(result, ensure_ascii=False, indent=2)
-            except Exception as e:
-                logger.error(f"JSON序列化失败: {str(e)}")
-                return str(result)
-                
-        return str(result)
\ No newline at end of file
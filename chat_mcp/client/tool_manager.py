@@ -6,7 +6,9 @@ from typing import Dict, Any
 
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from .polling import ProgressRouter
 from ..utils.get_logger import get_logger
+from config.config import MCP_SERVER_INIT_TIMEOUT, MCP_LIST_TOOLS_TIMEOUT
 
 logging = get_logger("ToolManager")
 
@@ -23,6 +25,7 @@ class ToolManager:
         self.grouped_tools = {}
         self.similarity_threshold = similarity_threshold
         self._tool_name_cache = {}
+        self.progress_router = ProgressRouter()
         self._tool_name_index = {}
 
     async def initialize_server(self, name: str, config: Dict[str, Any]):
@@ -46,10 +49,10 @@ class ToolManager:
             )
 
             try:
-                async with asyncio.timeout(30):
+                async with asyncio.timeout(MCP_SERVER_INIT_TIMEOUT):
                     stdio_context = stdio_client(server_params)
                     read, write = await stdio_context.__aenter__()
-                    session = ClientSession(read, write)
+                    session = ClientSession(read, write, message_handler=self.progress_router.handle_message)
                     await session.__aenter__()
                     capabilities = await session.initialize()
 
@@ -144,7 +147,7 @@ class ToolManager:
         """
         server_tools = []
         try:
-            async with asyncio.timeout(20):
+            async with asyncio.timeout(MCP_LIST_TOOLS_TIMEOUT):
                 tools_response = await server["session"].list_tools()
 
                 for item in tools_response:
@@ -154,6 +157,7 @@ class ToolManager:
                                 "name": tool.name,
                                 "description": tool.description,
                                 "inputSchema": tool.inputSchema,
+                                "cache_ttl": getattr(tool, "cacheTtl", None),
                                 "server": server
                             })
 
@@ -241,6 +245,7 @@ class ToolManager:
         将工具对象转换为LLM可用的格式
         """
         return {
+            "type": "function",
             "function": {
                 "name": tool['name'],
                 "description": tool['description'],
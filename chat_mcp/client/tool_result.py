@@ -0,0 +1,147 @@
+import hashlib
+import json
+from typing import Dict, Any, List, Optional
+
+
+class BinaryPart:
+    """工具结果中的二进制内容(图片、音频、文件等)，只保留引用和大小，不保留原始数据"""
+    def __init__(self, kind: str, mime_type: str = "", ref: str = "", size: int = 0):
+        self.kind = kind
+        self.mime_type = mime_type
+        self.ref = ref
+        self.size = size
+
+    def render(self) -> str:
+        return f"[{self.kind} {self.mime_type or 'unknown'}, {self.size}字节, {self.ref}]"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "mime_type": self.mime_type, "ref": self.ref, "size": self.size}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BinaryPart':
+        return cls(data.get("kind", ""), data.get("mime_type", ""), data.get("ref", ""), data.get("size", 0))
+
+    @classmethod
+    def from_base64(cls, kind: str, data: str, mime_type: str = "", uri: str = "") -> 'BinaryPart':
+        """根据base64数据创建引用，没有URI时使用内容摘要作为引用"""
+        data = data or ""
+        size = len(data) * 3 // 4 - data[-2:].count("=")
+        ref = uri or "sha256:" + hashlib.sha256(data.encode("ascii", "ignore")).hexdigest()[:16]
+        return cls(kind, mime_type, ref, max(size, 0))
+
+
+class ToolResult:
+    """
+    结构化的工具执行结果
+    保存文本片段、二进制内容引用、isError标记、大小和耗时，只在需要写入提示词或输出时才渲染为文本
+    """
+    def __init__(self,
+                 tool_name: str,
+                 text_parts: List[str] = None,
+                 binary_parts: List[BinaryPart] = None,
+                 is_error: bool = False,
+                 duration: float = 0.0):
+        self.tool_name = tool_name
+        self.text_parts = text_parts or []
+        self.binary_parts = binary_parts or []
+        self.is_error = is_error
+        self.duration = duration
+        self.size = sum(len(text.encode("utf-8")) for text in self.text_parts) + \
+                    sum(part.size for part in self.binary_parts)
+        self._rendered: Optional[str] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not any(text.strip() for text in self.text_parts) and not self.binary_parts
+
+    def render(self, max_chars: int = None) -> str:
+        """渲染为文本，max_chars 限制返回长度"""
+        if self._rendered is None:
+            if self.is_empty:
+                self._rendered = f"注意: 工具 {self.tool_name} 返回了空结果"
+            else:
+                parts = list(self.text_parts) + [part.render() for part in self.binary_parts]
+                self._rendered = "\n".join(parts)
+
+        if max_chars is not None and len(self._rendered) > max_chars:
+            return self._rendered[:max_chars] + f"...(已截断，共{len(self._rendered)}字符)"
+        return self._rendered
+
+    def __str__(self) -> str:
+        return self.render()
+
+    def __repr__(self) -> str:
+        return f"ToolResult(tool_name={self.tool_name!r}, is_error={self.is_error}, size={self.size})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "type": "tool_result",
+            "tool_name": self.tool_name,
+            "text_parts": self.text_parts,
+            "binary_parts": [part.to_dict() for part in self.binary_parts],
+            "is_error": self.is_error,
+            "size": self.size,
+            "duration": self.duration
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ToolResult':
+        return cls(
+            tool_name=data.get("tool_name", ""),
+            text_parts=data.get("text_parts", []),
+            binary_parts=[BinaryPart.from_dict(part) for part in data.get("binary_parts", [])],
+            is_error=data.get("is_error", False),
+            duration=data.get("duration", 0.0)
+        )
+
+    @staticmethod
+    def is_serialized(data: Any) -> bool:
+        return isinstance(data, dict) and data.get("type") == "tool_result"
+
+    @classmethod
+    def from_call_tool_result(cls, result: Any, tool_name: str, duration: float = 0.0) -> 'ToolResult':
+        """从MCP CallToolResult 创建"""
+        text_parts = []
+        binary_parts = []
+
+        for item in getattr(result, "content", None) or []:
+            item_type = getattr(item, "type", "")
+            if item_type == "text":
+                text_parts.append(item.text)
+            elif item_type in ("image", "audio"):
+                binary_parts.append(BinaryPart.from_base64(item_type, item.data, getattr(item, "mimeType", "") or ""))
+            elif item_type == "resource":
+                resource = item.resource
+                uri = str(getattr(resource, "uri", ""))
+                if getattr(resource, "text", None) is not None:
+                    text_parts.append(resource.text)
+                else:
+                    binary_parts.append(BinaryPart.from_base64(
+                        "resource", getattr(resource, "blob", ""), getattr(resource, "mimeType", "") or "", uri
+                    ))
+            else:
+                text_parts.append(str(item))
+
+        return cls(
+            tool_name=tool_name,
+            text_parts=text_parts,
+            binary_parts=binary_parts,
+            is_error=bool(getattr(result, "isError", False)),
+            duration=duration
+        )
+
+    @classmethod
+    def from_value(cls, value: Any, tool_name: str, duration: float = 0.0) -> 'ToolResult':
+        """从本地工具的返回值创建"""
+        if value is None:
+            text = "执行完成，但没有返回结果"
+        elif isinstance(value, str):
+            text = value
+        elif isinstance(value, (dict, list)):
+            try:
+                text = json.dumps(value, ensure_ascii=False, indent=2)
+            except (TypeError, ValueError):
+                text = str(value)
+        else:
+            text = str(value)
+        return cls(tool_name=tool_name, text_parts=[text], duration=duration)
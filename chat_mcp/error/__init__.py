@@ -6,8 +6,10 @@ from .tool_error import (
     ToolCallError,
     ToolExecutionError
 )
+from .placeholder_error import PlaceholderError
 
 __all__ = [
     'ToolCallError',
-    'ToolExecutionError'
+    'ToolExecutionError',
+    'PlaceholderError'
 ]
\ No newline at end of file
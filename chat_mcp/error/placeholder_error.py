@@ -0,0 +1,7 @@
+class PlaceholderError(Exception):
+    """参数中的结构化引用无法在本地解析"""
+
+    def __init__(self, message: str, reference: str = None):
+        self.reference = reference
+        self.message = message
+        super().__init__(message)
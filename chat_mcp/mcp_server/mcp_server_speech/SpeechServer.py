@@ -12,10 +12,10 @@ from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource
 from mcp.shared.exceptions import McpError
 from gradio_client import Client, handle_file
-from openai import OpenAI
 
 from config.config import CHARACTER_AUDIO_MAP, CURRENT_DIR, DEFAULT_OUTPUT_DIR, DEFAULT_SERVER_URL, URL_PORT
 from chat_mcp.utils.get_logger import get_logger
+from chat_mcp.utils.llm_client_pool import get_llm_client
 
 _client = None
 
@@ -71,7 +71,7 @@ class AudioGenerator:
 
     async def clean_data(self, text: str) -> str:          
         try:
-            llm_client = OpenAI(api_key=self.llm_key, base_url=self.llm_url)
+            llm_client = get_llm_client(api_key=self.llm_key, base_url=self.llm_url)
             
             cleaning_prompt = """请清理以下文本，使其更适合语音合成使用:
 
@@ -263,6 +263,7 @@ async def serve(server_url: str = None,
                     },
                     "required": ["speech_character", "text_prompt"],
                 },
+                cacheTtl=0,
             )
         ]
 
@@ -1,8 +1,6 @@
 import json
 import os
-import re
 from typing import Any, Dict, List, Optional, Sequence
-from openai import OpenAI
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
@@ -10,6 +8,8 @@ from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource, ErrorDa
 from mcp.shared.exceptions import McpError
 
 from chat_mcp.utils.get_project_root import get_project_root
+from chat_mcp.utils.llm_client_pool import get_llm_client
+from chat_mcp.utils.think_filter import strip_think
 
 
 class SummaryServer:
@@ -67,7 +67,7 @@ class SummaryServer:
                 return f"错误: 未找到任何可用的摘要风格"
                 
         try:
-            llm_client = OpenAI(api_key=self.llm_key, base_url=self.llm_url)
+            llm_client = get_llm_client(api_key=self.llm_key, base_url=self.llm_url)
             
             messages = [
                 {"role": "system", "content": "你是一个专业的内容摘要助手，擅长以各种风格总结文本。"},
@@ -81,12 +81,7 @@ class SummaryServer:
 
             content = response.choices[0].message.content
 
-            think_pattern = re.compile(r'</think>(.*)', re.DOTALL)
-            match = think_pattern.search(content)
-            if match:
-                content = match.group(1).strip()
-            
-            return content
+            return strip_think(content)
             
         except Exception as e:
             print(f"LLM调用错误: {str(e)}")
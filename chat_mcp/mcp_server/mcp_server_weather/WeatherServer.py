@@ -271,6 +271,7 @@ async def serve(api_key: str = None):
                     },
                     "required": ["city"],
                 },
+                cacheTtl=600,
             ),
             Tool(
                 name="get_multi_city_weather",
@@ -288,6 +289,7 @@ async def serve(api_key: str = None):
                     },
                     "required": ["cities"],
                 },
+                cacheTtl=600,
             )
         ]
 
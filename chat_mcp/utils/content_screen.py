@@ -0,0 +1,40 @@
+import re
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from chat_mcp.utils.poll_condition import evaluate_completion
+from config.config import FINAL_CHECK_BLOCKED_PATTERNS, FINAL_CHECK_INCOMPLETE_PATTERNS
+
+
+@lru_cache(maxsize=8)
+def _compile_patterns(patterns: Tuple[str, ...]):
+    """将屏蔽规则合并为一个正则，只在规则变化时重新编译"""
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+
+def screen_text(text: str, patterns=None) -> Optional[str]:
+    """
+    本地内容筛查，命中屏蔽规则时返回命中的内容，否则返回None
+    patterns: 关键词或正则列表，默认使用配置中的 FINAL_CHECK_BLOCKED_PATTERNS
+    """
+    compiled = _compile_patterns(tuple(FINAL_CHECK_BLOCKED_PATTERNS if patterns is None else patterns))
+    if compiled is None or not text:
+        return None
+    match = compiled.search(text)
+    return match.group(0) if match else None
+
+
+def incomplete_reason(text: str, patterns=None) -> Optional[str]:
+    """
+    判断结果是否不完整，不完整时返回原因，否则返回None
+    结果中的状态字段表明任务仍在进行或已失败，或命中 FINAL_CHECK_INCOMPLETE_PATTERNS 时视为不完整
+    """
+    if not text or not text.strip():
+        return "结果为空"
+    verdict = evaluate_completion(text)
+    if verdict is not None and verdict is not True:
+        return "结果状态表明任务未完成"
+    matched = screen_text(text, FINAL_CHECK_INCOMPLETE_PATTERNS if patterns is None else patterns)
+    return f"命中不完整规则({matched})" if matched is not None else None
@@ -1,29 +1,142 @@
 import asyncio
+import threading
+import weakref
 
-async def create_stream_completion(llm_client, logger, model,**kwargs):
-    """创建流式完成，返回一个异步生成器"""
-    try:
-        response_stream = llm_client.chat.completions.create(
-            model=model,
-            stream=True,
-            **kwargs
-        )
+from config.config import LLM_STREAM_BUFFER_SIZE
+
+_STREAM_END = object()
+
+
+class _StreamError:
+    """读取线程中出现的异常，转交给事件循环一侧抛出"""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _StreamReader:
+    """
+    读取线程持有的状态，不引用迭代器本身
+    迭代器被丢弃且未调用 aclose() 时，其终结回调仍能通知读取线程退出并关闭上游连接
+    """
+    def __init__(self, stream, loop, queue: asyncio.Queue, max_buffer: int):
+        self.stream = stream
+        self.loop = loop
+        self.queue = queue
+        self.slots = threading.Semaphore(max_buffer)
+        self.closed = threading.Event()
+
+    def read(self):
+        """读取线程：逐块读取上游响应并放入队列"""
+        try:
+            for chunk in self.stream:
+                if not self.put(chunk):
+                    return
+            self.put(_STREAM_END)
+        except Exception as e:
+            if not self.closed.is_set():
+                self.put(_StreamError(e))
+        finally:
+            self.close_stream()
+
+    def put(self, item) -> bool:
+        """等待队列空位后投递，已关闭时返回False"""
+        while not self.slots.acquire(timeout=0.5):
+            if self.closed.is_set():
+                return False
+        if self.closed.is_set():
+            return False
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+            return True
+        except RuntimeError:
+            self.closed.set()
+            return False
+
+    def close(self):
+        """通知读取线程停止，并唤醒等待队列空位的读取线程"""
+        self.closed.set()
+        self.slots.release()
+
+    def close_stream(self):
+        _close_quietly(self.stream)
 
-        class AsyncIteratorWrapper:
-            def __init__(self, obj):
-                    self._it = iter(obj)
 
-            def __aiter__(self):
-                    return self
+class AsyncStreamIterator:
+    """
+    将同步流式响应交给独立读取线程消费，通过有界队列转为异步迭代器
+    读取线程在缓冲区满时阻塞(背压)，调用 aclose()、消费方被取消或迭代器被回收时关闭上游连接
+    """
+    def __init__(self, stream, max_buffer: int = LLM_STREAM_BUFFER_SIZE):
+        self._queue = asyncio.Queue()
+        self._reader = _StreamReader(stream, asyncio.get_running_loop(), self._queue, max_buffer)
+        self._closed = self._reader.closed
+        # 消费方未调用 aclose() 就丢弃迭代器时，由终结回调让读取线程退出
+        self._finalizer = weakref.finalize(self, self._reader.close)
+        self._thread = threading.Thread(target=self._reader.read, name="llm-stream-reader", daemon=True)
+        self._thread.start()
 
-            async def __anext__(self):
-                try:
-                    value = next(self._it)
-                    return value
-                except StopIteration:
-                    raise StopAsyncIteration
+    def __aiter__(self):
+        return self
 
-        return AsyncIteratorWrapper(response_stream)
+    async def __anext__(self):
+        if self._closed.is_set() and self._queue.empty():
+            raise StopAsyncIteration
+        try:
+            item = await self._queue.get()
+        except asyncio.CancelledError:
+            await self.aclose()
+            raise
+        self._reader.slots.release()
+
+        if item is _STREAM_END:
+            self._closed.set()
+            raise StopAsyncIteration
+        if isinstance(item, _StreamError):
+            self._closed.set()
+            raise item.error
+        return item
+
+    async def aclose(self):
+        """取消流式读取并关闭上游连接"""
+        if self._closed.is_set():
+            return
+        self._finalizer.detach()
+        self._reader.close()
+        await asyncio.to_thread(self._reader.close_stream)
+
+
+def _close_quietly(stream) -> None:
+    close = getattr(stream, "close", None)
+    if close:
+        try:
+            close()
+        except Exception:
+            pass
+
+
+def _close_abandoned_stream(request: asyncio.Future) -> None:
+    """请求已被取消但连接随后建立成功时，在线程中关闭这个无人读取的响应"""
+    if request.cancelled() or request.exception() is not None:
+        return
+    request.get_loop().run_in_executor(None, _close_quietly, request.result())
+
+
+async def create_stream_completion(llm_client, logger, model, **kwargs):
+    """创建流式完成，返回一个异步迭代器"""
+    try:
+        request = asyncio.ensure_future(asyncio.to_thread(
+            llm_client.chat.completions.create,
+            model=model,
+            stream=True,
+            **kwargs
+        ))
+        try:
+            response_stream = await asyncio.shield(request)
+        except asyncio.CancelledError:
+            # 建立连接的线程无法中断，连接建立后立即关闭，不再读取响应
+            request.add_done_callback(_close_abandoned_stream)
+            raise
+        return AsyncStreamIterator(response_stream)
     except Exception as e:
         logger.error(f"流式API调用失败: {str(e)}")
         raise
@@ -38,4 +151,4 @@ async def create_completion(llm_client, logger, model, **kwargs):
         )
     except Exception as e:
         logger.error(f"API调用失败: {str(e)}")
-        raise
\ No newline at end of file
+        raise
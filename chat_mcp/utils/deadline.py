@@ -0,0 +1,81 @@
+import asyncio
+import math
+import time
+from typing import AsyncIterator, Awaitable, Optional, TypeVar
+
+from config.config import REQUEST_TIMEOUT, REQUEST_TIMEOUT_MAX, DEADLINE_ANSWER_RESERVE, DEADLINE_ANSWER_RESERVE_RATIO
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """
+    单个请求的截止时间
+    各阶段从剩余时间中取得自己的时间预算，并为后续阶段保留 reserve 秒，剩余时间不足时由调用方跳过可选阶段
+    timeout 为 None 或不大于0时不限制
+    requested: 时间预算是否由客户端指定，默认预算只限制工具路由、规划和执行，不限制直接回答
+    """
+    def __init__(self, timeout: Optional[float] = None, requested: bool = False):
+        self.timeout = timeout if timeout and timeout > 0 else None
+        self.requested = requested and self.timeout is not None
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.timeout if self.timeout else None
+
+    @classmethod
+    def from_request(cls, requested: Optional[float] = None) -> 'Deadline':
+        """客户端指定的时间预算，未指定时使用默认值，都不超过 REQUEST_TIMEOUT_MAX"""
+        is_requested = bool(requested and requested > 0)
+        timeout = requested if is_requested else REQUEST_TIMEOUT
+        if REQUEST_TIMEOUT_MAX and REQUEST_TIMEOUT_MAX > 0:
+            timeout = min(timeout, REQUEST_TIMEOUT_MAX) if timeout and timeout > 0 else REQUEST_TIMEOUT_MAX
+        return cls(timeout, requested=is_requested)
+
+    def for_answer(self) -> 'Deadline':
+        """直接回答使用的截止时间: 客户端指定了时间预算时沿用，否则不限制"""
+        return self if self.requested else Deadline()
+
+    @property
+    def answer_reserve(self) -> float:
+        """为最终回答保留的时间，不超过 DEADLINE_ANSWER_RESERVE，也不超过总预算的 DEADLINE_ANSWER_RESERVE_RATIO"""
+        if self.timeout is None:
+            return DEADLINE_ANSWER_RESERVE
+        return min(DEADLINE_ANSWER_RESERVE, self.timeout * DEADLINE_ANSWER_RESERVE_RATIO)
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, seconds: float) -> bool:
+        """剩余时间是否还够 seconds 秒"""
+        return self.remaining() >= seconds
+
+    def budget(self, timeout: Optional[float] = None, reserve: float = 0) -> Optional[float]:
+        """阶段可用的时间: 不超过阶段自身的 timeout，并为后续阶段保留 reserve 秒，不限制时返回None"""
+        available = self.remaining() - reserve
+        if math.isinf(available):
+            return timeout
+        available = max(available, 0.0)
+        return available if timeout is None else min(timeout, available)
+
+    async def within(self, awaitable: Awaitable[T], timeout: Optional[float] = None, reserve: float = 0) -> T:
+        """在时间预算内等待，超出时取消并抛出 TimeoutError"""
+        async with asyncio.timeout(self.budget(timeout, reserve)):
+            return await awaitable
+
+    async def iterate(self, iterator: AsyncIterator[T], reserve: float = 0) -> AsyncIterator[T]:
+        """
+        在时间预算内逐块读取，超出时抛出 TimeoutError
+        每次等待下一块时按剩余时间计时，产出期间不计时，超时不会取消到消费方
+        """
+        while True:
+            async with asyncio.timeout(self.budget(reserve=reserve)):
+                try:
+                    item = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+            yield item
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from chat_mcp.utils.get_logger import get_logger
+from config.config import (
+    JOURNAL_FLUSH_INTERVAL,
+    JOURNAL_BATCH_SIZE,
+    JOURNAL_FSYNC,
+    JOURNAL_RETENTION_DAYS,
+    JOURNAL_MAX_TOTAL_MB
+)
+
+logger = get_logger("Journal")
+
+JOURNAL_SUFFIX = ".jsonl"
+
+
+def journal_file_name(user_query: str) -> str:
+    """按问题摘要和时间生成日志文件名，不直接使用问题文本(过长或含特殊字符时无法作为文件名)"""
+    digest = hashlib.sha256((user_query or "").encode("utf-8")).hexdigest()[:16]
+    return f"{digest}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}{JOURNAL_SUFFIX}"
+
+
+def read_journal(path: str) -> List[Dict[str, Any]]:
+    """读取执行日志，跳过无法解析的行(如进程中断时写了一半的最后一行)"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"执行日志 {path} 第 {line_number} 行不完整，已跳过")
+    return records
+
+
+def cleanup_journals(directory: str,
+                     max_age_days: float = JOURNAL_RETENTION_DAYS,
+                     max_total_mb: float = JOURNAL_MAX_TOTAL_MB,
+                     keep: Set[str] = None) -> int:
+    """
+    清理日志目录: 删除超过保留天数的文件，总大小超过上限时从最旧的文件开始删除
+    keep 中的文件(正在写入的日志)不会被删除，返回删除的文件数
+    """
+    keep = {os.path.abspath(path) for path in (keep or set())}
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and os.path.abspath(entry.path) not in keep:
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    now = time.time()
+    total = sum(size for _, size, _ in files)
+    max_total = max_total_mb * 1024 * 1024 if max_total_mb and max_total_mb > 0 else None
+    removed = 0
+    for mtime, size, path in files:
+        expired = max_age_days and max_age_days > 0 and now - mtime > max_age_days * 86400
+        oversized = max_total is not None and total > max_total
+        if not expired and not oversized:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+        except OSError as e:
+            logger.warning(f"删除执行日志 {path} 失败: {str(e)}")
+    if removed:
+        logger.info(f"已清理 {removed} 个执行日志文件")
+    return removed
+
+
+class ExecutionJournal:
+    """单个工作流的执行日志，每条记录是一行紧凑的JSON，只追加不重写"""
+    def __init__(self, path: str, writer: 'JournalWriter'):
+        self.path = path
+        self._writer = writer
+
+    def append(self, event: str, **data) -> None:
+        """追加一条记录，不等待写入"""
+        record = {"ts": round(time.time(), 3), "event": event, **data}
+        self._writer.write(self.path, json.dumps(record, ensure_ascii=False, default=str))
+
+    async def close(self) -> None:
+        """写入尚未落盘的记录"""
+        await self._writer.flush(self.path)
+        self._writer.release(self.path)
+
+
+class JournalWriter:
+    """
+    执行日志的后台批量写入器，所有日志共用
+    记录先进入内存，每 flush_interval 秒或积累 batch_size 条后在线程中批量追加写入，不阻塞事件循环
+    fsync: always(每条记录立即写入并fsync)/batch(每批写入后fsync)/never(由操作系统决定落盘时间)
+    """
+    def __init__(self,
+                 flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 batch_size: int = JOURNAL_BATCH_SIZE,
+                 fsync: str = JOURNAL_FSYNC):
+        self.flush_interval = max(flush_interval, 0.0)
+        self.batch_size = 1 if fsync == "always" else max(batch_size, 1)
+        self.fsync = fsync
+        self._pending: Dict[str, List[str]] = {}
+        self._pending_count = 0
+        self._active: Dict[str, int] = {}
+        self._tail_checked: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._metrics = {"records": 0, "batches": 0, "bytes": 0, "errors": 0}
+
+    def open(self, path: str) -> ExecutionJournal:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._active[path] = self._active.get(path, 0) + 1
+        return ExecutionJournal(path, self)
+
+    def release(self, path: str) -> None:
+        count = self._active.get(path, 0) - 1
+        if count > 0:
+            self._active[path] = count
+        else:
+            self._active.pop(path, None)
+            self._tail_checked.discard(path)
+
+    @property
+    def active_paths(self) -> Set[str]:
+        return set(self._active)
+
+    def write(self, path: str, line: str) -> None:
+        self._pending.setdefault(path, []).append(line)
+        self._pending_count += 1
+        self._metrics["records"] += 1
+        self._ensure_started()
+        if self._pending_count >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval or None)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # 后台任务被取消时，已经开始的批量写入继续完成
+            await asyncio.shield(self.flush())
+
+    async def flush(self, path: str = None) -> None:
+        """
+        写入待写记录，指定 path 时只写入该日志
+        先等待正在进行的批量写入完成，返回时之前追加的记录都已写入文件
+        """
+        if self._lock is None:
+            return
+        async with self._lock:
+            if path is None:
+                batch, self._pending = self._pending, {}
+            elif path in self._pending:
+                batch = {path: self._pending.pop(path)}
+            else:
+                return
+            self._pending_count -= sum(len(lines) for lines in batch.values())
+            await asyncio.to_thread(self._write_batch, batch)
+
+    def _terminate_tail(self, path: str) -> str:
+        """第一次追加写入已有文件时检查结尾，上次中断留下的半行先换行结束，不与新记录连在一起"""
+        if path in self._tail_checked:
+            return ""
+        self._tail_checked.add(path)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return ""
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return "" if f.read(1) == b"\n" else "\n"
+
+    def _write_batch(self, batch: Dict[str, List[str]]) -> None:
+        for path, lines in batch.items():
+            try:
+                data = self._terminate_tail(path) + "".join(line + "\n" for line in lines)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(data)
+                    if self.fsync in ("always", "batch"):
+                        f.flush()
+                        os.fsync(f.fileno())
+                self._metrics["batches"] += 1
+                self._metrics["bytes"] += len(data.encode("utf-8"))
+            except OSError as e:
+                self._metrics["errors"] += 1
+                logger.error(f"写入执行日志 {path} 失败: {str(e)}")
+
+    async def close(self) -> None:
+        """停止后台任务并写入所有待写记录，等待正在进行的批量写入完成"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {**self._metrics, "pending": self._pending_count, "active": len(self._active)}
@@ -0,0 +1,267 @@
+import json
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+_ARRAY_KEY_TEMPLATE = r'"{key}"\s*:\s*\['
+_BRACKET_PAIRS = {"{": "}", "[": "]"}
+_CODE_FENCE = "```"
+# 括号后第一个非空白字符，用于快速排除 {城市}、[注意] 这类普通文本
+_VALUE_STARTS = {"{": '"}', "[": '"{[]-0123456789tfn'}
+# 可能开始JSON的起点，\Z 表示括号在文本结尾、需要等待后续分块判断
+_START_PATTERNS = {"{": r'\{\s*(?:["}]|\Z)', "[": r'\[\s*(?:["{\[\]\-0-9tfn]|\Z)'}
+_NON_SPACE_PATTERN = re.compile(r'\S')
+_STRING_SPECIAL_PATTERN = re.compile(r'["\\]')
+_STRUCTURAL_PATTERN = re.compile(r'[{}\[\]"]')
+
+
+class IncrementalArrayParser:
+    """
+    增量解析流式JSON文本中指定键对应的对象数组
+    每当数组中的一个对象闭合时立即解析并返回，无需等待完整响应
+    """
+    def __init__(self, key: str = "steps"):
+        self._key_pattern = re.compile(_ARRAY_KEY_TEMPLATE.format(key=re.escape(key)))
+        self._key_token = f'"{key}"'
+        # 键已出现但数组还没开始(后面只有空白和冒号)
+        self._key_pending_pattern = re.compile(rf'"{re.escape(key)}"\s*(?::\s*)?\Z')
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = -1
+
+    @property
+    def finished(self) -> bool:
+        """数组是否已经闭合"""
+        return self._finished
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """追加文本，返回本次新闭合的对象列表"""
+        if self._finished or not text:
+            return []
+        self._buffer += text
+
+        if not self._in_array:
+            match = self._key_pattern.search(self._buffer, self._pos)
+            if not match:
+                self._skip_preamble()
+                return []
+            self._in_array = True
+            self._pos = match.end()
+
+        items = []
+        buffer = self._buffer
+        for index in range(self._pos, len(buffer)):
+            char = buffer[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = index
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._parse_object(buffer[self._object_start:index + 1])
+                    if item is not None:
+                        items.append(item)
+            elif char == "]" and self._depth == 0:
+                self._finished = True
+                break
+
+        # 只保留尚未闭合的对象文本
+        if self._depth > 0:
+            self._buffer = buffer[self._object_start:]
+            self._object_start = 0
+        else:
+            self._buffer = ""
+        self._pos = len(self._buffer)
+        return items
+
+    def _skip_preamble(self) -> None:
+        """
+        没有找到数组键时丢弃前言，只保留结尾可能属于数组键的部分
+        长推理前言不会在每个分块被重复扫描和复制
+        """
+        buffer = self._buffer
+        keep = max(len(buffer) - len(self._key_token) + 1, 0)
+        key_at = buffer.rfind(self._key_token)
+        if key_at != -1 and self._key_pending_pattern.match(buffer, key_at):
+            keep = min(keep, key_at)
+        self._buffer = buffer[keep:]
+        self._pos = 0
+
+    @staticmethod
+    def _parse_object(text: str):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
+
+
+class JsonValueScanner:
+    """
+    单遍扫描文本，查找第一个能解析的JSON对象或数组，支持一次传入完整文本或分块传入流式文本
+    只在括号内跟踪字符串状态，字符串中的括号不影响配对；起点括号后的第一个字符不可能开始JSON时立即放弃该起点，
+    外层候选解析失败时依次尝试它的第一层子值
+    openers: 可以作为起点的括号，"{" 表示只查找对象
+    """
+    def __init__(self, openers: str = "{["):
+        self.openers = openers
+        self._start_pattern = re.compile("|".join(_START_PATTERNS[opener] for opener in openers))
+        self._buffer = ""
+        self._pos = 0
+        self._stack: List[Tuple[str, int]] = []
+        self._children: List[Tuple[int, int]] = []
+        self._in_string = False
+        self._escape = False
+        self._checking_start = False
+        self.found = False
+        self.value: Any = None
+
+    def feed(self, text: str) -> bool:
+        """追加文本，找到JSON后返回True，之后的文本不再处理"""
+        if self.found or not text:
+            return self.found
+        buffer = self._buffer + text
+        stack = self._stack
+        index = self._pos
+        length = len(buffer)
+
+        # 用正则直接跳到下一个有意义的字符，普通文本不逐字符处理
+        while index < length:
+            if not stack:
+                match = self._start_pattern.search(buffer, index)
+                if not match:
+                    index = length
+                    break
+                index = match.start()
+                stack.append((buffer[index], index))
+                self._children = []
+                self._checking_start = True
+                index += 1
+                continue
+
+            if self._checking_start:
+                match = _NON_SPACE_PATTERN.search(buffer, index)
+                if not match:
+                    index = length
+                    break
+                index = match.start()
+                self._checking_start = False
+                if buffer[index] not in _VALUE_STARTS[stack[0][0]]:
+                    # 不是JSON，从当前字符重新查找起点
+                    stack.clear()
+                    continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    index += 1
+                    continue
+                match = _STRING_SPECIAL_PATTERN.search(buffer, index)
+                if not match:
+                    index = length
+                    break
+                index = match.start()
+                if buffer[index] == "\\":
+                    self._escape = True
+                else:
+                    self._in_string = False
+                index += 1
+                continue
+
+            match = _STRUCTURAL_PATTERN.search(buffer, index)
+            if not match:
+                index = length
+                break
+            index = match.start()
+            char = buffer[index]
+            if char == '"':
+                self._in_string = True
+            elif char in _BRACKET_PAIRS:
+                stack.append((char, index))
+            else:
+                opener, start = stack.pop()
+                if _BRACKET_PAIRS[opener] != char:
+                    # 括号不配对，放弃当前候选
+                    if self._abandon(buffer):
+                        return True
+                elif not stack:
+                    if self._try_parse(buffer[start:index + 1]) or self._abandon(buffer):
+                        return True
+                elif len(stack) == 1:
+                    self._children.append((start, index + 1))
+            index += 1
+
+        # 只保留尚未闭合的候选文本
+        base = stack[0][1] if stack else index
+        self._buffer = buffer[base:]
+        self._pos = index - base
+        self._stack = [(opener, start - base) for opener, start in stack]
+        self._children = [(start - base, end - base) for start, end in self._children]
+        return False
+
+    def _try_parse(self, text: str) -> bool:
+        try:
+            # strict=False 允许字符串中出现未转义的换行等控制字符
+            self.value = json.loads(text, strict=False)
+        except json.JSONDecodeError:
+            return False
+        self.found = True
+        self._buffer = ""
+        return True
+
+    def _abandon(self, buffer: str) -> bool:
+        """外层候选无效时尝试其第一层子值，然后从下一个字符继续查找"""
+        for start, end in self._children:
+            if buffer[start] in _BRACKET_PAIRS and self._try_parse(buffer[start:end]):
+                return True
+        self._stack.clear()
+        self._children = []
+        self._in_string = False
+        self._escape = False
+        self._checking_start = False
+        return False
+
+
+def _fenced_blocks(text: str) -> List[str]:
+    """获取 ``` 代码块中的内容"""
+    blocks = []
+    start = text.find(_CODE_FENCE)
+    while start != -1:
+        end = text.find(_CODE_FENCE, start + len(_CODE_FENCE))
+        if end == -1:
+            blocks.append(text[start + len(_CODE_FENCE):])
+            break
+        blocks.append(text[start + len(_CODE_FENCE):end])
+        start = text.find(_CODE_FENCE, end + len(_CODE_FENCE))
+    return blocks
+
+
+def extract_json(text: str, openers: str = "{[") -> Optional[Any]:
+    """
+    从完整文本中提取第一个能解析的JSON对象或数组，优先取代码块中的内容，找不到时返回None
+    """
+    if not text:
+        return None
+    for block in _fenced_blocks(text) if _CODE_FENCE in text else []:
+        scanner = JsonValueScanner(openers)
+        if scanner.feed(block):
+            return scanner.value
+    scanner = JsonValueScanner(openers)
+    scanner.feed(text)
+    return scanner.value if scanner.found else None
@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Any, Iterator, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
+from openai import OpenAI
+
+from config.config import (
+    LLM_POOL_MAX_CONNECTIONS,
+    LLM_POOL_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_POOL_KEEPALIVE_EXPIRY,
+    LLM_CLIENT_IDLE_TIMEOUT
+)
+from chat_mcp.utils.get_logger import get_logger
+
+logger = get_logger("LLMClientPool")
+
+# 与 OpenAI SDK 一致: 未指定 base_url 时使用环境变量 OPENAI_BASE_URL，否则使用官方地址
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+
+class _ClientUsage:
+    """客户端的使用情况: 进行中的请求数(流式响应关闭后才结束)和最后使用时间"""
+    def __init__(self):
+        self.active = 0
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def touch(self) -> None:
+        with self._lock:
+            self.last_used = time.monotonic()
+
+    def begin(self) -> None:
+        with self._lock:
+            self.active += 1
+            self.last_used = time.monotonic()
+
+    def end(self) -> None:
+        with self._lock:
+            self.active -= 1
+            self.last_used = time.monotonic()
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    """响应体关闭时结束计数，流式响应读完或被关闭前客户端都算在使用中"""
+    def __init__(self, stream: httpx.SyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close: Optional[Callable[[], None]] = on_close
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if self._on_close:
+                on_close, self._on_close = self._on_close, None
+                on_close()
+
+
+class _UsageTrackingTransport(httpx.BaseTransport):
+    """记录经过的请求，闲置回收时跳过仍有请求或响应未关闭的客户端"""
+    def __init__(self, transport: httpx.HTTPTransport, usage: _ClientUsage):
+        self.transport = transport
+        self._usage = usage
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._usage.begin()
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            self._usage.end()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, self._usage.end),
+            extensions=response.extensions
+        )
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class _PooledClient:
+    def __init__(self, client: OpenAI, http_client: httpx.Client, transport: httpx.HTTPTransport,
+                 provider: str, usage: _ClientUsage):
+        self.client = client
+        self.http_client = http_client
+        self.transport = transport
+        self.provider = provider
+        self.usage = usage
+        self.created_at = time.monotonic()
+
+
+class LLMClientPool:
+    """进程级LLM客户端注册表，按(base_url, api_key)复用客户端及其长连接"""
+    def __init__(self,
+                 max_connections: int = LLM_POOL_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = LLM_POOL_MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry: float = LLM_POOL_KEEPALIVE_EXPIRY,
+                 idle_timeout: float = LLM_CLIENT_IDLE_TIMEOUT):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.idle_timeout = idle_timeout
+
+        self._clients: Dict[Tuple[str, str], _PooledClient] = {}
+        self._metrics: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, api_key: str, base_url: Optional[str]) -> OpenAI:
+        """获取(或创建)指定服务商的客户端，未指定 base_url 时使用 OpenAI SDK 的默认地址"""
+        base_url = base_url or os.environ.get("OPENAI_BASE_URL") or DEFAULT_BASE_URL
+        key = (base_url.rstrip("/"), api_key)
+        provider = urlparse(base_url).netloc or base_url
+
+        with self._lock:
+            self._evict_idle()
+
+            entry = self._clients.get(key)
+            if entry:
+                entry.usage.touch()
+                self._provider_metrics(provider)["client_reuses"] += 1
+                return entry.client
+
+            usage = _ClientUsage()
+            transport = httpx.HTTPTransport(limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ))
+            http_client = httpx.Client(
+                transport=_UsageTrackingTransport(transport, usage),
+                timeout=httpx.Timeout(600.0, connect=10.0),
+                event_hooks={"request": [self._request_hook(provider)]}
+            )
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            self._clients[key] = _PooledClient(client, http_client, transport, provider, usage)
+            self._provider_metrics(provider)["clients_created"] += 1
+            logger.info(f"创建LLM客户端: {provider}")
+            return client
+
+    def _request_hook(self, provider: str):
+        def on_request(request: httpx.Request):
+            with self._lock:
+                self._provider_metrics(provider)["requests"] += 1
+        return on_request
+
+    def _provider_metrics(self, provider: str) -> Dict[str, int]:
+        """获取服务商的指标计数，调用方需持有锁"""
+        if provider not in self._metrics:
+            self._metrics[provider] = {
+                "clients_created": 0,
+                "client_reuses": 0,
+                "clients_evicted": 0,
+                "requests": 0
+            }
+        return self._metrics[provider]
+
+    def _evict_idle(self) -> None:
+        """回收闲置超时的客户端，仍有进行中的请求(包括未读完的流式响应)的客户端不回收，调用方需持有锁"""
+        now = time.monotonic()
+        expired = [
+            key for key, entry in self._clients.items()
+            if entry.usage.active == 0 and now - entry.usage.last_used > self.idle_timeout
+        ]
+        for key in expired:
+            entry = self._clients.pop(key)
+            self._provider_metrics(entry.provider)["clients_evicted"] += 1
+            try:
+                entry.http_client.close()
+            except Exception as e:
+                logger.warning(f"关闭闲置客户端 {entry.provider} 出错: {str(e)}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """获取各服务商的连接指标"""
+        with self._lock:
+            metrics = {provider: dict(values) for provider, values in self._metrics.items()}
+            for provider in metrics:
+                metrics[provider]["active_clients"] = 0
+                metrics[provider]["open_connections"] = 0
+
+            for entry in self._clients.values():
+                provider_metrics = metrics[entry.provider]
+                provider_metrics["active_clients"] += 1
+                pool = getattr(entry.transport, "_pool", None)
+                provider_metrics["open_connections"] += len(getattr(pool, "connections", []) or [])
+
+            return metrics
+
+    def close_all(self) -> None:
+        """关闭所有客户端"""
+        with self._lock:
+            for entry in self._clients.values():
+                try:
+                    entry.http_client.close()
+                except Exception as e:
+                    logger.warning(f"关闭客户端 {entry.provider} 出错: {str(e)}")
+            self._clients = {}
+
+
+_llm_client_pool = LLMClientPool()
+
+def get_llm_client(api_key: str, base_url: Optional[str]) -> OpenAI:
+    """从进程级连接池获取LLM客户端"""
+    return _llm_client_pool.get_client(api_key, base_url)
+
+def get_llm_client_metrics() -> Dict[str, Any]:
+    """获取LLM客户端连接池指标"""
+    return _llm_client_pool.get_metrics()
+
+def close_llm_clients() -> None:
+    """关闭连接池中的所有客户端"""
+    _llm_client_pool.close_all()
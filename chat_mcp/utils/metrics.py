@@ -0,0 +1,72 @@
+import math
+import threading
+from collections import deque
+from typing import Dict, Any, Deque
+
+from config.config import METRICS_MAX_SAMPLES
+
+
+def _percentile(sorted_values, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(percent / 100 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+class SampleRecorder:
+    """按名称记录数值样本(保留最近N个)，提供中位数与p95统计"""
+    def __init__(self, max_samples: int = METRICS_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value: float) -> None:
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.max_samples)
+            self._samples[name].append(value)
+
+    def summary(self, scale: float = 1.0, unit: str = "") -> Dict[str, Any]:
+        """scale: 输出时乘以的系数；unit: 统计字段的后缀，如 "ms" 得到 median_ms"""
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self._samples.items()}
+
+        suffix = f"_{unit}" if unit else ""
+        result = {}
+        for name, values in snapshot.items():
+            result[name] = {
+                "count": len(values),
+                f"median{suffix}": round(_percentile(values, 50) * scale, 2),
+                f"p95{suffix}": round(_percentile(values, 95) * scale, 2),
+                f"mean{suffix}": round(sum(values) / len(values) * scale, 2) if values else 0.0
+            }
+        return result
+
+
+_latency_recorder = SampleRecorder()
+_prompt_token_recorder = SampleRecorder()
+_prompt_truncations: Dict[str, int] = {}
+_truncation_lock = threading.Lock()
+
+def record_latency(name: str, seconds: float) -> None:
+    """记录一次耗时样本"""
+    _latency_recorder.record(name, seconds)
+
+def get_latency_summary() -> Dict[str, Any]:
+    """获取耗时统计(中位数、p95)"""
+    return _latency_recorder.summary(scale=1000, unit="ms")
+
+def record_prompt_tokens(stage: str, tokens: int, truncated: bool = False) -> None:
+    """记录某个阶段一次提示词的token数，truncated 表示是否有内容因超出预算被截断"""
+    _prompt_token_recorder.record(stage, tokens)
+    if truncated:
+        with _truncation_lock:
+            _prompt_truncations[stage] = _prompt_truncations.get(stage, 0) + 1
+
+def get_prompt_token_summary() -> Dict[str, Any]:
+    """获取各阶段提示词token统计(中位数、p95)及截断次数"""
+    summary = _prompt_token_recorder.summary(unit="tokens")
+    with _truncation_lock:
+        for stage, values in summary.items():
+            values["truncated"] = _prompt_truncations.get(stage, 0)
+    return summary
@@ -0,0 +1,185 @@
+import json
+import re
+from typing import Dict, Any, List, Tuple, Set
+
+from chat_mcp.error.placeholder_error import PlaceholderError
+
+# ${step_id.result.path[0]|regex:pattern}
+REFERENCE_START = "${"
+SEMANTIC_PLACEHOLDER_PATTERN = re.compile(r'\[(.*?)\]')
+_PATH_TOKEN_PATTERN = re.compile(r'\.([^.\[\]]+)|\[(\d+)\]')
+_STEP_FIELDS = ("result", "error", "success")
+
+
+def result_to_text(result: Any) -> str:
+    """将工具执行结果转换为文本，MCP结果取所有文本内容"""
+    if hasattr(result, "content") and isinstance(result.content, list):
+        return "\n".join(item.text for item in result.content if hasattr(item, "text"))
+    if isinstance(result, (dict, list)):
+        return json.dumps(result, ensure_ascii=False)
+    return "" if result is None else str(result)
+
+
+def _find_references(text: str) -> List[Tuple[int, int, str]]:
+    """查找文本中的 ${...} 引用，支持表达式中出现成对的花括号(如正则量词)"""
+    references = []
+    start = text.find(REFERENCE_START)
+    while start != -1:
+        depth = 0
+        end = -1
+        for index in range(start + 1, len(text)):
+            if text[index] == "{":
+                depth += 1
+            elif text[index] == "}":
+                depth -= 1
+                if depth == 0:
+                    end = index
+                    break
+        if end == -1:
+            break
+        references.append((start, end + 1, text[start + 2:end].strip()))
+        start = text.find(REFERENCE_START, end + 1)
+    return references
+
+
+def resolve_path(value: Any, path: str) -> Any:
+    """按 .key / [index] 路径取值，文本结果先按JSON解析"""
+    for key, index in _PATH_TOKEN_PATTERN.findall(path):
+        if not isinstance(value, (dict, list)):
+            try:
+                value = json.loads(result_to_text(value))
+            except (json.JSONDecodeError, TypeError):
+                raise PlaceholderError(f"结果不是JSON，无法访问路径 {path}")
+
+        try:
+            if index:
+                value = value[int(index)]
+            elif isinstance(value, list) and key.isdigit():
+                value = value[int(key)]
+            else:
+                value = value[key]
+        except (KeyError, IndexError, TypeError):
+            raise PlaceholderError(f"路径 {path} 不存在")
+    return value
+
+
+def resolve_reference(expression: str, execution_results: Dict[str, Any]) -> Any:
+    """
+    解析单个引用表达式(不含 ${})
+    step_1 / step_1.result: 步骤结果文本
+    step_1.result.data.items[0].name: JSON路径
+    step_1.result|regex:温度(\\d+): 正则提取，有捕获组时取第一个捕获组
+    """
+    expression, _, regex = expression.partition("|")
+    expression = expression.strip()
+    regex = regex.strip()
+
+    match = re.match(r'([A-Za-z0-9_\-]+)(.*)$', expression)
+    if not match:
+        raise PlaceholderError(f"无效的引用: {expression}")
+    step_id, path = match.groups()
+
+    if step_id not in execution_results:
+        raise PlaceholderError(f"步骤 {step_id} 尚未执行")
+    step_result = execution_results[step_id]
+    if not isinstance(step_result, dict) or "result" not in step_result:
+        step_result = {"success": True, "result": step_result, "error": None}
+
+    field = "result"
+    field_match = re.match(r'\.(%s)\b' % "|".join(_STEP_FIELDS), path)
+    if field_match:
+        field = field_match.group(1)
+        path = path[field_match.end():]
+
+    if field == "result" and not step_result.get("success", True):
+        raise PlaceholderError(f"步骤 {step_id} 执行失败")
+
+    value = step_result.get(field)
+    if path:
+        value = resolve_path(value, path)
+    elif field == "result":
+        value = result_to_text(value)
+
+    if regex:
+        if not regex.startswith("regex:"):
+            raise PlaceholderError(f"不支持的过滤器: {regex}")
+        text = value if isinstance(value, str) else result_to_text(value)
+        found = re.search(regex[len("regex:"):], text, re.DOTALL)
+        if not found:
+            raise PlaceholderError(f"正则 {regex} 没有匹配")
+        value = found.group(1) if found.groups() else found.group(0)
+
+    return value
+
+
+def _resolve_string(text: str, execution_results: Dict[str, Any], unresolved: List[str]) -> Any:
+    references = _find_references(text)
+    if not references:
+        return text
+
+    # 整个值就是一个引用时保留原始类型(数字、对象、列表等)
+    if len(references) == 1 and references[0][0] == 0 and references[0][1] == len(text):
+        try:
+            return resolve_reference(references[0][2], execution_results)
+        except PlaceholderError as e:
+            unresolved.append(f"{text}: {str(e)}")
+            return text
+
+    parts = []
+    last = 0
+    for start, end, expression in references:
+        parts.append(text[last:start])
+        try:
+            value = resolve_reference(expression, execution_results)
+            parts.append(value if isinstance(value, str) else json.dumps(value, ensure_ascii=False))
+        except PlaceholderError as e:
+            unresolved.append(f"{text[start:end]}: {str(e)}")
+            parts.append(text[start:end])
+        last = end
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def resolve_references(value: Any, execution_results: Dict[str, Any], unresolved: List[str] = None) -> Any:
+    """
+    递归替换参数中的 ${...} 结构化引用
+    无法解析的引用保持原样，并记录到 unresolved 中
+    """
+    if unresolved is None:
+        unresolved = []
+    if isinstance(value, str):
+        return _resolve_string(value, execution_results, unresolved)
+    if isinstance(value, dict):
+        return {key: resolve_references(item, execution_results, unresolved) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(item, execution_results, unresolved) for item in value]
+    return value
+
+
+def referenced_step_ids(value: Any) -> Set[str]:
+    """获取参数中 ${...} 引用到的步骤ID"""
+    if isinstance(value, str):
+        step_ids = set()
+        for _, _, expression in _find_references(value):
+            match = re.match(r'([A-Za-z0-9_\-]+)', expression)
+            if match:
+                step_ids.add(match.group(1))
+        return step_ids
+    if isinstance(value, dict):
+        return set().union(*(referenced_step_ids(item) for item in value.values()))
+    if isinstance(value, list):
+        return set().union(*(referenced_step_ids(item) for item in value))
+    return set()
+
+
+def has_semantic_placeholders(value: Any) -> bool:
+    """参数中是否包含需要LLM理解后填充的 [描述] 占位符(${...} 引用中的下标不算)"""
+    if isinstance(value, str):
+        for start, end, _ in reversed(_find_references(value)):
+            value = value[:start] + value[end:]
+        return bool(SEMANTIC_PLACEHOLDER_PATTERN.search(value))
+    if isinstance(value, dict):
+        return any(has_semantic_placeholders(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_semantic_placeholders(item) for item in value)
+    return False
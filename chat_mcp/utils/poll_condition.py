@@ -0,0 +1,193 @@
+import json
+import re
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+from chat_mcp.error.placeholder_error import PlaceholderError
+from chat_mcp.utils.placeholder import resolve_path, result_to_text
+
+# 任务已经结束但状态为失败: 停止轮询，步骤失败
+FAILED = "failed"
+# 轮询结束条件的判断结果: True 已完成，False 未完成，FAILED 已失败，None 无法判断
+Verdict = Union[bool, str, None]
+# 条件谓词: (解析后的JSON结果或None, 结果文本) -> 判断结果
+Predicate = Callable[[Any, str], Verdict]
+
+_COMPARISON_PATTERN = re.compile(r'^([^\s=!<>]+)\s*(==|!=|>=|<=|>|<)\s*(.+)$')
+_NUMBER_PATTERN = re.compile(r'^-?\d+(?:\.\d+)?%?$')
+
+_DONE_STATES = {"completed", "complete", "success", "succeeded", "done", "finished", "ready",
+                "完成", "已完成", "成功", "结束", "就绪"}
+_FAILED_STATES = {"failed", "failure", "error", "cancelled", "canceled", "失败", "已取消"}
+_PENDING_STATES = {"pending", "queued", "waiting", "running", "processing", "in_progress", "started",
+                   "等待中", "排队中", "运行中", "处理中", "进行中"}
+_STATE_FIELDS = ("status", "state")
+_KEYWORDS = "|".join(re.escape(keyword) for keyword in
+                     ["completed", "finished", "done", "success", "complete", "完成", "成功", "结束", "就绪", "100%"])
+_KEYWORD_PATTERN = re.compile(_KEYWORDS, re.IGNORECASE)
+# 否定形式(未完成、not completed、incomplete 等)中的关键词不表示完成
+_NEGATED_KEYWORD_PATTERN = re.compile(
+    rf"(?:(?:未|没有|尚未|还未|还没|不)\s*|not\s+(?:yet\s+)?|un|in)(?:{_KEYWORDS})",
+    re.IGNORECASE
+)
+
+
+def _to_number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and _NUMBER_PATTERN.match(value.strip()):
+        return float(value.strip().rstrip("%"))
+    return None
+
+
+def _compare(left: Any, operator: str, right: str) -> Verdict:
+    left_number, right_number = _to_number(left), _to_number(right)
+    if operator in ("==", "!="):
+        if left_number is not None and right_number is not None:
+            equal = left_number == right_number
+        else:
+            equal = str(left).strip().lower() == right.lower()
+        return equal if operator == "==" else not equal
+
+    if left_number is None or right_number is None:
+        return None
+    if operator == ">=":
+        return left_number >= right_number
+    if operator == "<=":
+        return left_number <= right_number
+    if operator == ">":
+        return left_number > right_number
+    return left_number < right_number
+
+
+def _compile_atom(atom: str) -> Optional[Predicate]:
+    """编译单个条件，无法识别时返回None"""
+    if atom.startswith("regex:"):
+        try:
+            pattern = re.compile(atom[len("regex:"):], re.IGNORECASE | re.DOTALL)
+        except re.error:
+            return None
+        return lambda data, text: pattern.search(text) is not None
+    if atom.startswith("contains:"):
+        keyword = atom[len("contains:"):].strip().lower()
+        return lambda data, text: keyword in text.lower()
+
+    match = _COMPARISON_PATTERN.match(atom)
+    if not match:
+        return None
+    field, operator, expected = match.groups()
+    expected = expected.strip().strip("\"'")
+    path = field if field.startswith("[") else "." + field
+
+    def compare(data: Any, text: str) -> Verdict:
+        if data is None:
+            return None
+        try:
+            value = resolve_path(data, path)
+        except PlaceholderError:
+            return None
+        return _compare(value, operator, expected)
+    return compare
+
+
+def _all(predicates: List[Predicate]) -> Predicate:
+    def evaluate(data: Any, text: str) -> Verdict:
+        verdicts = [predicate(data, text) for predicate in predicates]
+        if False in verdicts:
+            return False
+        return True if all(verdict is True for verdict in verdicts) else None
+    return evaluate
+
+
+def _any(predicates: List[Predicate]) -> Predicate:
+    def evaluate(data: Any, text: str) -> Verdict:
+        verdicts = [predicate(data, text) for predicate in predicates]
+        if True in verdicts:
+            return True
+        return False if all(verdict is False for verdict in verdicts) else None
+    return evaluate
+
+
+@lru_cache(maxsize=256)
+def compile_condition(condition: str) -> Optional[Predicate]:
+    """
+    编译轮询结束条件，同一条件只编译一次
+    支持: 字段比较(status == completed、progress >= 100、data.items[0].state != running)、
+    regex:正则、contains:文本，可用 && 和 || 组合(&& 优先)
+    条件为空或包含无法识别的部分(如自然语言描述)时返回None
+    """
+    if not condition or not condition.strip():
+        return None
+    alternatives = []
+    for alternative in condition.split("||"):
+        atoms = []
+        for atom in alternative.split("&&"):
+            predicate = _compile_atom(atom.strip())
+            if predicate is None:
+                return None
+            atoms.append(predicate)
+        alternatives.append(atoms[0] if len(atoms) == 1 else _all(atoms))
+    return alternatives[0] if len(alternatives) == 1 else _any(alternatives)
+
+
+def _parse_result(result: Any) -> Tuple[Any, str]:
+    """返回 (JSON结果或None, 结果文本)，JSON只解析一次"""
+    if isinstance(result, (dict, list)):
+        return result, result_to_text(result)
+    text = result_to_text(result)
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):
+        try:
+            return json.loads(stripped), text
+        except json.JSONDecodeError:
+            pass
+    return None, text
+
+
+def _status_completion(data: Any) -> Verdict:
+    """根据结果中的 status/state/progress 字段判断，没有这些字段时返回None"""
+    if not isinstance(data, dict):
+        return None
+    for field in _STATE_FIELDS:
+        state = data.get(field)
+        if isinstance(state, str):
+            state = state.strip().lower()
+            if state in _DONE_STATES:
+                return True
+            if state in _FAILED_STATES:
+                return FAILED
+            if state in _PENDING_STATES:
+                return False
+    progress = _to_number(data.get("progress"))
+    if progress is not None:
+        return progress >= 100
+    return None
+
+
+def evaluate_completion(result: Any, condition: str = "") -> Verdict:
+    """
+    在本地判断轮询是否可以结束，依次使用:
+    1. 可编译的结束条件表达式
+    2. 结果中的状态字段(完成为结束，失败返回 FAILED，等待/运行中为未结束)和进度字段
+    3. 结束条件为自然语言描述时，按完成关键词判断(不计否定形式中的关键词)
+    仍无法判断(条件为空且结果没有状态字段)时返回None，由调用方决定是否交给LLM
+    """
+    data, text = _parse_result(result)
+    status = _status_completion(data)
+    predicate = compile_condition(condition or "")
+    if predicate is not None:
+        verdict = predicate(data, text)
+        if verdict is True:
+            return True
+        if verdict is False:
+            # 条件未满足但任务已经失败时不再继续轮询
+            return FAILED if status == FAILED else False
+
+    if status is not None:
+        return status
+
+    if condition and condition.strip():
+        return _KEYWORD_PATTERN.search(_NEGATED_KEYWORD_PATTERN.sub(" ", text)) is not None
+    return None
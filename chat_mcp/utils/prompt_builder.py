@@ -0,0 +1,127 @@
+import math
+import re
+from typing import Dict, Any, List, Tuple
+
+from chat_mcp.utils.get_logger import get_logger
+from chat_mcp.utils.metrics import record_prompt_tokens
+from config.config import (
+    PROMPT_HISTORY_TOKENS,
+    PROMPT_STEP_RESULT_TOKENS,
+    PROMPT_RESULTS_TOKENS
+)
+
+logger = get_logger("PromptBuilder")
+
+_CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """快速估算token数: 中日韩字符按每字1个token，其余字符按每4个字符1个token"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+
+def fit_text(text: str, max_tokens: int, strategy: str = "head_tail") -> Tuple[str, bool]:
+    """
+    将文本压缩到token预算内，返回 (文本, 是否被截断)
+    strategy: head(保留开头) / tail(保留结尾) / head_tail(保留开头和结尾，省略中间)
+    """
+    text = text or ""
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text, False
+
+    # 按字符比例估算保留长度，中英文密度不同时再按实际结果收缩，最多调整3次
+    keep_chars = int(len(text) * max_tokens / tokens)
+    fitted = text
+    for _ in range(3):
+        fitted = _cut(text, keep_chars, tokens - max_tokens, strategy)
+        fitted_tokens = estimate_tokens(fitted)
+        if fitted_tokens <= max_tokens or keep_chars == 0:
+            break
+        keep_chars = int(keep_chars * max_tokens / fitted_tokens)
+    return fitted, True
+
+
+def _cut(text: str, keep_chars: int, omitted_tokens: int, strategy: str) -> str:
+    omitted = f"...(省略约{omitted_tokens}个token)..."
+    keep_chars = max(keep_chars, 0)
+    if strategy == "head":
+        return text[:keep_chars] + omitted
+    if strategy == "tail":
+        return omitted + text[len(text) - keep_chars:]
+
+    head_chars = keep_chars * 2 // 3
+    tail_chars = keep_chars - head_chars
+    tail = text[len(text) - tail_chars:] if tail_chars else ""
+    return f"{text[:head_chars]}\n{omitted}\n{tail}"
+
+
+class PromptBuilder:
+    """
+    按token预算组装提示词的各个部分，并记录每个阶段的提示词token数
+    用法: 先通过 section()/history()/results() 得到压缩后的各部分文本，拼好提示词后调用 finish()
+    """
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.truncated_sections: List[str] = []
+
+    def section(self, name: str, text: Any, max_tokens: int, strategy: str = "head_tail") -> str:
+        """压缩单个部分"""
+        fitted, truncated = fit_text(str(text) if text is not None else "", max_tokens, strategy)
+        if truncated:
+            self.truncated_sections.append(name)
+        return fitted
+
+    def history(self, history_message: Any, max_tokens: int = PROMPT_HISTORY_TOKENS) -> str:
+        """压缩历史记录: 从最新的消息开始保留，直到用完预算"""
+        if not history_message:
+            return "无"
+        if not isinstance(history_message, list):
+            return self.section("history", history_message, max_tokens, strategy="tail")
+
+        lines = []
+        remaining = max_tokens
+        for message in reversed(history_message):
+            if isinstance(message, dict):
+                line = f"{message.get('role', '')}: {message.get('content', '')}"
+            else:
+                line = str(message)
+
+            line_tokens = estimate_tokens(line)
+            if line_tokens > remaining:
+                if remaining > 0 and not lines:
+                    line, _ = fit_text(line, remaining, strategy="head_tail")
+                    lines.append(line)
+                self.truncated_sections.append("history")
+                break
+            lines.append(line)
+            remaining -= line_tokens
+
+        return "\n".join(reversed(lines))
+
+    def results(self,
+                items: List[Tuple[str, Any]],
+                max_tokens: int = PROMPT_RESULTS_TOKENS,
+                item_max_tokens: int = PROMPT_STEP_RESULT_TOKENS) -> Dict[str, str]:
+        """
+        压缩多个步骤结果，items 为 [(步骤ID, 结果)]
+        每个结果不超过 item_max_tokens，总量超出 max_tokens 时平均分配预算
+        """
+        if not items:
+            return {}
+        per_item = min(item_max_tokens, max(max_tokens // len(items), 1))
+        return {
+            label: self.section(f"result:{label}", result, per_item)
+            for label, result in items
+        }
+
+    def finish(self, prompt: str) -> str:
+        """记录提示词token数并返回提示词"""
+        tokens = estimate_tokens(prompt)
+        record_prompt_tokens(self.stage, tokens, truncated=bool(self.truncated_sections))
+        if self.truncated_sections:
+            logger.info(f"{self.stage} 提示词超出预算，已压缩: {sorted(set(self.truncated_sections))}，约{tokens}个token")
+        return prompt
@@ -0,0 +1,290 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, Any, Optional, Tuple
+
+from chat_mcp.utils.get_logger import get_logger
+from chat_mcp.utils.stream_event import StreamEvent
+from config.config import (
+    SSE_FLUSH_INTERVAL,
+    SSE_FLUSH_BYTES,
+    SSE_BUFFER_SIZE,
+    SSE_REPLAY_BUFFER_SIZE,
+    SSE_STREAM_TTL,
+    SSE_MAX_STREAMS,
+    SSE_RESUME_GRACE,
+    SSE_KEEPALIVE_INTERVAL
+)
+
+logger = get_logger("SSE")
+
+_END = object()
+
+
+async def coalesce_events(events: AsyncIterator[StreamEvent],
+                          flush_interval: float = SSE_FLUSH_INTERVAL,
+                          flush_bytes: int = SSE_FLUSH_BYTES) -> AsyncIterator[StreamEvent]:
+    """
+    合并连续的回答文本事件，减少发送的帧数，其他类型的事件立即发送
+    距离上次发送超过 flush_interval 秒时立即发送(首块不等待)，否则在窗口内累积，累积超过 flush_bytes 字节时提前发送
+    只在有待发送内容时等待一个窗口计时，不为每个文本块单独计时
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_BUFFER_SIZE)
+
+    async def produce():
+        try:
+            async for event in events:
+                if event.event_type != StreamEvent.TOKEN or event.content:
+                    await queue.put(event)
+            await queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            if hasattr(events, "aclose"):
+                await events.aclose()
+
+    producer = asyncio.create_task(produce())
+    parts = []
+    size = 0
+    last_flush = loop.time() - flush_interval
+    try:
+        while True:
+            if parts:
+                remaining = last_flush + flush_interval - loop.time()
+                if remaining <= 0 or size >= flush_bytes:
+                    yield StreamEvent(StreamEvent.TOKEN, "".join(parts))
+                    parts, size = [], 0
+                    last_flush = loop.time()
+                    continue
+            else:
+                remaining = None
+
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                try:
+                    item = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    continue
+
+            if item is _END:
+                break
+            if isinstance(item, Exception):
+                if parts:
+                    yield StreamEvent(StreamEvent.TOKEN, "".join(parts))
+                raise item
+            if item.event_type != StreamEvent.TOKEN:
+                if parts:
+                    yield StreamEvent(StreamEvent.TOKEN, "".join(parts))
+                    parts, size = [], 0
+                yield item
+                last_flush = loop.time()
+                continue
+            parts.append(item.content)
+            size += len(item.content.encode("utf-8"))
+
+        if parts:
+            yield StreamEvent(StreamEvent.TOKEN, "".join(parts))
+    finally:
+        producer.cancel()
+
+
+class EventStream:
+    """
+    单个请求的事件流
+    事件在后台生成，按递增ID编码为SSE帧后保存在有界的回放缓冲区中，与HTTP连接无关
+    连接断开后可以带 Last-Event-ID 重新连接，从断开处继续读取，不会重新执行工作流
+    所有连接都断开且 resume_grace 秒内没有重新连接时，取消后台任务，整个工作流随之取消
+    """
+    def __init__(self, stream_id: str, max_events: int = SSE_REPLAY_BUFFER_SIZE, resume_grace: float = SSE_RESUME_GRACE):
+        self.stream_id = stream_id
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers = 0
+        self.resumes = 0
+        self.resume_grace = resume_grace
+        self.cancelled = False
+        self.on_cancel: Optional[Callable[['EventStream'], None]] = None
+
+        self._cancel_handle: Optional[asyncio.TimerHandle] = None
+
+        self._frames: "deque[Tuple[int, str]]" = deque(maxlen=max(max_events, 1))
+        self._last_seq = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.stream_id}:{seq}"
+
+    def append(self, event: StreamEvent) -> None:
+        """编码事件并写入回放缓冲区，每个事件只编码一次"""
+        if self.finished:
+            return
+        self._last_seq += 1
+        frame = (f"id: {self.event_id(self._last_seq)}\n"
+                 f"event: {event.event_type}\n"
+                 f"data: {json.dumps(event.to_dict())}\n\n")
+        self._frames.append((self._last_seq, frame))
+        self._wake()
+
+    def finish(self) -> None:
+        if not self.finished:
+            self.append(StreamEvent(StreamEvent.DONE))
+            self.finished_at = time.monotonic()
+            self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def run(self, events: AsyncIterator[StreamEvent]) -> None:
+        """在后台消费事件直到结束，出错时写入错误事件"""
+        try:
+            async for event in events:
+                self.append(event)
+        except asyncio.CancelledError:
+            if self.cancelled:
+                self.append(StreamEvent(StreamEvent.ERROR, "客户端已断开，请求已取消"))
+            raise
+        except Exception as e:
+            error_msg = f"处理流式响应出错: {str(e)}"
+            logger.error(error_msg, exc_info=True)
+            self.append(StreamEvent(StreamEvent.ERROR, error_msg))
+        finally:
+            self.finish()
+
+    def start(self, events: AsyncIterator[StreamEvent]) -> None:
+        self.task = asyncio.create_task(self.run(events))
+
+    def cancel(self) -> bool:
+        """取消后台任务，返回是否取消了仍在进行的任务"""
+        self._clear_cancel_timer()
+        if self.finished or not self.task or self.task.done():
+            return False
+        self.cancelled = True
+        self.task.cancel()
+        if self.on_cancel:
+            self.on_cancel(self)
+        return True
+
+    def _schedule_cancel(self) -> None:
+        """最后一个连接断开后开始计时，等待期内没有重新连接则取消"""
+        if self.finished or not self.task or self._cancel_handle:
+            return
+        logger.info(f"事件流 {self.stream_id} 的客户端已断开，{self.resume_grace} 秒内未重连将取消请求")
+        self._cancel_handle = asyncio.get_running_loop().call_later(max(self.resume_grace, 0), self._abandon)
+
+    def _clear_cancel_timer(self) -> None:
+        if self._cancel_handle:
+            self._cancel_handle.cancel()
+            self._cancel_handle = None
+
+    def _abandon(self) -> None:
+        self._cancel_handle = None
+        if self.subscribers == 0 and self.cancel():
+            logger.info(f"事件流 {self.stream_id} 的客户端未重连，已取消请求")
+
+    async def subscribe(self, last_seq: int = 0, keepalive: float = SSE_KEEPALIVE_INTERVAL) -> AsyncIterator[str]:
+        """
+        输出 last_seq 之后的所有SSE帧，直到事件流结束
+        超过 keepalive 秒没有新事件时输出一个注释帧，向已断开的连接写入会失败，从而尽快发现断开
+        """
+        self.subscribers += 1
+        self._clear_cancel_timer()
+        try:
+            while True:
+                changed = self._changed
+                if self._frames and self._frames[0][0] > last_seq + 1:
+                    # 需要的事件已经被挤出回放缓冲区
+                    missed = self._frames[0][0] - last_seq - 1
+                    logger.warning(f"事件流 {self.stream_id} 回放缓冲区不足，跳过 {missed} 个事件")
+                    last_seq = self._frames[0][0] - 1
+                # 序号连续，直接从 last_seq 之后的位置开始读取
+                start = last_seq + 1 - self._frames[0][0] if self._frames else 0
+                for index in range(max(start, 0), len(self._frames)):
+                    last_seq, frame = self._frames[index]
+                    yield frame
+                if self.finished and last_seq >= self._last_seq:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), keepalive if keepalive > 0 else None)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self._schedule_cancel()
+
+
+class EventStreamRegistry:
+    """保存进行中和最近结束的事件流，结束超过 ttl 秒的事件流被清理"""
+    def __init__(self, ttl: float = SSE_STREAM_TTL, max_streams: int = SSE_MAX_STREAMS):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self._streams: Dict[str, EventStream] = {}
+        self._metrics = {"created": 0, "resumed": 0, "expired": 0, "cancelled": 0}
+
+    def create(self) -> EventStream:
+        self.cleanup()
+        stream = EventStream(uuid.uuid4().hex)
+        stream.on_cancel = self._record_cancel
+        self._streams[stream.stream_id] = stream
+        self._metrics["created"] += 1
+        return stream
+
+    @staticmethod
+    def parse_event_id(event_id: str) -> Tuple[str, int]:
+        """解析 Last-Event-ID，格式为 流ID:序号"""
+        stream_id, _, seq = (event_id or "").strip().rpartition(":")
+        return stream_id, int(seq) if seq.isdigit() else 0
+
+    def resume(self, last_event_id: str) -> Optional[Tuple[EventStream, int]]:
+        """根据 Last-Event-ID 找到事件流，返回 (事件流, 已收到的序号)，事件流不存在时返回None"""
+        self.cleanup()
+        stream_id, seq = self.parse_event_id(last_event_id)
+        stream = self._streams.get(stream_id)
+        if not stream:
+            return None
+        stream.resumes += 1
+        self._metrics["resumed"] += 1
+        return stream, seq
+
+    def _record_cancel(self, stream: EventStream) -> None:
+        self._metrics["cancelled"] += 1
+
+    def cleanup(self) -> None:
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.finished and now - stream.finished_at > self.ttl
+        ]
+        # 超出数量上限时，优先清理最早结束的事件流
+        finished = sorted(
+            (stream for stream in self._streams.values() if stream.finished and stream.stream_id not in expired),
+            key=lambda stream: stream.finished_at
+        )
+        overflow = len(self._streams) - len(expired) - self.max_streams
+        expired.extend(stream.stream_id for stream in finished[:max(overflow, 0)])
+
+        for stream_id in expired:
+            del self._streams[stream_id]
+        self._metrics["expired"] += len(expired)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        self.cleanup()
+        active = sum(1 for stream in self._streams.values() if not stream.finished)
+        return {
+            "active": active,
+            "finished": len(self._streams) - active,
+            "subscribers": sum(stream.subscribers for stream in self._streams.values()),
+            **self._metrics
+        }
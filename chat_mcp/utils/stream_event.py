@@ -0,0 +1,44 @@
+from typing import Dict, Any
+
+
+class StreamEvent:
+    """
+    带类型的流式输出事件
+    str() 得到事件的文本内容，只处理文本的调用方可以继续按文本使用
+    """
+    PLAN = "plan"
+    STEP_STARTED = "step_started"
+    STEP_RESULT = "step_result"
+    ASSESSMENT = "assessment"
+    TOKEN = "token"
+    ERROR = "error"
+    DONE = "done"
+
+    def __init__(self, event_type: str, content: str = "", data: Dict[str, Any] = None):
+        self.event_type = event_type
+        self.content = content
+        self.data = data or {}
+
+    def __str__(self) -> str:
+        return self.content
+
+    def __repr__(self) -> str:
+        return f"StreamEvent({self.event_type!r}, {self.content!r})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.data, "type": self.event_type, "content": self.content}
+
+    @classmethod
+    def from_chunk(cls, chunk: Any) -> 'StreamEvent':
+        """将流式输出的任意块(事件、文本、LLM响应块)转换为事件，非事件的内容视为回答文本"""
+        if isinstance(chunk, StreamEvent):
+            return chunk
+        if isinstance(chunk, str):
+            return cls(cls.TOKEN, chunk)
+        if hasattr(chunk, 'choices'):
+            delta = getattr(chunk.choices[0], 'delta', None) if chunk.choices else None
+            return cls(cls.TOKEN, getattr(delta, 'content', None) or "")
+        try:
+            return cls(cls.TOKEN, str(chunk))
+        except Exception:
+            return cls(cls.TOKEN, "")
@@ -0,0 +1,34 @@
+class SlidingWindowBuffer:
+    """
+    输出滑动窗口: 始终保留最后 window_chars 个字符不输出
+    审核通过后调用 flush() 输出剩余内容，审核拒绝时调用 discard() 撤回尚未输出的内容
+    """
+    def __init__(self, window_chars: int):
+        self.window_chars = max(window_chars, 0)
+        self._pending = ""
+        self.flushed_chars = 0
+
+    def push(self, text: str) -> str:
+        """写入文本，返回已经移出窗口、可以输出的部分"""
+        self._pending += text
+        overflow = len(self._pending) - self.window_chars
+        if overflow <= 0:
+            return ""
+        ready, self._pending = self._pending[:overflow], self._pending[overflow:]
+        self.flushed_chars += len(ready)
+        return ready
+
+    def flush(self) -> str:
+        """输出窗口内剩余的全部内容"""
+        ready, self._pending = self._pending, ""
+        self.flushed_chars += len(ready)
+        return ready
+
+    def discard(self) -> str:
+        """丢弃窗口内尚未输出的内容并返回"""
+        dropped, self._pending = self._pending, ""
+        return dropped
+
+    @property
+    def pending(self) -> str:
+        return self._pending
@@ -0,0 +1,93 @@
+from typing import Tuple
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """文本结尾可能是半个标签时返回其长度，用于跨分块识别标签"""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if tag.startswith(text[-length:]):
+            return length
+    return 0
+
+
+class ThinkTagFilter:
+    """
+    增量去除 <think>...</think> 推理内容的状态机
+    每个分块只扫描一次，最多保留一个标签长度的结尾等待下一个分块，能识别被分块切开的标签
+    """
+    def __init__(self):
+        self.in_think = False
+        self.think_detected = False
+        self._pending = ""
+
+    def feed(self, text: str) -> Tuple[str, str]:
+        """写入一个分块，返回 (可见内容, 推理内容)"""
+        data = self._pending + (text or "")
+        self._pending = ""
+        visible = []
+        reasoning = []
+
+        while data:
+            tag = THINK_CLOSE if self.in_think else THINK_OPEN
+            index = data.find(tag)
+            if index == -1:
+                keep = _partial_tag_length(data, tag)
+                if keep:
+                    self._pending = data[-keep:]
+                    data = data[:-keep]
+                (reasoning if self.in_think else visible).append(data)
+                break
+
+            (reasoning if self.in_think else visible).append(data[:index])
+            data = data[index + len(tag):]
+            self.in_think = not self.in_think
+            self.think_detected = True
+
+        return "".join(visible), "".join(reasoning)
+
+    def flush(self) -> Tuple[str, str]:
+        """流结束时输出保留的结尾"""
+        pending, self._pending = self._pending, ""
+        return ("", pending) if self.in_think else (pending, "")
+
+
+def strip_think(content: str) -> str:
+    """
+    去除完整响应中的推理内容
+    兼容只输出了 </think> 而没有 <think> 的模型: 结束标签之前的内容都视为推理内容
+    """
+    if not content or (THINK_OPEN not in content and THINK_CLOSE not in content):
+        return content
+
+    close_index = content.find(THINK_CLOSE)
+    if close_index != -1 and THINK_OPEN not in content[:close_index]:
+        content = content[close_index + len(THINK_CLOSE):]
+
+    think_filter = ThinkTagFilter()
+    visible, _ = think_filter.feed(content)
+    return (visible + think_filter.flush()[0]).strip()
+
+
+async def filter_stream(stream_generator):
+    """过滤LLM流式响应中的推理内容，逐块输出可见文本"""
+    think_filter = ThinkTagFilter()
+
+    async for chunk in stream_generator:
+        if hasattr(chunk, 'choices') and chunk.choices:
+            delta = getattr(chunk.choices[0], 'delta', None)
+            chunk_text = getattr(delta, 'content', None) or ""
+        else:
+            try:
+                chunk_text = str(chunk)
+            except Exception:
+                chunk_text = ""
+
+        visible, _ = think_filter.feed(chunk_text)
+        if visible:
+            yield visible
+
+    visible, _ = think_filter.flush()
+    if visible:
+        yield visible
@@ -12,6 +12,21 @@ import PartnerSettings from "./components/sidebar/PartnerSettings";
 import {applyPartnerToChat} from "./config/partnersConfig";
 import {API_CONFIG} from "./constants";
 
+// 解析一个SSE帧: id / event / data 字段
+const parseSSEFrame = (frame) => {
+  const event = { id: null, type: 'message', data: '' };
+  for (const line of frame.split('\n')) {
+    if (line.startsWith('id: ')) {
+      event.id = line.substring(4);
+    } else if (line.startsWith('event: ')) {
+      event.type = line.substring(7);
+    } else if (line.startsWith('data: ')) {
+      event.data += line.substring(6);
+    }
+  }
+  return event.data ? event : null;
+};
+
 function ChatApp() {
   const [messages, setMessages] = useState([]);
   const [loading, setLoading] = useState(false);
@@ -270,77 +285,111 @@ function ChatApp() {
         }));
       }
 
-      const response = await fetch(`${API_CONFIG.base}${API_CONFIG.endpoints.chat}`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
+      const requestBody = JSON.stringify({
+        message: messageObject.content,
+        model: messageObject.model.name,
+        provider: messageObject.model.provider,
+        userId: messageObject.userId,
+        messageId: messageObject.id,
+        conversationId: messageObject.conversationId,
+        historyMessage: contextMessages,
+        settings: {
+          temperature: chatSettings.temperature,
+          maxTokens: chatSettings.maxTokens,
+          systemPrompt: chatSettings.systemPrompt
         },
-        body: JSON.stringify({
-          message: messageObject.content,
-          model: messageObject.model.name,
-          provider: messageObject.model.provider,
-          userId: messageObject.userId,
-          messageId: messageObject.id,
-          conversationId: messageObject.conversationId,
-          historyMessage: contextMessages,
-          settings: {
-            temperature: chatSettings.temperature,
-            maxTokens: chatSettings.maxTokens,
-            systemPrompt: chatSettings.systemPrompt
-          },
-          apiKey: apiKey,
-        }),
+        apiKey: apiKey,
       });
 
-      if (!response.ok) {
-        throw new Error(`Server responded with status: ${response.status}`);
-      }
-
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder('utf-8');
       let fullContent = '';
+      let lastEventId = null;
+      let finished = false;
+      let retries = 0;
+
+      // 连接中断时带 Last-Event-ID 重新连接，服务端从断开处继续输出，不会重新执行
+      while (!finished) {
+        let response = null;
+        try {
+          response = await fetch(`${API_CONFIG.base}${API_CONFIG.endpoints.chat}`, {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+              ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {})
+            },
+            body: requestBody,
+          });
+
+          if (!response.ok) {
+            throw new Error(`Server responded with status: ${response.status}`);
+          }
 
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder('utf-8');
+          let buffer = '';
 
-        const chunk = decoder.decode(value, { stream: true });
-        const lines = chunk.split('\n\n').filter(line => line.trim());
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
 
-        for (const line of lines) {
-          if (line.startsWith('data: ')) {
-            try {
-              const content = line.substring(6);
-              const parsedData = JSON.parse(content);
+            buffer += decoder.decode(value, { stream: true });
+            const frames = buffer.split('\n\n');
+            buffer = frames.pop();
 
-              if (parsedData.type === 'error') {
-                console.error('流式输出错误:', parsedData.content);
+            for (const frame of frames) {
+              const event = parseSSEFrame(frame);
+              if (!event) continue;
+              if (event.id) {
+                lastEventId = event.id;
+              }
+              if (event.type === 'done') {
+                finished = true;
                 continue;
               }
 
-              let parsedContent = parsedData.content;
+              try {
+                const parsedData = JSON.parse(event.data);
 
-              if (typeof parsedContent === 'object' && parsedContent !== null) {
-                parsedContent = parsedContent.content || parsedContent.text || JSON.stringify(parsedContent);
-              }
+                if (parsedData.type === 'error') {
+                  console.error('流式输出错误:', parsedData.content);
+                }
+
+                let parsedContent = parsedData.content;
+
+                if (typeof parsedContent === 'object' && parsedContent !== null) {
+                  parsedContent = parsedContent.content || parsedContent.text || JSON.stringify(parsedContent);
+                }
+
+                if (!parsedContent) continue;
+                fullContent += parsedContent;
 
-              fullContent += parsedContent;
-
-              setMessages(currentMessages => {
-                return currentMessages.map(msg => {
-                  if (msg.id === streamingMessageId) {
-                    return {
-                      ...msg,
-                      content: fullContent
-                    };
-                  }
-                  return msg;
+                setMessages(currentMessages => {
+                  return currentMessages.map(msg => {
+                    if (msg.id === streamingMessageId) {
+                      return {
+                        ...msg,
+                        content: fullContent
+                      };
+                    }
+                    return msg;
+                  });
                 });
-              });
-            } catch (error) {
-              console.error('解析数据块时出错:', error, line.substring(6));
+              } catch (error) {
+                console.error('解析数据块时出错:', error, event.data);
+              }
             }
           }
+
+          if (!finished) {
+            throw new Error('连接已中断');
+          }
+        } catch (error) {
+          const canResume = lastEventId && (!response || response.ok) && retries < API_CONFIG.streamRetries;
+          if (!canResume) {
+            throw error;
+          }
+          retries += 1;
+          console.warn(`流式连接中断，第 ${retries} 次重连:`, error);
+          await new Promise(resolve => setTimeout(resolve, 1000 * retries));
         }
       }
 
@@ -2,6 +2,8 @@ import React from 'react';
 import './MCPToolResultRenderer.css';
 import MarkdownRenderer, {isMarkdownContent} from "./isMarkdownContent";
 
+// 工具测试接口现在直接返回文本，工具返回的错误(isError)通过 return_code 作为失败返回，
+// 下面对 CallToolResult repr 的解析只用于兼容旧版本服务端
 export function extractTextContent(responseText) {
   if (!responseText) return '';
 
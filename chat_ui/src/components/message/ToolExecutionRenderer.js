@@ -128,9 +128,20 @@ const ToolExecutionRenderer = memo(function ToolExecutionRenderer({ content, mar
     }
   };
 
+  // 工具返回 isError 结果时，服务端输出的错误信息以该前缀开头
+  const TOOL_ERROR_PREFIX = /^工具返回错误[:：]\s*/;
+
+  const isToolError = (text) => typeof text === 'string' && TOOL_ERROR_PREFIX.test(text.trim());
+
+  // 旧版本的结果是 CallToolResult 的repr(meta=... content=[...] isError=...)，新版本直接输出文本，
+  // 工具错误以 TOOL_ERROR_PREFIX 开头，两种格式都需要解析(历史消息中仍有旧格式)
   const extractTextContent = (content) => {
     if (!content || typeof content !== 'string') return content;
 
+    if (isToolError(content)) {
+      return content.trim().replace(TOOL_ERROR_PREFIX, '');
+    }
+
     const textContentRegex = /TextContent\(type='text',\s*text='([\s\S]*?)'(?:,\s*annotations=None)?\)/;
     const match = content.match(textContentRegex);
 
@@ -213,12 +224,31 @@ const ToolExecutionRenderer = memo(function ToolExecutionRenderer({ content, mar
     }
     
     const executionResults = [];
-    const executionRegex = /执行步骤\s+(.*?)\s+\((.*?)\)\s+:\s+(成功|失败)\s+结果:\s+(.*?)(?=执行步骤|$)/gs;
+    // 步骤头: 执行步骤 ID (工具)[ (轮询 N 次)]: 成功|失败，兼容旧版本在冒号前多输出的空格
+    const executionRegex = /执行步骤\s+(.*?)\s+\(([^()]*)\)\s*(?:\(轮询\s*\d+\s*次\)\s*)?:\s+(成功|失败)\s+结果:\s+(.*?)(?=执行步骤|$)/gs;
   
     const finalOutputMatch = content.match(/最终结果[:：]\s*([\s\S]+?)$/);
     const finalOutput = finalOutputMatch ? finalOutputMatch[1].trim() : "";
 
-    while ((match = executionRegex.exec(content)) !== null) {
+    // 评估在后台完成后单独输出为 "步骤 ID 评估: ..."，可能出现在其他步骤的结果之后，按步骤ID对应到步骤
+    const assessmentRegex = /步骤\s+(\S+)\s+评估:\s+(.*?)(?=\n\s*\n|步骤\s+\S+\s+评估:|执行步骤|$)/gs;
+    const assessments = {};
+    while ((match = assessmentRegex.exec(content)) !== null) {
+      const assessmentText = match[2].trim();
+      const detailMatch = assessmentText.match(/满足度:\s+(.*?)\s+\(置信度:\s+(.*?)\)\s+原因:\s+([\s\S]*)/);
+      assessments[match[1].trim()] = detailMatch ? {
+        satisfaction: detailMatch[1].trim(),
+        confidence: detailMatch[2].trim(),
+        reason: detailMatch[3].trim()
+      } : {
+        satisfaction: assessmentText,
+        confidence: '-',
+        reason: ''
+      };
+    }
+    const stepContent = content.replace(assessmentRegex, '');
+
+    while ((match = executionRegex.exec(stepContent)) !== null) {
       const stepId = match[1].trim();
       const toolName = match[2].trim();
       const status = match[3].trim();
@@ -226,7 +256,7 @@ const ToolExecutionRenderer = memo(function ToolExecutionRenderer({ content, mar
       
       const metaContentMatch = resultContent.match(/meta=(None|null)\s+content=\[([\s\S]*?)\]\s+isError=(False|True)/s);
       let resultText = resultContent;
-      let isError = false;
+      let isError = isToolError(resultContent);
       
       if (metaContentMatch) {
         const textContentMatch = metaContentMatch[2].match(/TextContent\(type='text',\s*text='([\s\S]*?)'/);
@@ -240,8 +270,9 @@ const ToolExecutionRenderer = memo(function ToolExecutionRenderer({ content, mar
         isError = metaContentMatch[3] === 'True';
       }
       
-      const assessmentMatch = resultContent.match(/评估:\s+满足度:\s+(.*?)\s+\(置信度:\s+(.*?)\)\s+原因:\s+(.*?)(?=执行步骤|$)/s);
-      let assessment = null;
+      // 旧版本的评估紧跟在所属步骤的结果之后，没有步骤ID
+      const assessmentMatch = assessments[stepId] ? null : resultContent.match(/评估:\s+满足度:\s+(.*?)\s+\(置信度:\s+(.*?)\)\s+原因:\s+(.*?)(?=执行步骤|$)/s);
+      let assessment = assessments[stepId] || null;
       
       if (assessmentMatch) {
         assessment = {
@@ -543,18 +574,18 @@ const ToolExecutionRenderer = memo(function ToolExecutionRenderer({ content, mar
                 if (combinedContent) {
                   parts.push({
                     type: 'tool-result',
-                    content: filterPromptText(combinedContent),
+                    content: filterPromptText(extractTextContent(combinedContent)),
                     isJson: false,
-                    isError: false,
+                    isError: isToolError(combinedContent),
                     toolName
                   });
                 }
               } else {
                 parts.push({
                   type: 'tool-result',
-                  content: filterPromptText(cleanText),
+                  content: filterPromptText(extractTextContent(cleanText)),
                   isJson: cleanText.trim().startsWith('{') || cleanText.trim().startsWith('['),
-                  isError: false,
+                  isError: isToolError(cleanText),
                   toolName
                 });
               }
@@ -4,7 +4,8 @@ export const API_CONFIG = {
     chat: '/chat/stream',
     tools:'/api/tools'
   },
-  timeout: 30000
+  timeout: 30000,
+  streamRetries: 3
 };
 
 export const FILE_API = {
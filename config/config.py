@@ -18,7 +18,112 @@ CURRENT_DIR = get_project_root()  # 项目根目录(识别项目根目录的main
 
 # 服务器设置
 URL_PORT = 8007  # 端口号 - 项目启动/音频文件URL信息的端口号
+SSE_FLUSH_INTERVAL = 0.05  # 流式输出合并窗口(秒): 距上次发送超过该时间的内容立即发送，否则在窗口内合并为一帧，0表示每块单独发送
+SSE_FLUSH_BYTES = 2048  # 合并的内容超过该字节数时提前发送
+SSE_BUFFER_SIZE = 256  # 生成内容与发送之间最多缓冲的块数(背压上限)
+SSE_REPLAY_BUFFER_SIZE = 2000  # 每个请求保留的最近事件数，断线重连时从 Last-Event-ID 之后回放
+SSE_STREAM_TTL = 300  # 事件流结束后保留的时间(秒)，在此期间可以重连读取
+SSE_MAX_STREAMS = 1000  # 最多保留的事件流数量，超出时清理最早结束的事件流
+SSE_RESUME_GRACE = 30  # 客户端断开后等待重连的时间(秒)，超时仍无连接则取消该请求的工作流(工具调用、轮询、LLM流)
+SSE_KEEPALIVE_INTERVAL = 15  # 没有新事件时发送保活注释帧的间隔(秒)，用于及时发现已断开的连接
 MAX_ITERATIONS = 15  # 使用工具最大次数
+MAX_CONCURRENT_STEPS = 8  # 单个请求中同时执行的最大步骤数
+PIPELINE_MODE = "staged"  # 工具工作流规划模式: staged(判断/筛选/规划三次调用)/fused(单次调用完成判断、筛选和规划)
+EXECUTION_ENGINE = "plan"  # 工具执行引擎: plan(生成执行计划后调度执行)/function_calling(模型原生工具调用循环)
+PLAN_STREAMING = True  # 流式生成执行计划，步骤一生成即开始执行(staged模式)
+SIDE_EFFECT_TOOLS = []  # 只执行操作、结果无需写入后续提示词的工具名或服务器名(规划器也可以按步骤标记 side_effect_only)
+METRICS_MAX_SAMPLES = 1000  # 每项耗时指标保留的最近样本数
+
+# 请求时间预算设置(秒)
+REQUEST_TIMEOUT = 120  # 工具路由、规划和执行的默认总时间预算，客户端可通过 requestTimeout 指定(同时限制直接回答)，0表示不限制
+REQUEST_TIMEOUT_MAX = 300  # 请求时间预算上限，客户端指定的值超过时按上限处理，0表示不设上限
+DEADLINE_ANSWER_RESERVE = 15  # 为最终回答保留的最长时间，路由、规划和工具执行不会占用这部分时间
+DEADLINE_ANSWER_RESERVE_RATIO = 0.25  # 为最终回答保留的时间不超过请求时间预算的该比例，较小的预算也能留给路由和工具执行
+DEADLINE_MIN_FINAL_CHECK = 8  # 剩余时间少于该值时跳过LLM最终检查，直接输出已获得的结果(仍经过本地内容筛查)
+
+# ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+# ┃                            LLM调用配置                                     ┃
+# ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛
+
+# 流式输出设置
+LLM_STREAM_BUFFER_SIZE = 64  # 每个流式响应在读取线程与事件循环之间最多缓冲的块数(背压上限)
+HIDE_REASONING = False  # 直接回答时是否隐藏模型的推理内容(<think>...</think>)，最终结果和内部调用始终会去除推理内容
+
+# 客户端连接池设置(按 base_url + api_key 复用客户端)
+LLM_POOL_MAX_CONNECTIONS = 100  # 每个客户端最大连接数
+LLM_POOL_MAX_KEEPALIVE_CONNECTIONS = 20  # 每个客户端保持的空闲长连接数
+LLM_POOL_KEEPALIVE_EXPIRY = 60  # 空闲长连接保持时间(秒)
+LLM_CLIENT_IDLE_TIMEOUT = 900  # 客户端闲置超过该时间(秒)后被回收
+
+# 提示词token预算(超出时保留开头和结尾、省略中间，历史记录保留最新的消息)
+PROMPT_HISTORY_TOKENS = 2000  # 历史记录
+PROMPT_STEP_RESULT_TOKENS = 1500  # 单个步骤结果
+PROMPT_RESULTS_TOKENS = 6000  # 一个提示词中所有步骤结果的总量
+
+# 最终结果检查设置
+FINAL_CHECK_MODE = "llm"  # 最终结果检查方式: llm(总是由LLM检查并生成回答)/rule(最后一步结果完整且通过本地筛查时直接输出，否则交给LLM)/stream(同rule，但直接输出的同时并行进行LLM审核；需要LLM检查时与llm相同，首字延迟不变)
+FINAL_CHECK_STREAM_WINDOW = 100  # stream 模式下审核结束前保留不输出的字符数，审核拒绝时撤回这部分内容
+FINAL_CHECK_STREAM_CHUNK = 20  # stream 模式下每次输出的字符数
+FINAL_CHECK_STREAM_RATE = 60  # stream 模式下审核结束前的输出速度(字符/秒)，使审核期间离开窗口的内容有限
+FINAL_CHECK_STREAM_MAX_UNMODERATED = 600  # stream 模式下审核结束前最多输出的字符数，达到后等待审核结果再输出其余内容
+FINAL_CHECK_MODERATION_TIMEOUT = 30  # stream 模式下LLM审核超时时间(秒)，超时按未通过处理
+# rule 模式下的本地筛查规则(关键词或正则)，命中任意一条时交给LLM检查
+FINAL_CHECK_BLOCKED_PATTERNS = [
+    r"炸弹|炸药|雷管|制毒|冰毒|海洛因|枪支|弹药",
+    r"黑客工具|木马|勒索软件|钓鱼网站",
+    r"色情|淫秽|赌博|博彩",
+    r"恐怖袭击|自杀|自残",
+    r"诈骗|洗钱|传销",
+    r"(?<!\d)\d{17}[\dXx](?!\d)",  # 身份证号
+    r"(?<!\d)\d{16,19}(?!\d)",  # 银行卡号
+]
+# rule/stream 模式下判断结果不完整的规则(正则)，命中时交给LLM检查
+FINAL_CHECK_INCOMPLETE_PATTERNS = [
+    r"(?:\.\.\.|…)\s*$",  # 以省略号结尾
+    r"已截断|truncated",
+    r"未完成|处理中|请稍后|稍后再试|not (?:yet )?(?:completed|finished|ready)",
+]
+
+# 工具结果评估设置
+ASSESSMENT_POLICY = "always"  # 评估策略: always(全部评估)/sampled(失败步骤+抽样成功步骤)/failures(仅失败步骤)/off(不评估)
+ASSESSMENT_SAMPLE_RATE = 0.3  # sampled 策略下成功步骤的抽样比例
+ASSESSMENT_TIMEOUT = 10  # 单次评估调用超时时间(秒)
+
+# ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
+# ┃                            工具执行配置                                    ┃
+# ┗━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┛
+
+# MCP服务器连接设置
+MCP_SERVER_INIT_TIMEOUT = 30  # 启动并初始化单个MCP服务器的超时时间(秒)
+MCP_LIST_TOOLS_TIMEOUT = 20  # 获取单个服务器工具列表的超时时间(秒)
+
+# 工具结果缓存设置(按 服务器+工具+参数 缓存成功结果，所有用户共享)
+TOOL_CACHE_ENABLED = True  # 是否启用工具结果缓存
+TOOL_CACHE_MAX_ENTRIES = 1000  # 最多缓存的结果数，超出后淘汰最久未使用的结果
+TOOL_CACHE_DEFAULT_TTL = 0  # 未声明缓存时间的工具默认缓存时间(秒)，0表示不缓存
+# 按工具名或服务器名设置缓存时间(秒)，优先于工具自身声明的 cacheTtl；有副作用的工具必须设置为0
+TOOL_CACHE_TTLS = {
+    "get_weather": 600,
+    "get_multi_city_weather": 600,
+    "web_search": 3600,
+    "generate_audio": 0,
+    "wechat": 0,
+}
+TOOL_CANCEL_NOTIFY_TIMEOUT = 2  # 工具调用被取消(超时或客户端断开)时，向MCP服务器发送取消通知的最长等待时间(秒)
+
+# 轮询设置(需要多次执行直到完成的步骤)
+POLLING_BACKOFF_FACTOR = 1.5  # 每次轮询后等待间隔乘以该系数(指数退避)，1表示固定间隔
+POLLING_MAX_INTERVAL = 30  # 轮询等待间隔上限(秒)
+POLLING_JITTER = 0.2  # 轮询间隔的随机抖动比例，避免大量轮询同时到期
+POLLING_TIMER_RESOLUTION = 0.1  # 共享轮询定时器的时间槽长度(秒)，同一时间槽内到期的轮询一起唤醒
+
+# 执行日志设置(每个工作流一个只追加写入的JSONL文件，中断后可以通过 plan_file 从日志恢复)
+JOURNAL_FLUSH_INTERVAL = 0.2  # 批量写入间隔(秒)
+JOURNAL_BATCH_SIZE = 64  # 待写入的记录达到该数量时立即写入
+JOURNAL_FSYNC = "batch"  # 落盘策略: always(每条记录立即写入并fsync)/batch(每批写入后fsync)/never(由操作系统决定)
+JOURNAL_RETENTION_DAYS = 7  # 执行日志保留天数，0表示不按时间清理
+JOURNAL_MAX_TOTAL_MB = 200  # 执行日志目录的总大小上限(MB)，超出时删除最旧的文件，0表示不限制
+JOURNAL_CLEANUP_INTERVAL = 3600  # 两次清理检查之间的最短间隔(秒)
 
 # ┏━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━┓
 # ┃                            音频生成配置                                    ┃
@@ -1,23 +1,26 @@
-import asyncio
-
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional, Union
-import json
 
 from starlette.responses import JSONResponse
 
 from chat_mcp.client.mcp_client import get_mcp_client, mcp_client
 from chat_mcp.utils.get_logger import get_logger
+from chat_mcp.utils.llm_client_pool import get_llm_client_metrics, close_llm_clients
+from chat_mcp.utils.metrics import get_latency_summary, get_prompt_token_summary
 from chat_mcp.utils.get_project_root import get_project_root
-from config.config import URL_PORT
+from chat_mcp.utils.sse import coalesce_events, EventStreamRegistry
+from chat_mcp.utils.stream_event import StreamEvent
+from config.config import URL_PORT, SSE_FLUSH_INTERVAL, SSE_FLUSH_BYTES
 
 app = FastAPI()
 
 logging = get_logger(service="main")
 
+event_streams = EventStreamRegistry()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -132,6 +135,87 @@ async def tool_test(tool_name: str, request: Request):
         }
 
 
+@app.get("/api/metrics/llm_clients")
+async def llm_client_metrics():
+    """获取LLM客户端连接池指标"""
+    try:
+        return {
+            "return_code": 0,
+            "return_msg": "success",
+            "metrics": get_llm_client_metrics()
+        }
+    except Exception as e:
+        logging.error(f"获取连接池指标失败: {str(e)}", exc_info=True)
+        return {
+            "return_code": -1,
+            "return_msg": f"获取连接池指标失败: {str(e)}",
+            "metrics": {}
+        }
+
+
+@app.get("/api/metrics/pipeline")
+async def pipeline_metrics():
+    """获取工作流各阶段耗时及提示词token统计"""
+    try:
+        return {
+            "return_code": 0,
+            "return_msg": "success",
+            "latency": get_latency_summary(),
+            "prompt_tokens": get_prompt_token_summary()
+        }
+    except Exception as e:
+        logging.error(f"获取工作流指标失败: {str(e)}", exc_info=True)
+        return {
+            "return_code": -1,
+            "return_msg": f"获取工作流指标失败: {str(e)}",
+            "latency": {},
+            "prompt_tokens": {}
+        }
+
+
+@app.get("/api/metrics/tool_cache")
+async def tool_cache_metrics():
+    """获取工具结果缓存命中指标"""
+    try:
+        if not mcp_client or not mcp_client.tool_executor:
+            return {
+                "return_code": -1,
+                "return_msg": "MCP客户端未初始化",
+                "metrics": {}
+            }
+
+        return {
+            "return_code": 0,
+            "return_msg": "success",
+            "metrics": mcp_client.tool_executor.get_cache_metrics()
+        }
+    except Exception as e:
+        logging.error(f"获取工具缓存指标失败: {str(e)}", exc_info=True)
+        return {
+            "return_code": -1,
+            "return_msg": f"获取工具缓存指标失败: {str(e)}",
+            "metrics": {}
+        }
+
+
+@app.get("/api/metrics/streams")
+async def stream_metrics():
+    """获取事件流及断线重连统计"""
+    try:
+        return {
+            "return_code": 0,
+            "return_msg": "success",
+            "metrics": event_streams.get_metrics()
+        }
+    except Exception as e:
+        logging.error(f"获取事件流指标失败: {str(e)}", exc_info=True)
+        return {
+            "return_code": -1,
+            "return_msg": f"获取事件流指标失败: {str(e)}",
+            "metrics": {}
+        }
+
+
 def get_base_url(provider):
     """根据provider获取API基础URL"""
     if not provider:
@@ -157,8 +241,27 @@ def get_base_url(provider):
 
 @app.post("/chat/stream")
 async def chat_stream(request: Request):
-    """使用MCP客户端流式处理聊天"""
+    """
+    使用MCP客户端流式处理聊天
+    输出带类型和ID的SSE事件，连接断开后带 Last-Event-ID 请求头重新请求，从断开处继续输出，不会重新执行
+    断开后超过 SSE_RESUME_GRACE 秒没有重新连接时，取消该请求的规划、工具调用、轮询和LLM流式输出
+    """
     try:
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id:
+            resumed = event_streams.resume(last_event_id)
+            if not resumed:
+                return JSONResponse(
+                    status_code=404,
+                    content={"error": f"事件流不存在或已过期: {last_event_id}"}
+                )
+            stream, last_seq = resumed
+            logging.info(f"事件流 {stream.stream_id} 从第 {last_seq} 个事件之后继续输出")
+            return StreamingResponse(
+                stream.subscribe(last_seq),
+                media_type="text/event-stream"
+            )
+
         data = await request.json()
         message = data.get("message", [])
         model = data.get("model", "qwen2.5")
@@ -166,6 +269,15 @@ async def chat_stream(request: Request):
         history_message = data.get("historyMessage", "")
         settings = data.get("settings", {})
         api_key = data.get("apiKey", "")
+        assessment_policy = data.get("assessmentPolicy")
+        pipeline_mode = data.get("pipelineMode")
+        engine = data.get("engine")
+        use_cache = data.get("useCache", True) is not False
+        final_check_mode = data.get("finalCheckMode")
+        request_timeout = data.get("requestTimeout")
+        request_timeout = float(request_timeout) if request_timeout else None
+        flush_interval = float(data.get("sseFlushInterval", SSE_FLUSH_INTERVAL))
+        flush_bytes = int(data.get("sseFlushBytes", SSE_FLUSH_BYTES))
 
         system_prompt = settings.get("systemPrompt", "你是一个助人为乐的助手")
         temperature = float(settings.get("temperature", 0.7))
@@ -206,45 +318,35 @@ async def chat_stream(request: Request):
 
         mcp_client = get_mcp_client()
 
-        async def stream_response():
-            try:
-                if not mcp_client.tool_manager or not mcp_client.tool_manager.all_tools:
-                    await mcp_client.initialize()
-                    logging.info("已初始化MCP客户端")
-
-                logging.info(f"开始处理查询:{message} - model: {model}, base_url: {base_url}, LLM服务商: {provider}")
-                async for chunk in mcp_client.process_query_stream(
-                        user_query=message,
-                        system_prompt=system_prompt,
-                        api_key=api_key,
-                        base_url=base_url,
-                        model=model,
-                        temperature=temperature,
-                        history_message=history_message
-                ):
-                    content = ""
-                    if hasattr(chunk, 'choices') and chunk.choices:
-                        choice = chunk.choices[0]
-                        if hasattr(choice, 'delta') and hasattr(choice.delta, 'content'):
-                            content = choice.delta.content or ""
-                    elif isinstance(chunk, str):
-                        content = chunk
-                    else:
-                        try:
-                            content = str(chunk)
-                        except:
-                            content = ""
-                    
-                    yield f"data: {json.dumps({'content': content})}\n\n"
-                    await asyncio.sleep(0.02)
-
-            except Exception as e:
-                error_msg = f"处理流式响应出错: {str(e)}"
-                logging.error(error_msg, exc_info=True)
-                yield f"data: {json.dumps({'content': error_msg})}\n\n"
+        async def generate_events():
+            if not mcp_client.tool_manager or not mcp_client.tool_manager.all_tools:
+                await mcp_client.initialize()
+                logging.info("已初始化MCP客户端")
+
+            logging.info(f"开始处理查询:{message} - model: {model}, base_url: {base_url}, LLM服务商: {provider}")
+            async for chunk in mcp_client.process_query_stream(
+                    user_query=message,
+                    system_prompt=system_prompt,
+                    api_key=api_key,
+                    base_url=base_url,
+                    model=model,
+                    temperature=temperature,
+                    history_message=history_message,
+                    assessment_policy=assessment_policy,
+                    pipeline_mode=pipeline_mode,
+                    engine=engine,
+                    use_cache=use_cache,
+                    final_check_mode=final_check_mode,
+                    request_timeout=request_timeout
+            ):
+                yield StreamEvent.from_chunk(chunk)
+
+        # 工作流在后台执行，事件按时间窗口和字节数合并后写入回放缓冲区，与当前连接无关
+        stream = event_streams.create()
+        stream.start(coalesce_events(generate_events(), flush_interval, flush_bytes))
 
         return StreamingResponse(
-            stream_response(),
+            stream.subscribe(),
             media_type="text/event-stream"
         )
     except Exception as e:
@@ -260,6 +362,7 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     await mcp_client.cleanup()
+    close_llm_clients()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+import asyncio
+import math
+
+from chat_mcp.utils.deadline import Deadline
+from config.config import DEADLINE_ANSWER_RESERVE, DEADLINE_ANSWER_RESERVE_RATIO, REQUEST_TIMEOUT
+
+
+def test_answer_reserve_capped_for_large_budget():
+    assert Deadline(300).answer_reserve == DEADLINE_ANSWER_RESERVE
+
+
+def test_answer_reserve_scales_with_small_budget():
+    for timeout in (1, 5, 10, 15):
+        deadline = Deadline(timeout)
+        assert deadline.answer_reserve == timeout * DEADLINE_ANSWER_RESERVE_RATIO
+        assert deadline.budget(reserve=deadline.answer_reserve) > 0
+
+
+def test_small_budget_leaves_time_for_routing():
+    deadline = Deadline(10)
+
+    async def route():
+        await asyncio.sleep(0.05)
+        return True
+
+    assert asyncio.run(deadline.within(route(), reserve=deadline.answer_reserve)) is True
+
+
+def test_default_budget_does_not_limit_answer():
+    deadline = Deadline.from_request(None)
+    assert deadline.timeout == REQUEST_TIMEOUT
+    assert not deadline.requested
+    assert math.isinf(deadline.for_answer().remaining())
+
+
+def test_requested_budget_limits_answer():
+    deadline = Deadline.from_request(5)
+    assert deadline.requested
+    assert deadline.for_answer() is deadline
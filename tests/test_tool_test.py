@@ -0,0 +1,69 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from chat_mcp.client import mcp_client as mcp_client_module
+from chat_mcp.client.mcp_client import MCPClient
+from chat_mcp.client.tool_result import ToolResult
+
+TOOL = {"name": "echo", "description": "回显参数", "input_schema": {"type": "object"}}
+
+
+class FakeToolManager:
+    all_tools = [TOOL]
+
+    def convert_tool(self, tool):
+        return {"type": "function", "function": {"name": tool["name"], "parameters": tool["input_schema"]}}
+
+
+class FakeToolExecutor:
+    def __init__(self, result: ToolResult):
+        self.result = result
+        self.calls = []
+
+    async def execute_tool(self, tool, tool_name, tool_args, use_cache=True):
+        self.calls.append((tool_name, tool_args, use_cache))
+        return self.result
+
+
+def _completion(tool_name: str, arguments: dict):
+    tool_call = SimpleNamespace(function=SimpleNamespace(name=tool_name, arguments=json.dumps(arguments)))
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=None, tool_calls=[tool_call]))])
+
+
+def _make_client(tmp_path, monkeypatch, result: ToolResult):
+    """真实地创建LLM客户端，只替换模型调用，确保 tool_test 依赖的名称都能解析"""
+    requests = []
+
+    async def fake_create_completion(llm_client, logger, model, **kwargs):
+        requests.append(llm_client)
+        return _completion("echo", {"text": "hi"})
+
+    monkeypatch.setattr(mcp_client_module, "create_completion", fake_create_completion)
+    client = MCPClient("servers_config.json", log_dir=str(tmp_path))
+    client.tool_manager = FakeToolManager()
+    client.tool_executor = FakeToolExecutor(result)
+    return client, requests
+
+
+def test_tool_test_runs_tool(tmp_path, monkeypatch):
+    client, requests = _make_client(tmp_path, monkeypatch, ToolResult("echo", ["hi"]))
+    result = asyncio.run(client.tool_test("echo", api_key="test", base_url="http://localhost:11434/v1/", model="m", text="hi"))
+
+    assert result == "hi"
+    assert len(requests) == 1
+    assert client.tool_executor.calls == [("echo", {"text": "hi"}, False)]
+
+
+def test_tool_test_reports_tool_error(tmp_path, monkeypatch):
+    client, _ = _make_client(tmp_path, monkeypatch, ToolResult("echo", ["boom"], is_error=True))
+    result = asyncio.run(client.tool_test("echo", api_key="test", base_url="http://localhost:11434/v1/", model="m"))
+
+    assert result.startswith("测试失败:")
+
+
+def test_tool_test_unknown_tool(tmp_path, monkeypatch):
+    client, _ = _make_client(tmp_path, monkeypatch, ToolResult("echo", ["hi"]))
+    result = asyncio.run(client.tool_test("missing", api_key="test", base_url=None, model="m"))
+
+    assert result == "未找到工具: missing"